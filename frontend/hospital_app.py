@@ -47,6 +47,9 @@ if 'token' not in st.session_state:
     st.session_state.token = None
 if 'user' not in st.session_state:
     st.session_state.user = None
+if 'etag_cache' not in st.session_state:
+    # (token, url) -> last 200 response with an ETag, replayed when the API answers 304
+    st.session_state.etag_cache = {}
 
 def safe_json_parse(response):
     """Safely parse JSON response"""
@@ -72,7 +75,15 @@ def make_api_request(endpoint, method='GET', data=None, auth_required=True):
     
     try:
         if method == 'GET':
+            cache_key = (st.session_state.token, url)
+            cached = st.session_state.etag_cache.get(cache_key)
+            if cached is not None:
+                headers['If-None-Match'] = cached.headers['ETag']
             response = requests.get(url, headers=headers)
+            if response.status_code == 304 and cached is not None:
+                response = cached
+            elif response.status_code == 200 and response.headers.get('ETag'):
+                st.session_state.etag_cache[cache_key] = response
         elif method == 'POST':
             response = requests.post(url, headers=headers, json=data)
         elif method == 'PUT':
@@ -152,6 +163,7 @@ def main_dashboard():
         
         if st.button("Logout"):
             st.session_state.token = None
+            st.session_state.etag_cache = {}
             st.session_state.user = None
             st.rerun()
         
@@ -233,33 +245,37 @@ def dashboard_overview():
                 st.rerun()
                 
     else:
-        # Doctor/Admin dashboard - show full overview
-        patients_response = make_api_request('/patients/')
-        appointments_response = make_api_request('/scheduling/appointments/')
+        # Doctor/Admin dashboard - all counters come from one aggregated request
+        stats_response = make_api_request('/scheduling/stats/')
+        stats = safe_json_parse(stats_response) if stats_response and stats_response.status_code == 200 else None
+        totals = stats.get('totals', {}) if stats else {}
         
         col1, col2, col3, col4 = st.columns(4)
         
         with col1:
-            if patients_response and patients_response.status_code == 200:
-                patients_data = safe_json_parse(patients_response)
-                patients_count = len(patients_data.get('results', [])) if patients_data else 0
-            else:
-                patients_count = 0
-            st.metric("Total Patients", patients_count)
+            st.metric("Total Patients", totals.get('patients', 0))
         
         with col2:
-            if appointments_response and appointments_response.status_code == 200:
-                appointments_data = safe_json_parse(appointments_response)
-                appointments_count = len(appointments_data.get('results', [])) if appointments_data else 0
-            else:
-                appointments_count = 0
-            st.metric("Total Appointments", appointments_count)
+            st.metric("Total Appointments", totals.get('appointments', 0))
         
         with col3:
-            st.metric("Active Users", "TBD")
+            st.metric("Active Users", totals.get('active_users', 0))
         
         with col4:
-            st.metric("Today's Appointments", "TBD")
+            st.metric("Today's Appointments", totals.get('appointments_today', 0))
+        
+        if stats and stats.get('per_day'):
+            st.subheader("📈 Appointments This Week")
+            per_day_df = pd.DataFrame(stats['per_day'])
+            fig = px.bar(per_day_df, x='date', y=['SCHEDULED', 'COMPLETED', 'CANCELLED'],
+                         labels={'value': 'Appointments', 'variable': 'Status'})
+            st.plotly_chart(fig, use_container_width=True)
+        
+        if stats and stats.get('per_doctor'):
+            st.subheader("👨‍⚕️ Appointments per Doctor")
+            st.dataframe(pd.DataFrame(stats['per_doctor']), use_container_width=True)
+        
+        appointments_response = make_api_request('/scheduling/appointments/?pagination=cursor&order=desc')
         
         # Recent activity
         st.subheader("📅 Recent Appointments")
@@ -481,39 +497,53 @@ def appointments_page():
                 doctors_list = doctors_data.get('results', []) if doctors_data else []
                 
                 if doctors_list:
+                    st.info("📝 You are scheduling an appointment for yourself")
+                    
+                    # Doctor, day and duration decide which slots are offered
+                    doctor_options = {f"Dr. {d['first_name']} {d['last_name']} (ID: {d['id']})": d['id'] 
+                                    for d in doctors_list}
+                    selected_doctor = st.selectbox("Select Doctor*", list(doctor_options.keys()))
+                    
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        appointment_date = st.date_input("Appointment Date*")
+                    with col2:
+                        duration = st.selectbox("Duration (minutes)", [30, 45, 60, 90, 120], index=1)
+                    
+                    # Ask the backend for free slots instead of guessing a start time
+                    next_date = appointment_date + timedelta(days=1)
+                    availability_response = make_api_request(
+                        f"/scheduling/doctors/{doctor_options[selected_doctor]}/availability/"
+                        f"?from={appointment_date.isoformat()}&to={next_date.isoformat()}&duration={duration}"
+                    )
+                    slots = []
+                    if availability_response and availability_response.status_code == 200:
+                        availability_data = safe_json_parse(availability_response)
+                        slots = availability_data.get('slots', []) if availability_data else []
+                    
+                    if not slots:
+                        st.warning("No free slots for this doctor on the selected day.")
+                        return
+                    
                     with st.form("schedule_appointment_form"):
-                        st.info("📝 You are scheduling an appointment for yourself")
-                        
-                        # Doctor selection
-                        doctor_options = {f"Dr. {d['first_name']} {d['last_name']} (ID: {d['id']})": d['id'] 
-                                        for d in doctors_list}
-                        selected_doctor = st.selectbox("Select Doctor*", list(doctor_options.keys()))
-                        
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            appointment_date = st.date_input("Appointment Date*")
-                            start_time = st.time_input("Start Time*", value=datetime.strptime("09:00", "%H:%M").time())
-                        
-                        with col2:
-                            duration = st.selectbox("Duration (minutes)", [30, 45, 60, 90, 120], index=1)
-                            status = st.selectbox("Status", ["SCHEDULED", "COMPLETED", "CANCELLED"])
+                        slot_options = {
+                            f"{slot['start_time'][11:16]} - {slot['end_time'][11:16]}": slot
+                            for slot in slots
+                        }
+                        selected_slot = st.selectbox("Available Slot*", list(slot_options.keys()))
                         
                         notes = st.text_area("Notes")
                         
                         submit_appointment = st.form_submit_button("Schedule Appointment")
                         
                         if submit_appointment:
-                            if selected_doctor and appointment_date and start_time:
-                                # Combine date and time for start_time
-                                start_datetime = datetime.combine(appointment_date, start_time)
-                                # Calculate end_time
-                                end_datetime = start_datetime + timedelta(minutes=duration)
-                                
+                            if selected_doctor and selected_slot:
+                                slot = slot_options[selected_slot]
                                 appointment_data = {
                                     'doctor': doctor_options[selected_doctor],
-                                    'start_time': start_datetime.isoformat(),
-                                    'end_time': end_datetime.isoformat(),
-                                    'status': status,
+                                    'start_time': slot['start_time'],
+                                    'end_time': slot['end_time'],
+                                    'status': 'SCHEDULED',
                                     'notes': notes or ''
                                 }
                                 
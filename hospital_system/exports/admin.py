@@ -0,0 +1,7 @@
+from django.contrib import admin
+from .models import ExportJob
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'since', 'until', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('status',)
@@ -0,0 +1,117 @@
+import gzip
+import json
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from django.utils import timezone
+from patients.models import MedicalRecord, Patient
+from scheduling.models import Appointment
+from .models import ExportJob
+
+CHUNK_SIZE = 2000
+
+# name -> (model, exported fields, timestamp compared with since/until)
+DATASETS = {
+    'patients': (
+        Patient,
+        ('user_id', 'user__username', 'user__first_name', 'user__last_name', 'user__email',
+         'date_of_birth', 'address', 'phone_number', 'updated_at'),
+        'updated_at',
+    ),
+    'appointments': (
+        Appointment,
+        ('id', 'patient_id', 'doctor_id', 'start_time', 'end_time', 'status', 'notes', 'series_id', 'updated_at'),
+        'updated_at',
+    ),
+    'medical_records': (
+        MedicalRecord,
+        ('id', 'patient_id', 'created_by_id', 'visit_date', 'diagnosis', 'treatment', 'notes', 'updated_at'),
+        'updated_at',
+    ),
+}
+
+
+def job_directory(job):
+    return os.path.join(settings.EXPORT_ROOT, str(job.pk))
+
+
+def export_rows(name, since, until):
+    model, fields, timestamp = DATASETS[name]
+    condition = Q(**{f'{timestamp}__lt': until})
+    if since is not None:
+        condition &= Q(**{f'{timestamp}__gte': since})
+    return model.objects.filter(condition).order_by('pk').values(*fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def write_dataset(job, name):
+    """
+    Write one data set as gzipped NDJSON, a chunk of rows per write, into a
+    temporary file that is renamed once complete. Returns the row count.
+    """
+    path = os.path.join(job_directory(job), f'{name}.ndjson.gz')
+    # One temporary file per attempt, so a presumed dead worker that is still writing can't mix into it
+    part = f'{path}.{job.attempts}.part'
+    count = 0
+    chunk = []
+    with gzip.open(part, 'wt', encoding='utf-8') as f:
+        for row in export_rows(name, job.since, job.until):
+            chunk.append(json.dumps(row, cls=DjangoJSONEncoder))
+            if len(chunk) == CHUNK_SIZE:
+                f.write('\n'.join(chunk) + '\n')
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            f.write('\n'.join(chunk) + '\n')
+            count += len(chunk)
+    os.replace(part, path)
+    return count
+
+
+def run_export(job_id):
+    """
+    Run a pending export job. The PENDING -> RUNNING update makes sure a job
+    delivered twice by the broker is only worked on once, and every later write
+    is conditional on this run's started_at, so a run that was given up on by
+    requeue_stale_jobs can no longer change the job.
+    """
+    claimed = ExportJob.objects.filter(pk=job_id, status=ExportJob.Status.PENDING).update(
+        status=ExportJob.Status.RUNNING, started_at=timezone.now(), attempts=F('attempts') + 1
+    )
+    if not claimed:
+        return
+    job = ExportJob.objects.get(pk=job_id)
+    this_run = ExportJob.objects.filter(pk=job.pk, status=ExportJob.Status.RUNNING, started_at=job.started_at)
+    os.makedirs(job_directory(job), exist_ok=True)
+
+    try:
+        for name in job.datasets:
+            rows = write_dataset(job, name)
+            job.files[name] = {'file': f'{name}.ndjson.gz', 'rows': rows}
+            # Progress is visible to pollers after every data set
+            if not this_run.update(files=job.files):
+                return
+    except Exception as e:
+        this_run.update(status=ExportJob.Status.FAILED, error=str(e), finished_at=timezone.now())
+        raise
+
+    this_run.update(status=ExportJob.Status.COMPLETED, finished_at=timezone.now())
+
+
+def requeue_stale_jobs():
+    """
+    Jobs RUNNING for more than EXPORT_JOB_TIMEOUT seconds are taken to have lost
+    their worker: they go back to PENDING, or to FAILED once they have been
+    started EXPORT_JOB_MAX_ATTEMPTS times. Returns the ids of the requeued jobs.
+    """
+    now = timezone.now()
+    stale = ExportJob.objects.filter(
+        status=ExportJob.Status.RUNNING, started_at__lt=now - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    )
+    stale.filter(attempts__gte=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+        status=ExportJob.Status.FAILED, error="The export worker stopped before finishing.", finished_at=now
+    )
+    job_ids = list(stale.values_list('pk', flat=True))
+    stale.filter(pk__in=job_ids).update(status=ExportJob.Status.PENDING, started_at=None, files={})
+    return job_ids
@@ -0,0 +1,39 @@
+from django.db import models
+from django.conf import settings
+
+
+class ExportJob(models.Model):
+    """
+    A bulk dump of patients, appointments and medical records, one gzipped
+    NDJSON file per model, written by a background worker.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', 'Pending'
+        RUNNING = 'RUNNING', 'Running'
+        COMPLETED = 'COMPLETED', 'Completed'
+        FAILED = 'FAILED', 'Failed'
+
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='export_jobs'
+    )
+    datasets = models.JSONField(default=list, help_text="Names of the exported data sets")
+    since = models.DateTimeField(null=True, blank=True, help_text="Only rows changed from this moment on")
+    # Rows changed after the job was created belong to the next incremental export
+    until = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    files = models.JSONField(default=dict, blank=True, help_text="Data set name -> file name and row count")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Runs started so far; a job whose worker died is started again up to EXPORT_JOB_MAX_ATTEMPTS times
+    attempts = models.PositiveSmallIntegerField(default=0)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Export {self.pk} ({self.status})"
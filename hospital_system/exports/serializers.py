@@ -0,0 +1,38 @@
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import serializers
+from .exporter import DATASETS
+from .models import ExportJob
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    datasets = serializers.ListField(
+        child=serializers.ChoiceField(choices=sorted(DATASETS)), required=False, allow_empty=False
+    )
+    # The until of the previous job, for an incremental export
+    _since = serializers.DateTimeField(source='since', required=False, allow_null=True)
+    downloads = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExportJob
+        fields = (
+            'id', 'status', 'datasets', '_since', 'until', 'files', 'downloads', 'error',
+            'created_at', 'started_at', 'finished_at', 'attempts'
+        )
+        read_only_fields = ['status', 'until', 'files', 'error', 'created_at', 'started_at', 'finished_at', 'attempts']
+
+    def validate(self, data):
+        data['datasets'] = [name for name in DATASETS if name in data.get('datasets', DATASETS)]
+        if data.get('since') and data['since'] > timezone.now():
+            raise serializers.ValidationError({'_since': "Must not be in the future."})
+        return data
+
+    def get_downloads(self, job):
+        if job.status != ExportJob.Status.COMPLETED:
+            return {}
+        request = self.context.get('request')
+        downloads = {}
+        for name in job.files:
+            url = reverse('export-download', kwargs={'pk': job.pk, 'dataset': name})
+            downloads[name] = request.build_absolute_uri(url) if request else url
+        return downloads
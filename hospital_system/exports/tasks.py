@@ -0,0 +1,13 @@
+from celery import shared_task
+from .exporter import requeue_stale_jobs, run_export
+
+
+@shared_task
+def run_export_job(job_id):
+    run_export(job_id)
+
+
+@shared_task
+def requeue_stale_exports():
+    for job_id in requeue_stale_jobs():
+        run_export_job.delay(job_id)
@@ -0,0 +1,115 @@
+import gzip
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from patients.models import MedicalRecord, Patient
+from scheduling.models import Appointment
+from users.models import CustomUser
+from .exporter import run_export
+from .models import ExportJob
+from .tasks import requeue_stale_exports
+
+
+class ExportJobAPITest(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(EXPORT_ROOT=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = CustomUser.objects.create_user(username='testadmin', role='ADMIN')
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', role='DOCTOR')
+        user = CustomUser.objects.create_user(username='testpatient', first_name='Jane', last_name='Roe')
+        self.patient = Patient.objects.create(
+            user=user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        start = timezone.now() + timedelta(days=1)
+        for i in range(3):
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor,
+                start_time=start + timedelta(hours=i), end_time=start + timedelta(hours=i, minutes=30)
+            )
+            MedicalRecord.objects.create(patient=self.patient, created_by=self.doctor, diagnosis=f'Visit {i}', treatment='Rest')
+        self.client.force_authenticate(user=self.admin)
+
+    def start_export(self, **data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('export-list-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return self.client.get(reverse('export-detail', args=[response.data['id']])).data
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_full_export(self):
+        job = self.start_export()
+
+        self.assertEqual(job['status'], 'COMPLETED')
+        self.assertEqual({name: entry['rows'] for name, entry in job['files'].items()},
+                         {'patients': 1, 'appointments': 3, 'medical_records': 3})
+        patients = self.download(job['downloads']['patients'])
+        self.assertEqual(patients[0]['user__first_name'], 'Jane')
+        records = self.download(job['downloads']['medical_records'])
+        self.assertEqual([row['diagnosis'] for row in records], ['Visit 0', 'Visit 1', 'Visit 2'])
+
+    def test_incremental_export_from_the_previous_until(self):
+        first = self.start_export(datasets=['appointments'])
+        Appointment.objects.filter(pk=Appointment.objects.order_by('pk').first().pk).update(
+            status='CANCELLED', updated_at=timezone.now()
+        )
+
+        second = self.start_export(datasets=['appointments'], _since=first['until'])
+
+        self.assertEqual(list(second['files']), ['appointments'])
+        rows = self.download(second['downloads']['appointments'])
+        self.assertEqual([row['status'] for row in rows], ['CANCELLED'])
+
+    def test_admins_only(self):
+        self.client.force_authenticate(user=self.doctor)
+        response = self.client.post(reverse('export-list-create'), {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_stale_running_jobs_are_started_again_then_failed(self):
+        job = self.start_export(datasets=['patients'])
+        long_ago = timezone.now() - timedelta(seconds=2 * settings.EXPORT_JOB_TIMEOUT)
+        # A worker that died right after claiming the job
+        ExportJob.objects.filter(pk=job['id']).update(status='RUNNING', started_at=long_ago, files={})
+
+        requeue_stale_exports()
+
+        requeued = ExportJob.objects.get(pk=job['id'])
+        self.assertEqual(requeued.status, 'COMPLETED')
+        self.assertEqual(requeued.attempts, 2)
+        self.assertEqual(requeued.files['patients']['rows'], 1)
+
+        ExportJob.objects.filter(pk=job['id']).update(
+            status='RUNNING', started_at=long_ago, attempts=settings.EXPORT_JOB_MAX_ATTEMPTS
+        )
+        requeue_stale_exports()
+        self.assertEqual(ExportJob.objects.get(pk=job['id']).status, 'FAILED')
+
+    def test_a_run_given_up_on_no_longer_changes_the_job(self):
+        job = ExportJob.objects.create(datasets=['patients'], until=timezone.now())
+
+        def requeue_meanwhile(job, name):
+            ExportJob.objects.filter(pk=job.pk).update(status='PENDING', started_at=None)
+            return 0
+
+        with mock.patch('exports.exporter.write_dataset', requeue_meanwhile):
+            run_export(job.pk)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'PENDING')
+        self.assertEqual(job.files, {})
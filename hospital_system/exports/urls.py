@@ -0,0 +1,8 @@
+from django.urls import path
+from .views import ExportDownloadView, ExportJobDetailView, ExportJobListCreateView
+
+urlpatterns = [
+    path('', ExportJobListCreateView.as_view(), name='export-list-create'),
+    path('<int:pk>/', ExportJobDetailView.as_view(), name='export-detail'),
+    path('<int:pk>/<str:dataset>/', ExportDownloadView.as_view(), name='export-download'),
+]
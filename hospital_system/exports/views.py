@@ -0,0 +1,52 @@
+import os
+from django.db import transaction
+from django.http import FileResponse, Http404
+from django.utils import timezone
+from rest_framework import generics, permissions
+from .exporter import job_directory
+from .models import ExportJob
+from .permissions import IsAdmin
+from .serializers import ExportJobSerializer
+from .tasks import run_export_job
+
+
+class ExportJobListCreateView(generics.ListCreateAPIView):
+    """
+    POST starts an export in the background worker and returns at once with the
+    job; poll the job until it is COMPLETED, then follow its download links.
+    """
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def perform_create(self, serializer):
+        job = serializer.save(requested_by=self.request.user, until=timezone.now())
+        transaction.on_commit(lambda: run_export_job.delay(job.pk))
+
+
+class ExportJobDetailView(generics.RetrieveDestroyAPIView):
+    queryset = ExportJob.objects.all()
+    serializer_class = ExportJobSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def perform_destroy(self, instance):
+        for entry in instance.files.values():
+            path = os.path.join(job_directory(instance), entry['file'])
+            if os.path.exists(path):
+                os.remove(path)
+        instance.delete()
+
+
+class ExportDownloadView(generics.GenericAPIView):
+    queryset = ExportJob.objects.filter(status=ExportJob.Status.COMPLETED)
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request, pk, dataset):
+        job = self.get_object()
+        if dataset not in job.files:
+            raise Http404
+        path = os.path.join(job_directory(job), job.files[dataset]['file'])
+        if not os.path.exists(path):
+            raise Http404
+        # FileResponse streams the file in blocks rather than reading it into memory
+        return FileResponse(open(path, 'rb'), as_attachment=True, content_type='application/gzip')
@@ -1,25 +1,30 @@
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework import status
-from django.contrib.auth import authenticate
+from django.contrib.auth import authenticate, get_user_model
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
+from users.models import AuthToken
+from users.throttling import LoginRateThrottle, RoleRateThrottle
 
 
 class CustomAuthToken(ObtainAuthToken):
     """
     Custom view for obtaining an authentication token with additional user information.
     """
+    throttle_classes = [RoleRateThrottle, LoginRateThrottle]
+
     def post(self, request, *args, **kwargs):
         serializer = self.serializer_class(data=request.data,
                                            context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
+        # Every login gets a fresh token; earlier ones expire once they fall out of use
+        token = AuthToken.issue(user)
         
         return Response({
             'token': token.key,
+            'expires_at': token.expires_at,
             'user_id': user.pk,
             'username': user.username,
             'email': user.email,
@@ -53,12 +58,25 @@ def logout_view(request):
         }, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+def rotate_token_view(request):
+    """
+    Swap the token the request was made with for a new one, e.g. before it
+    reaches its maximum age. The old token stops working at once.
+    """
+    token = AuthToken.issue(request.user)
+    if request.auth is not None:
+        request.auth.delete()
+    return Response({'token': token.key, 'expires_at': token.expires_at})
+
+
 @api_view(['GET'])
 def user_profile(request):
     """
     Get user profile information
     """
-    user = request.user
+    # Token authentication only loads the user's id and role
+    user = get_user_model().objects.get(pk=request.user.pk)
     return Response({
         'user_id': user.pk,
         'username': user.username,
@@ -0,0 +1,22 @@
+"""
+Celery application for background jobs of the hospital_system project.
+
+Workers are started with:
+    celery -A hospital_system worker -B -l info
+
+-B also runs the periodic jobs in CELERY_BEAT_SCHEDULE.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_system.settings')
+
+app = Celery('hospital_system')
+
+# All CELERY_* settings in settings.py configure the app
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Picks up tasks.py from every installed app
+app.autodiscover_tasks()
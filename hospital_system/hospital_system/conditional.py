@@ -0,0 +1,63 @@
+import hashlib
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def make_etag(salt, count, last_modified):
+    raw = f"{salt}|{count}|{last_modified.isoformat() if last_modified else ''}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def fingerprint(queryset, salt=''):
+    """
+    (etag, last_modified) of a set of rows from one aggregate query, so an
+    unchanged resource can be answered with 304 without reading the rows themselves.
+    The count catches deletions, which leave MAX(updated_at) alone.
+    """
+    probe = queryset.order_by().aggregate(count=Count('pk'), last_modified=Max('updated_at'))
+    return make_etag(salt, probe['count'], probe['last_modified']), probe['last_modified']
+
+
+def not_modified_response(request, etag, last_modified):
+    # HTTP dates have whole seconds; the ETag still tells apart changes within one second
+    last_modified_ts = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request, etag=f'"{etag}"', last_modified=last_modified_ts)
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = f'"{etag}"'
+    if last_modified:
+        response['Last-Modified'] = http_date(int(last_modified.timestamp()))
+    # Browsers and proxies must ask again every time, but may reuse the body on 304
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified for the list and retrieve actions of a viewset whose model
+    has an updated_at column. An unchanged resource is answered with 304 from a
+    COUNT/MAX(updated_at) probe over exactly the rows the view would return,
+    before anything is serialized.
+    """
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # The page and filters are part of the resource
+        etag, last_modified = fingerprint(queryset, salt=f'{request.user.pk}|{request.get_full_path()}')
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(super().list(request, *args, **kwargs), etag, last_modified)
+
+    def retrieve(self, request, *args, **kwargs):
+        # get_object runs the permission checks, so a 304 never reveals more than a 200 would;
+        # the row it loads carries its own validator
+        instance = self.get_object()
+        last_modified = instance.updated_at
+        etag = make_etag(request.get_full_path(), 1, last_modified)
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+        return set_validators(Response(self.get_serializer(instance).data), etag, last_modified)
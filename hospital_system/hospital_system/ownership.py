@@ -0,0 +1,25 @@
+"""
+Authorization answered from the foreign key ids already on a row. A patient
+profile's primary key is its user's id, so `patient_id == user.pk` says the same
+as `patient.user == user` without loading either object.
+"""
+
+
+def owns(user, obj, field='patient'):
+    return getattr(obj, f'{field}_id') == user.pk
+
+
+def scope_by_role(queryset, user, patient_field='patient', doctor_field=None):
+    """
+    The rows of queryset the user may see, filtered on the id columns: staff and
+    admins all, patients their own, doctors the ones whose doctor_field is them
+    (all of them when there is none), anyone else nothing.
+    """
+    # Superusers keep the default PATIENT role, so staff goes before the role
+    if user.is_staff or user.role == 'ADMIN':
+        return queryset
+    elif user.role == 'PATIENT':
+        return queryset.filter(**{f'{patient_field}_id': user.pk})
+    elif user.role == 'DOCTOR':
+        return queryset.filter(**{f'{doctor_field}_id': user.pk}) if doctor_field else queryset
+    return queryset.none()
@@ -43,17 +43,19 @@ INSTALLED_APPS = [
     'patients', 
     'scheduling',
     'users',
+    'exports',
 
     # Third party apps
     'rest_framework',  
     'django_filters',
+    # Only for users' migration 0002, which copies its tokens into users.AuthToken
     'rest_framework.authtoken',
     'corsheaders',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -63,7 +65,22 @@ REST_FRAMEWORK = {
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 20
+    'PAGE_SIZE': 20,
+    # nginx appends the client address to X-Forwarded-For; throttles read that entry
+    # rather than anything the client sent itself. 0 when Django is reached directly.
+    'NUM_PROXIES': config('NUM_PROXIES', default=1, cast=int),
+    # Token buckets (see users.throttling): each rate is also the largest burst
+    'DEFAULT_THROTTLE_CLASSES': [
+        'users.throttling.RoleRateThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'anon': config('THROTTLE_ANON', default='300/min'),
+        'patient': config('THROTTLE_PATIENT', default='300/min'),
+        'doctor': config('THROTTLE_DOCTOR', default='1200/min'),
+        'admin': config('THROTTLE_ADMIN', default='2400/min'),
+        'login': config('THROTTLE_LOGIN', default='10/min'),
+        'login_address': config('THROTTLE_LOGIN_ADDRESS', default='120/min'),
+    },
 }
 
 MIDDLEWARE = [
@@ -108,6 +125,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file-backed test database lets concurrent tests use real SQLite locking
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -115,6 +134,10 @@ DATABASES = {
 if config('DATABASE_URL', default=None):
     DATABASES['default'] = dj_database_url.parse(config('DATABASE_URL'))
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    # Trigram lookups used by the patient search
+    INSTALLED_APPS.append('django.contrib.postgres')
+
 # Alternative manual PostgreSQL configuration:
 # DATABASES = {
 #     'default': {
@@ -128,6 +151,63 @@ if config('DATABASE_URL', default=None):
 # }
 
 
+# Cache
+# Redis is shared by every gunicorn worker; without REDIS_URL each process keeps its own memory cache
+
+if config('REDIS_URL', default=None):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': config('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Celery
+# Background jobs go through Redis when a broker is configured; without one they run inline,
+# so an export is then written inside the request that starts it (development only)
+
+CELERY_BROKER_URL = config('CELERY_BROKER_URL', default=config('REDIS_URL', default=''))
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TIMEZONE = 'UTC'
+# Run by the worker's embedded beat (celery worker -B)
+CELERY_BEAT_SCHEDULE = {
+    'sweep-expired-tokens': {
+        'task': 'users.tasks.sweep_expired_tokens',
+        'schedule': config('TOKEN_SWEEP_INTERVAL', default=900, cast=int),
+    },
+    'requeue-stale-exports': {
+        'task': 'exports.tasks.requeue_stale_exports',
+        'schedule': config('EXPORT_REQUEUE_INTERVAL', default=300, cast=int),
+    },
+}
+
+# Seconds the dashboard statistics stay cached
+DASHBOARD_STATS_TTL = config('DASHBOARD_STATS_TTL', default=60, cast=int)
+
+# Seconds a page of a patient timeline stays cached; saves invalidate it sooner
+TIMELINE_CACHE_TTL = config('TIMELINE_CACHE_TTL', default=300, cast=int)
+
+# Token authentication claims: each process keeps up to TOKEN_CACHE_SIZE tokens for
+# TOKEN_CACHE_LOCAL_TTL seconds (also how long a logout on another process can take
+# to be seen here), the shared cache keeps them for TOKEN_CACHE_TTL seconds
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', default=10000, cast=int)
+TOKEN_CACHE_LOCAL_TTL = config('TOKEN_CACHE_LOCAL_TTL', default=10, cast=int)
+TOKEN_CACHE_TTL = config('TOKEN_CACHE_TTL', default=300, cast=int)
+
+# API tokens expire TOKEN_TTL seconds after their last use and TOKEN_MAX_AGE seconds
+# after they were issued. Use renews a token at most every TOKEN_RENEW_INTERVAL seconds.
+TOKEN_TTL = config('TOKEN_TTL', default=24 * 3600, cast=int)
+TOKEN_MAX_AGE = config('TOKEN_MAX_AGE', default=30 * 24 * 3600, cast=int)
+TOKEN_RENEW_INTERVAL = config('TOKEN_RENEW_INTERVAL', default=3600, cast=int)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -169,6 +249,20 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Bulk exports hold patient data, so they live outside MEDIA_ROOT and are only served through the API
+EXPORT_ROOT = config('EXPORT_ROOT', default=str(BASE_DIR / 'exports_data'))
+# An export still RUNNING after EXPORT_JOB_TIMEOUT seconds has lost its worker and is
+# started again, at most EXPORT_JOB_MAX_ATTEMPTS times in all; keep it above the longest export
+EXPORT_JOB_TIMEOUT = config('EXPORT_JOB_TIMEOUT', default=3600, cast=int)
+EXPORT_JOB_MAX_ATTEMPTS = config('EXPORT_JOB_MAX_ATTEMPTS', default=3, cast=int)
+
+# Medical record attachments, likewise kept out of MEDIA_ROOT
+ATTACHMENT_ROOT = config('ATTACHMENT_ROOT', default=str(BASE_DIR / 'attachments_data'))
+ATTACHMENT_MAX_SIZE = config('ATTACHMENT_MAX_SIZE', default=2 * 1024 ** 3, cast=int)
+# The nginx "internal" location mapped onto ATTACHMENT_ROOT. When set, downloads are
+# handed to nginx with X-Accel-Redirect; without it Django serves them itself (development).
+ATTACHMENT_ACCEL_PREFIX = config('ATTACHMENT_ACCEL_PREFIX', default='')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -24,12 +24,14 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
+    # Only for users' migration 0002, which copies its tokens into users.AuthToken
     'rest_framework.authtoken',
     'corsheaders',
     'django_filters',
     'users',
     'patients',
     'scheduling',
+    'exports',
 ]
 
 MIDDLEWARE = [
@@ -98,16 +100,32 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Bulk exports, written inline: there is no broker in this setup
+EXPORT_ROOT = str(BASE_DIR / 'exports_data')
+EXPORT_JOB_TIMEOUT = 3600
+EXPORT_JOB_MAX_ATTEMPTS = 3
+CELERY_TASK_ALWAYS_EAGER = True
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom user model
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Token authentication claims, cached per process and in the shared cache (see settings.py)
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_LOCAL_TTL = 10
+TOKEN_CACHE_TTL = 300
+
+# API token lifetime (see settings.py)
+TOKEN_TTL = 24 * 3600
+TOKEN_MAX_AGE = 30 * 24 * 3600
+TOKEN_RENEW_INTERVAL = 3600
+
 # Django REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
@@ -18,7 +18,7 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.authtoken import views
 from rest_framework.authtoken.views import obtain_auth_token
-from .auth_views import CustomAuthToken, logout_view, user_profile
+from .auth_views import CustomAuthToken, logout_view, rotate_token_view, user_profile
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,10 +26,12 @@ urlpatterns = [
     path('api/scheduling/', include('scheduling.urls')),
     path('api-auth/', include('rest_framework.urls')),  
     path('api/patients/', include('patients.urls')),
+    path('api/exports/', include('exports.urls')),
     
     # AUthentication URLs
     path('api/auth/login/', CustomAuthToken.as_view(), name='api_token_auth'),
     path('api/auth/logout/', logout_view, name='api_logout'),
+    path('api/auth/rotate/', rotate_token_view, name='api_token_rotate'),
     path('api/auth/profile/', user_profile, name='user_profile'),
     path('api/auth/', include('rest_framework.urls', namespace='rest_framework')),
 ]
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Patient, MedicalRecord
+from .models import DiagnosisDailyStat, Patient, MedicalRecord, MedicalRecordAttachment
 
 admin.site.register(Patient)
-admin.site.register(MedicalRecord)
\ No newline at end of file
+admin.site.register(MedicalRecord)
+admin.site.register(MedicalRecordAttachment)
+admin.site.register(DiagnosisDailyStat)
\ No newline at end of file
@@ -0,0 +1,150 @@
+from datetime import datetime, time
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Trim, TruncDate, TruncWeek
+from django.utils import timezone
+from users.models import CustomUser
+from .models import DiagnosisDailyStat, MedicalRecord
+
+
+def diagnosis_label(diagnosis):
+    # Only spaces, exactly like the SQL TRIM() rebuild() groups by, so the
+    # signals and a rebuild always file a record under the same label
+    return diagnosis.strip(' ')
+
+
+def stat_key(record):
+    return timezone.localdate(record.visit_date), diagnosis_label(record.diagnosis), record.created_by_id
+
+
+def add_visits(key, delta):
+    """
+    Add delta to one (day, diagnosis, doctor) counter with a single UPDATE,
+    creating the row the first time it is needed.
+    """
+    day, diagnosis, created_by_id = key
+    stats = DiagnosisDailyStat.objects.filter(day=day, diagnosis=diagnosis, created_by_id=created_by_id)
+    if delta < 0:
+        stats.update(visits=F('visits') + delta)
+        # Drop counters that reached zero so reports never list empty groups
+        stats.filter(visits__lte=0).delete()
+        return
+    if stats.update(visits=F('visits') + delta):
+        return
+    try:
+        with transaction.atomic():
+            DiagnosisDailyStat.objects.create(day=day, diagnosis=diagnosis, created_by_id=created_by_id, visits=delta)
+    except IntegrityError:
+        # A concurrent save created it first
+        stats.update(visits=F('visits') + delta)
+
+
+def record_saved(record, previous_key, created):
+    key = stat_key(record)
+    if created:
+        add_visits(key, 1)
+    elif previous_key is not None and previous_key != key:
+        add_visits(previous_key, -1)
+        add_visits(key, 1)
+
+
+def record_deleted(record):
+    add_visits(stat_key(record), -1)
+
+
+def fold_deleted_author(user_id):
+    """
+    Move a deleted doctor's counters into the created_by=NULL ones, which is
+    where their records end up. on_delete=SET_NULL alone would try to put a
+    second NULL counter next to an existing one for the same (day, diagnosis),
+    which diagnosis_stat_unique_unattributed refuses.
+    """
+    own = DiagnosisDailyStat.objects.filter(created_by_id=user_id)
+    same_group = own.filter(day=OuterRef('day'), diagnosis=OuterRef('diagnosis'))
+    orphans = DiagnosisDailyStat.objects.filter(created_by__isnull=True)
+    orphans.filter(Exists(same_group)).update(visits=F('visits') + Subquery(same_group.values('visits')[:1]))
+    own.filter(Exists(orphans.filter(day=OuterRef('day'), diagnosis=OuterRef('diagnosis')))).delete()
+    own.update(created_by=None)
+
+
+def rebuild(first_day=None, batch_size=5000):
+    """
+    Recompute the counters from MedicalRecord with one GROUP BY, from first_day
+    on or for all time. Returns the number of counters written.
+    """
+    records = MedicalRecord.objects.all()
+    stats = DiagnosisDailyStat.objects.all()
+    if first_day is not None:
+        start = timezone.make_aware(datetime.combine(first_day, time.min))
+        records = records.filter(visit_date__gte=start)
+        stats = stats.filter(day__gte=first_day)
+
+    groups = (
+        records
+        .annotate(day=TruncDate('visit_date'), name=Trim('diagnosis'))
+        .values('day', 'name', 'created_by')
+        .annotate(visits=Count('id'))
+        .order_by()
+        .iterator(chunk_size=batch_size)
+    )
+    written = 0
+    with transaction.atomic():
+        stats.delete()
+        batch = []
+        for group in groups:
+            batch.append(DiagnosisDailyStat(
+                day=group['day'], diagnosis=group['name'], created_by_id=group['created_by'], visits=group['visits']
+            ))
+            if len(batch) == batch_size:
+                DiagnosisDailyStat.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        DiagnosisDailyStat.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+def scoped_stats(user, first_day, last_day):
+    stats = DiagnosisDailyStat.objects.filter(day__gte=first_day, day__lte=last_day)
+    if user.role == CustomUser.Role.DOCTOR:
+        # Doctors get the numbers of their own practice, like the dashboard
+        stats = stats.filter(created_by=user)
+    return stats
+
+
+def top_diagnoses(user, first_day, last_day, limit):
+    rows = (
+        scoped_stats(user, first_day, last_day)
+        .values('diagnosis')
+        .annotate(visits=Sum('visits'))
+        .order_by('-visits', 'diagnosis')[:limit]
+    )
+    return list(rows)
+
+
+def visits_per_doctor(user, first_day, last_day):
+    rows = (
+        scoped_stats(user, first_day, last_day)
+        .values('created_by', 'created_by__first_name', 'created_by__last_name')
+        .annotate(visits=Sum('visits'))
+        .order_by('-visits', 'created_by')
+    )
+    return [
+        {
+            'doctor': row['created_by'],
+            'doctor_name': f"{row['created_by__first_name'] or ''} {row['created_by__last_name'] or ''}".strip(),
+            'visits': row['visits'],
+        }
+        for row in rows
+    ]
+
+
+def visits_per_week(user, first_day, last_day):
+    rows = (
+        scoped_stats(user, first_day, last_day)
+        .annotate(week=TruncWeek('day'))
+        .values('week')
+        .annotate(visits=Sum('visits'))
+        .order_by('week')
+    )
+    return list(rows)
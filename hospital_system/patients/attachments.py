@@ -0,0 +1,110 @@
+import os
+import re
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+
+BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def relative_path(attachment):
+    # Two levels of fan-out keep directories small with millions of files
+    key = attachment.key.hex
+    return f'{key[:2]}/{key}'
+
+
+def attachment_path(attachment):
+    return os.path.join(settings.ATTACHMENT_ROOT, relative_path(attachment))
+
+
+def write_chunk(attachment, offset, stream, length):
+    """
+    Copy up to length bytes from stream into the file at offset, block by block,
+    so a chunk never sits in memory whole. Anything past offset left over from an
+    interrupted chunk is discarded first. Returns the number of bytes written.
+    """
+    path = attachment_path(attachment)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+        f.seek(offset)
+        f.truncate()
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            written += len(block)
+    return written
+
+
+def remove_file(attachment):
+    try:
+        os.remove(attachment_path(attachment))
+    except FileNotFoundError:
+        pass
+
+
+def read_range(f, length):
+    while length > 0:
+        block = f.read(min(BLOCK_SIZE, length))
+        if not block:
+            break
+        length -= len(block)
+        yield block
+    f.close()
+
+
+def parse_range(header, size):
+    """
+    (start, end) of a single "bytes=" range, None to serve the whole file
+    (no, malformed or multi-part ranges), or False if it can't be satisfied.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def attachment_response(request, attachment):
+    """
+    Hand the file to nginx with X-Accel-Redirect when ATTACHMENT_ACCEL_PREFIX is
+    set; nginx then serves it, Range requests included, without a worker. In
+    development Django serves it itself, honouring single byte ranges.
+    """
+    disposition = content_disposition_header(True, attachment.filename)
+    prefix = settings.ATTACHMENT_ACCEL_PREFIX
+    if prefix:
+        response = HttpResponse(content_type=attachment.content_type)
+        response['X-Accel-Redirect'] = f"{prefix.rstrip('/')}/{relative_path(attachment)}"
+        response['Content-Disposition'] = disposition
+        return response
+
+    path = attachment_path(attachment)
+    size = os.path.getsize(path)
+    byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=attachment.content_type)
+    else:
+        start, end = byte_range
+        f = open(path, 'rb')
+        f.seek(start)
+        response = StreamingHttpResponse(read_range(f, end - start + 1), status=206, content_type=attachment.content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    return response
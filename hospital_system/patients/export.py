@@ -0,0 +1,77 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 1000
+
+EXPORT_FIELDS = (
+    'id', 'visit_date', 'diagnosis', 'treatment', 'notes', 'patient', 'created_by',
+    'created_by__first_name', 'created_by__last_name',
+)
+COLUMNS = ('id', 'visit_date', 'diagnosis', 'treatment', 'notes', 'patient', 'created_by', 'created_by_name')
+
+
+class ExportRenderer(BaseRenderer):
+    """
+    Selects the export format through content negotiation (?format= or Accept).
+    The export itself is streamed, so this only renders errors.
+    """
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            return str(data['detail']).encode(self.charset)
+        return str(data or '').encode(self.charset)
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class NDJSONRenderer(ExportRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+
+class Echo:
+    """
+    File-like object for csv.writer that hands each line back instead of buffering it.
+    """
+    def write(self, value):
+        return value
+
+
+def record_rows(queryset):
+    """
+    Medical records as plain dicts, oldest visit first, read in chunks so memory
+    stays flat however long the history is.
+    """
+    rows = queryset.order_by('visit_date', 'id').values(*EXPORT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    for row in rows:
+        first_name = row.pop('created_by__first_name') or ''
+        last_name = row.pop('created_by__last_name') or ''
+        row['created_by_name'] = f"{first_name} {last_name}".strip()
+        row['visit_date'] = row['visit_date'].isoformat()
+        yield row
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in record_rows(queryset):
+        yield writer.writerow([row[column] for column in COLUMNS])
+
+
+def stream_ndjson(queryset):
+    for row in record_rows(queryset):
+        yield json.dumps({column: row[column] for column in COLUMNS}, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_response(queryset, renderer, filename):
+    stream = stream_csv if renderer.format == 'csv' else stream_ndjson
+    response = StreamingHttpResponse(stream(queryset), content_type=f'{renderer.media_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{renderer.format}"'
+    return response
@@ -0,0 +1,98 @@
+import random
+import statistics
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from patients.models import Patient, search_name_for
+from patients.search import optimize_search_index, search_patients
+from users.models import CustomUser
+
+BENCH_PREFIX = 'bench_search_'
+TARGET_P99_MS = 20
+
+FIRST_NAMES = ['Mario', 'Maria', 'Luca', 'Giulia', 'Marco', 'Anna', 'Paolo', 'Sara', 'Andrea', 'Elena', 'Giorgio', 'Chiara']
+LAST_NAMES = ['Rossi', 'Russo', 'Ferrari', 'Esposito', 'Bianchi', 'Romano', 'Colombo', 'Ricci', 'Marino', 'Greco']
+
+
+class Command(BaseCommand):
+    help = 'Seed many patients and report p50/p99 latency of the patient search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=200, help='Searches per query kind')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows seeded by a previous run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows when done')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.seed(options)
+
+        optimize_search_index()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        rng = random.Random(0)
+        kinds = [
+            ('surname prefix', lambda: rng.choice(LAST_NAMES)[:4]),
+            ('full name', lambda: f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}{rng.randrange(1000)}"),
+            ('phone digits', lambda: str(rng.randrange(10_000_000, 99_999_999))[:6]),
+            ('name and birth date', lambda: f"{rng.choice(LAST_NAMES)} 19{rng.randrange(40, 99)}-0{rng.randrange(1, 9)}-1{rng.randrange(10)}"),
+        ]
+
+        self.stdout.write('')
+        self.stdout.write(f"{'query':<24} {'p50':>10} {'p99':>10}")
+        for label, make_query in kinds:
+            samples = []
+            for _ in range(options['repeat']):
+                query = make_query()
+                started = time.perf_counter()
+                search_patients(query)
+                samples.append((time.perf_counter() - started) * 1000)
+            samples.sort()
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            style = self.style.SUCCESS if p99 < TARGET_P99_MS else self.style.WARNING
+            self.stdout.write(style(f"{label:<24} {statistics.median(samples):>8.2f}ms {p99:>8.2f}ms"))
+
+        if options['cleanup']:
+            self.cleanup()
+
+    def seed(self, options):
+        batch_size = options['batch_size']
+        password = make_password(None)
+        started = time.perf_counter()
+        seeded = 0
+
+        while seeded < options['patients']:
+            size = min(batch_size, options['patients'] - seeded)
+            users = [
+                CustomUser(
+                    username=f"{BENCH_PREFIX}{seeded + i}", password=password, role=CustomUser.Role.PATIENT,
+                    first_name=random.choice(FIRST_NAMES), last_name=f"{random.choice(LAST_NAMES)}{random.randrange(1000)}",
+                )
+                for i in range(size)
+            ]
+            with transaction.atomic():
+                users = CustomUser.objects.bulk_create(users)
+                Patient.objects.bulk_create(
+                    Patient(
+                        user=user,
+                        date_of_birth=f"19{random.randrange(40, 99)}-0{random.randrange(1, 9)}-1{random.randrange(10)}",
+                        address='Benchmark',
+                        phone_number=f"+39 3{random.randrange(10, 99)} {random.randrange(1_000_000, 9_999_999)}",
+                        # bulk_create skips Patient.save, which normally fills this in
+                        search_name=search_name_for(user.first_name, user.last_name),
+                    )
+                    for user in users
+                )
+            seeded += size
+            self.stdout.write(f"\rPatient: {seeded}/{options['patients']}", ending='')
+        self.stdout.write(f"\rPatient: {seeded}/{options['patients']}")
+        self.stdout.write(f"Seeding took {time.perf_counter() - started:.1f}s")
+
+    def cleanup(self):
+        bench_users = CustomUser.objects.filter(username__startswith=BENCH_PREFIX)
+        Patient.objects.filter(user__in=bench_users).delete()
+        bench_users.delete()
+        self.stdout.write(self.style.SUCCESS('Removed benchmark data'))
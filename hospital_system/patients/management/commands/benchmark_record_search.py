@@ -0,0 +1,118 @@
+import random
+import statistics
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from patients.models import MedicalRecord, Patient, search_name_for
+from patients.record_search import RECORD_TABLE, search_records
+from users.models import CustomUser
+
+BENCH_PREFIX = 'bench_records_'
+TARGET_P99_MS = 50
+
+COMMON = ['influenza', 'hypertension', 'diabetes', 'bronchitis', 'migraine', 'fracture', 'asthma', 'gastritis']
+TREATMENTS = ['rest', 'fluids', 'ibuprofen', 'paracetamol', 'antibiotics', 'physiotherapy', 'insulin', 'inhaler']
+# A long tail of rare words, so some searches hit a handful of records
+RARE = [f'condition{i}' for i in range(20_000)]
+
+
+class Command(BaseCommand):
+    help = 'Seed a large medical record corpus and report p50/p99 latency of the full-text record search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=100_000)
+        parser.add_argument('--records', type=int, default=10_000_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=100, help='Searches per query kind')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows seeded by a previous run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows when done')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.seed(options)
+
+        patient_ids = list(
+            Patient.objects.filter(user__username__startswith=BENCH_PREFIX).values_list('pk', flat=True)[:1000]
+        )
+        if not patient_ids:
+            self.stderr.write(self.style.ERROR('No benchmark data found, run without --skip-seed first.'))
+            return
+
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute(f"INSERT INTO {RECORD_TABLE}({RECORD_TABLE}) VALUES ('optimize')")
+            cursor.execute('ANALYZE')
+
+        rng = random.Random(0)
+        kinds = [
+            ('common term', lambda: (rng.choice(COMMON), None)),
+            ('two terms', lambda: (f'{rng.choice(COMMON)} {rng.choice(TREATMENTS)}', None)),
+            ('rare term', lambda: (rng.choice(RARE), None)),
+            ('within one patient', lambda: (rng.choice(COMMON), rng.choice(patient_ids))),
+        ]
+
+        self.stdout.write('')
+        self.stdout.write(f"{'query':<24} {'p50':>10} {'p99':>10}")
+        for label, make_query in kinds:
+            samples = []
+            for _ in range(options['repeat']):
+                query, patient_id = make_query()
+                started = time.perf_counter()
+                search_records(query, patient_id=patient_id)
+                samples.append((time.perf_counter() - started) * 1000)
+            samples.sort()
+            p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+            style = self.style.SUCCESS if p99 < TARGET_P99_MS else self.style.WARNING
+            self.stdout.write(style(f"{label:<24} {statistics.median(samples):>8.2f}ms {p99:>8.2f}ms"))
+
+        if options['cleanup']:
+            self.cleanup()
+
+    def seed(self, options):
+        batch_size = options['batch_size']
+        password = make_password(None)
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            doctor = CustomUser.objects.create(
+                username=f"{BENCH_PREFIX}doctor", password=password, role=CustomUser.Role.DOCTOR
+            )
+            users = CustomUser.objects.bulk_create(
+                (CustomUser(username=f"{BENCH_PREFIX}patient_{i}", password=password, role=CustomUser.Role.PATIENT)
+                 for i in range(options['patients'])),
+                batch_size=batch_size,
+            )
+            Patient.objects.bulk_create(
+                (Patient(user=user, date_of_birth='1980-01-01', address='Benchmark', phone_number=str(i),
+                         search_name=search_name_for('', ''))
+                 for i, user in enumerate(users)),
+                batch_size=batch_size,
+            )
+        patient_ids = [user.pk for user in users]
+
+        inserted = 0
+        while inserted < options['records']:
+            size = min(batch_size, options['records'] - inserted)
+            with transaction.atomic():
+                MedicalRecord.objects.bulk_create(
+                    MedicalRecord(
+                        patient_id=random.choice(patient_ids),
+                        created_by=doctor,
+                        diagnosis=f"{random.choice(COMMON)} {random.choice(RARE)}",
+                        treatment=f"{random.choice(TREATMENTS)} and {random.choice(TREATMENTS)}",
+                        notes=f"Follow up on {random.choice(RARE)}" if random.random() < 0.3 else '',
+                    )
+                    for _ in range(size)
+                )
+            inserted += size
+            self.stdout.write(f"\rMedicalRecord: {inserted}/{options['records']}", ending='')
+        self.stdout.write(f"\rMedicalRecord: {inserted}/{options['records']}")
+        self.stdout.write(f"Seeding took {time.perf_counter() - started:.1f}s")
+
+    def cleanup(self):
+        bench_users = CustomUser.objects.filter(username__startswith=BENCH_PREFIX)
+        MedicalRecord.objects.filter(patient__user__in=bench_users).delete()
+        Patient.objects.filter(user__in=bench_users).delete()
+        bench_users.delete()
+        self.stdout.write(self.style.SUCCESS('Removed benchmark data'))
@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from patients.models import Patient, search_name_for
+from patients.search import optimize_search_index
+from patients.serializers import PatientImportSerializer, base_username_for, highest_username_suffix
+from users.models import CustomUser
+
+BATCH_RETRIES = 3
+
+
+class UsernameAllocator:
+    """
+    Hands out patient usernames like PatientSerializer does (base, base_1, ...)
+    for a whole batch: one query for the highest suffix taken of each base not
+    seen before, remembered for the rest of the import.
+    """
+    def __init__(self):
+        self.highest = {}
+
+    def allocate(self, bases):
+        for base in set(bases) - set(self.highest):
+            self.highest[base] = highest_username_suffix(base)
+
+        usernames = []
+        for base in bases:
+            highest = self.highest[base]
+            if highest is None:
+                usernames.append(base)
+                self.highest[base] = 0
+            else:
+                usernames.append(f"{base}_{highest + 1}")
+                self.highest[base] = highest + 1
+        return usernames
+
+    def forget(self):
+        self.highest.clear()
+
+
+class Command(BaseCommand):
+    help = (
+        'Import patients from a CSV or NDJSON file with the columns first_name, last_name, '
+        'email, date_of_birth, address, phone_number. Resumes from its checkpoint after a failure.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or NDJSON file, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', help='Progress file, defaults to <path>.checkpoint')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+        if path == '-' and not options['checkpoint']:
+            checkpoint_path = None
+        else:
+            checkpoint_path = options['checkpoint'] or f"{path}.checkpoint"
+
+        progress = {'rows': 0, 'imported': 0, 'invalid': 0}
+        if checkpoint_path and not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                progress = json.load(f)
+            self.stdout.write(f"Resuming after row {progress['rows']} ({progress['imported']} imported so far)")
+
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            rows = self.read_rows(source, file_format)
+            # Rows before the checkpoint were committed by an earlier run
+            rows = islice(rows, progress['rows'], None)
+            self.import_rows(rows, options['batch_size'], progress, checkpoint_path)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        optimize_search_index()
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+    def read_rows(self, source, file_format):
+        if file_format == 'csv':
+            yield from csv.DictReader(source)
+            return
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise CommandError(f"Line {line_number} is not valid JSON: {e}")
+
+    def import_rows(self, rows, batch_size, progress, checkpoint_path):
+        password = make_password(None)
+        usernames = UsernameAllocator()
+        started = time.perf_counter()
+        imported_before = progress['imported']
+
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+
+            valid = []
+            for offset, row in enumerate(chunk, start=progress['rows'] + 1):
+                serializer = PatientImportSerializer(data=row)
+                if serializer.is_valid():
+                    valid.append(serializer.validated_data)
+                else:
+                    progress['invalid'] += 1
+                    self.stderr.write(f"Row {offset} skipped: {json.dumps(serializer.errors)}")
+
+            for attempt in range(BATCH_RETRIES):
+                try:
+                    self.insert_batch(valid, usernames, password)
+                    break
+                except IntegrityError:
+                    # Someone else took one of the usernames meanwhile
+                    if attempt == BATCH_RETRIES - 1:
+                        raise
+                    usernames.forget()
+
+            progress['rows'] += len(chunk)
+            progress['imported'] += len(valid)
+            if checkpoint_path:
+                self.save_checkpoint(checkpoint_path, progress)
+
+            elapsed = time.perf_counter() - started
+            rate = (progress['imported'] - imported_before) / elapsed if elapsed else 0
+            self.stdout.write(f"{progress['rows']} rows read, {progress['imported']} imported, {rate:.0f} patients/s")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {progress['imported'] - imported_before} patients in {elapsed:.1f}s "
+            f"({progress['invalid']} invalid rows skipped)"
+        ))
+
+    def insert_batch(self, rows, usernames, password):
+        if not rows:
+            return
+        with transaction.atomic():
+            names = usernames.allocate([base_username_for(row['first_name'], row['last_name']) for row in rows])
+            users = CustomUser.objects.bulk_create(
+                CustomUser(
+                    username=username, password=password, role=CustomUser.Role.PATIENT,
+                    first_name=row['first_name'], last_name=row['last_name'], email=row['email'],
+                )
+                for username, row in zip(names, rows)
+            )
+            Patient.objects.bulk_create(
+                Patient(
+                    user=user,
+                    date_of_birth=row['date_of_birth'],
+                    address=row['address'],
+                    phone_number=row['phone_number'],
+                    # bulk_create skips Patient.save, which normally fills this in
+                    search_name=search_name_for(row['first_name'], row['last_name']),
+                )
+                for user, row in zip(users, rows)
+            )
+
+    def save_checkpoint(self, path, progress):
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(progress, f)
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,106 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:44
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_search_name(apps, schema_editor):
+    Patient = apps.get_model('patients', 'Patient')
+    batch = []
+    for patient in Patient.objects.select_related('user').iterator(chunk_size=2000):
+        patient.search_name = ' '.join(f"{patient.user.first_name} {patient.user.last_name}".lower().split())
+        batch.append(patient)
+        if len(batch) == 2000:
+            Patient.objects.bulk_update(batch, ['search_name'])
+            batch = []
+    Patient.objects.bulk_update(batch, ['search_name'])
+
+
+# The search DDL lives here and in 0004 only, so no later change to the
+# search code can change what this migration does
+PHONE_DIGITS = (
+    "replace(replace(replace(replace(replace(replace({}, ' ', ''), '-', ''), '+', ''), '(', ''), ')', ''), '.', '')"
+)
+INDEX_ROWS = (
+    "INSERT INTO patients_patient_name_search(rowid, search_name) VALUES ({row}.user_id, {row}.search_name); "
+    "INSERT INTO patients_patient_phone_search(rowid, phone_digits) VALUES ({row}.user_id, {digits}); "
+)
+UNINDEX_ROWS = (
+    "INSERT INTO patients_patient_name_search(patients_patient_name_search, rowid, search_name) "
+    "VALUES ('delete', {row}.user_id, {row}.search_name); "
+    "INSERT INTO patients_patient_phone_search(patients_patient_phone_search, rowid, phone_digits) "
+    "VALUES ('delete', {row}.user_id, {digits}); "
+)
+
+
+def index_rows(row):
+    return INDEX_ROWS.format(row=row, digits=PHONE_DIGITS.format(f'{row}.phone_number'))
+
+
+def unindex_rows(row):
+    return UNINDEX_ROWS.format(row=row, digits=PHONE_DIGITS.format(f'{row}.phone_number'))
+
+
+SQLITE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patients_patient_name_search USING fts5("
+    "search_name, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patients_patient_phone_search USING fts5("
+    "phone_digits, content='', tokenize='trigram')",
+    f"CREATE TRIGGER IF NOT EXISTS patients_patient_search_ai AFTER INSERT ON patients_patient "
+    f"BEGIN {index_rows('new')}END",
+    f"CREATE TRIGGER IF NOT EXISTS patients_patient_search_ad AFTER DELETE ON patients_patient "
+    f"BEGIN {unindex_rows('old')}END",
+    f"CREATE TRIGGER IF NOT EXISTS patients_patient_search_au AFTER UPDATE ON patients_patient "
+    f"BEGIN {unindex_rows('old')}{index_rows('new')}END",
+    "INSERT INTO patients_patient_name_search(rowid, search_name) SELECT user_id, search_name FROM patients_patient",
+    f"INSERT INTO patients_patient_phone_search(rowid, phone_digits) "
+    f"SELECT user_id, {PHONE_DIGITS.format('phone_number')} FROM patients_patient",
+]
+
+POSTGRESQL_STATEMENTS = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS patient_search_name_trgm ON patients_patient USING gin (search_name gin_trgm_ops)',
+    "CREATE INDEX IF NOT EXISTS patient_phone_digits_trgm ON patients_patient "
+    "USING gin ((regexp_replace(phone_number, '[^0-9]', '', 'g')) gin_trgm_ops)",
+]
+
+
+def add_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRESQL_STATEMENTS, 'sqlite': SQLITE_STATEMENTS}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def remove_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS patient_search_name_trgm')
+        schema_editor.execute('DROP INDEX IF EXISTS patient_phone_digits_trgm')
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS patients_patient_search_{suffix}")
+        schema_editor.execute("DROP TABLE IF EXISTS patients_patient_name_search")
+        schema_editor.execute("DROP TABLE IF EXISTS patients_patient_phone_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_composite_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=301),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['date_of_birth'], name='patient_dob_idx'),
+        ),
+        migrations.RunPython(fill_search_name, migrations.RunPython.noop),
+        migrations.RunPython(add_search_index, remove_search_index),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:04
+
+from django.db import migrations
+
+
+# The SQL is copied here rather than imported from patients.record_search, so
+# later changes to that module never change what this migration does
+SQLITE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS patients_medicalrecord_search USING fts5("
+    "diagnosis, treatment, notes, content='patients_medicalrecord', content_rowid='id', "
+    "tokenize='porter unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS patients_medicalrecord_search_ai AFTER INSERT ON patients_medicalrecord BEGIN "
+    "INSERT INTO patients_medicalrecord_search(rowid, diagnosis, treatment, notes) "
+    "VALUES (new.id, new.diagnosis, new.treatment, new.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS patients_medicalrecord_search_ad AFTER DELETE ON patients_medicalrecord BEGIN "
+    "INSERT INTO patients_medicalrecord_search(patients_medicalrecord_search, rowid, diagnosis, treatment, notes) "
+    "VALUES ('delete', old.id, old.diagnosis, old.treatment, old.notes); END",
+    "CREATE TRIGGER IF NOT EXISTS patients_medicalrecord_search_au AFTER UPDATE OF diagnosis, treatment, notes "
+    "ON patients_medicalrecord BEGIN "
+    "INSERT INTO patients_medicalrecord_search(patients_medicalrecord_search, rowid, diagnosis, treatment, notes) "
+    "VALUES ('delete', old.id, old.diagnosis, old.treatment, old.notes); "
+    "INSERT INTO patients_medicalrecord_search(rowid, diagnosis, treatment, notes) "
+    "VALUES (new.id, new.diagnosis, new.treatment, new.notes); END",
+    "INSERT INTO patients_medicalrecord_search(patients_medicalrecord_search) VALUES ('rebuild')",
+]
+
+POSTGRESQL_STATEMENTS = [
+    "ALTER TABLE patients_medicalrecord ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('english', coalesce(diagnosis, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(treatment, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(notes, '')), 'C')) STORED",
+    'CREATE INDEX IF NOT EXISTS record_search_vector_idx ON patients_medicalrecord USING gin (search_vector)',
+]
+
+
+def add_record_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'postgresql': POSTGRESQL_STATEMENTS, 'sqlite': SQLITE_STATEMENTS}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def remove_record_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS record_search_vector_idx')
+        schema_editor.execute('ALTER TABLE patients_medicalrecord DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS patients_medicalrecord_search_{suffix}")
+        schema_editor.execute("DROP TABLE IF EXISTS patients_medicalrecord_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0003_patient_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_record_search_index, remove_record_search_index),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:17
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+from importlib import import_module
+
+# The frozen SQL of the migrations that created the indexes, not the live search modules
+patient_search = import_module('patients.migrations.0003_patient_search')
+record_search = import_module('patients.migrations.0004_medicalrecord_search')
+
+
+def fill_updated_at(apps, schema_editor):
+    # Start from the best change time known so far rather than the migration run
+    Patient = apps.get_model('patients', 'Patient')
+    MedicalRecord = apps.get_model('patients', 'MedicalRecord')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    MedicalRecord.objects.update(updated_at=F('visit_date'))
+    Patient.objects.update(updated_at=Subquery(User.objects.filter(pk=OuterRef('user_id')).values('date_joined')[:1]))
+
+
+def restore_search_indexes(apps, schema_editor):
+    # Adding (or removing) the columns makes SQLite rebuild both tables, which drops
+    # the triggers that keep the full-text indexes in sync; put them back and re-index
+    if schema_editor.connection.vendor == 'sqlite':
+        # Contentless FTS5 tables refuse a plain DELETE once they have rows
+        for table in ('patients_patient_name_search', 'patients_patient_phone_search'):
+            schema_editor.execute(f"INSERT INTO {table}({table}) VALUES ('delete-all')")
+    patient_search.add_search_index(apps, schema_editor)
+    record_search.add_record_search_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0006_medicalrecordattachment'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Only runs backwards, after the RemoveFields below rebuilt the tables
+        migrations.RunPython(migrations.RunPython.noop, restore_search_indexes),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+        migrations.RunPython(restore_search_indexes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', 'updated_at'], name='record_patient_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['updated_at'], name='patient_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 21:36
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_unattributed_counters(apps, schema_editor):
+    # Counters without a doctor could be duplicated before the constraint; keep one per group
+    DiagnosisDailyStat = apps.get_model('patients', 'DiagnosisDailyStat')
+    stats = DiagnosisDailyStat.objects.using(schema_editor.connection.alias).filter(created_by__isnull=True)
+    groups = stats.values('day', 'diagnosis').annotate(rows=Count('pk'), keep=Min('pk'), total=Sum('visits'))
+    for group in groups.filter(rows__gt=1):
+        same = stats.filter(day=group['day'], diagnosis=group['diagnosis'])
+        same.exclude(pk=group['keep']).delete()
+        same.filter(pk=group['keep']).update(visits=group['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_unattributed_counters, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='diagnosisdailystat',
+            constraint=models.UniqueConstraint(condition=models.Q(('created_by__isnull', True)), fields=('day', 'diagnosis'), name='diagnosis_stat_unique_unattributed'),
+        ),
+    ]
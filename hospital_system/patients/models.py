@@ -1,6 +1,12 @@
+import uuid
 from django.db import models
 from django.conf import settings
 
+
+def search_name_for(first_name, last_name):
+    return ' '.join(f"{first_name} {last_name}".lower().split())
+
+
 class Patient(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True)
 
@@ -8,8 +14,29 @@ class Patient(models.Model):
     address = models.CharField(max_length=255)
     phone_number = models.CharField(max_length=30)
 
+    # Lower-cased copy of the user's full name, so search can index it without a join
+    search_name = models.CharField(max_length=301, blank=True, default='', editable=False)
+    # Bulk .update() calls must set this themselves, auto_now only covers save()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_of_birth'], name='patient_dob_idx'),
+            models.Index(fields=['updated_at'], name='patient_updated_idx'),
+        ]
+
     def __str__(self):
         return f"Patient: {self.user.first_name} {self.user.last_name}"
+
+    def save(self, *args, **kwargs):
+        self.search_name = search_name_for(self.user.first_name, self.user.last_name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'search_name', 'updated_at'}
+        super().save(*args, **kwargs)
+
+    def get_full_name(self):
+        return self.user.get_full_name()
     
 class MedicalRecord(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='medical_records')
@@ -20,7 +47,68 @@ class MedicalRecord(models.Model):
     diagnosis = models.CharField(max_length=255)
     treatment = models.TextField()
     notes = models.TextField(blank=True, null=True)
+    # Bulk .update() calls must set this themselves, auto_now only covers save()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # A patient's history is always read newest first
+            models.Index(fields=['patient', '-visit_date'], name='record_patient_visit_idx'),
+            # Lets the conditional GET probe of a patient's records read the index alone
+            models.Index(fields=['patient', 'updated_at'], name='record_patient_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Record for {self.patient.user.username} on {self.visit_date.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+class MedicalRecordAttachment(models.Model):
+    """
+    A file (lab report, imaging, ...) attached to a medical record. It is uploaded
+    in chunks, so `received` tracks how far the upload got and where to resume.
+    """
+    class Status(models.TextChoices):
+        UPLOADING = 'UPLOADING', 'Uploading'
+        COMPLETE = 'COMPLETE', 'Complete'
+
+    record = models.ForeignKey(MedicalRecord, on_delete=models.CASCADE, related_name='attachments')
+    uploaded_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    # Name of the file on disk, so nothing the client sends ends up in a path
+    key = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100, default='application/octet-stream')
+    size = models.BigIntegerField(help_text="Total size in bytes, announced when the upload starts")
+    received = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+
+class DiagnosisDailyStat(models.Model):
+    """
+    Visits per day, diagnosis and doctor. Kept up to date by the MedicalRecord
+    signals (see patients.analytics) so reports never scan the records themselves.
+    """
+    day = models.DateField()
+    diagnosis = models.CharField(max_length=255)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    visits = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'diagnosis', 'created_by'], name='diagnosis_stat_unique'),
+            # NULLs never conflict in the one above, so the counters without a doctor get their own
+            models.UniqueConstraint(
+                fields=['day', 'diagnosis'], condition=models.Q(created_by__isnull=True),
+                name='diagnosis_stat_unique_unattributed'
+            ),
+        ]
 
     def __str__(self):
-        return f"Record for {self.patient.user.username} on {self.visit_date.strftime('%Y-%m-%d %H:%M:%S')}"
\ No newline at end of file
+        return f"{self.day} {self.diagnosis}: {self.visits}"
@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from hospital_system.ownership import owns
 
 class IsDoctorOrAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -28,10 +29,10 @@ class CanViewPatients(permissions.BasePermission):
             return request.user.role in ['DOCTOR', 'ADMIN']
             
         # For read operations
-        if request.user.role in ['DOCTOR', 'ADMIN']:
+        if request.user.is_staff or request.user.role in ['DOCTOR', 'ADMIN']:
             return True
         # Patients can only see their own data
-        return request.user.role == 'PATIENT' and obj.user == request.user
+        return request.user.role == 'PATIENT' and owns(request.user, obj, 'user')
 
 class CanViewMedicalRecords(permissions.BasePermission):
     """
@@ -43,7 +44,7 @@ class CanViewMedicalRecords(permissions.BasePermission):
             return False
         
         # For nested routes like /patients/{id}/records/, check if patient matches current user
-        if request.user.role == 'PATIENT':
+        if request.user.role == 'PATIENT' and not request.user.is_staff:
             patient_pk = view.kwargs.get('patient_pk')
             if patient_pk:
                 # Patient can only access their own records
@@ -53,7 +54,22 @@ class CanViewMedicalRecords(permissions.BasePermission):
         return request.user.role in ['DOCTOR', 'ADMIN', 'PATIENT']
         
     def has_object_permission(self, request, view, obj):
-        if request.user.role in ['DOCTOR', 'ADMIN']:
+        if request.user.is_staff or request.user.role in ['DOCTOR', 'ADMIN']:
             return True
         # Patients can only see their own medical records
-        return request.user.role == 'PATIENT' and obj.patient.user == request.user
\ No newline at end of file
+        return request.user.role == 'PATIENT' and owns(request.user, obj, 'patient')
+
+
+class CanViewRecordAttachments(CanViewMedicalRecords):
+    """
+    Same reading rules as the records themselves; only doctors and admins upload or delete.
+    """
+    def has_permission(self, request, view):
+        if not super().has_permission(request, view):
+            return False
+        return request.method in permissions.SAFE_METHODS or request.user.role in ['DOCTOR', 'ADMIN']
+
+    def has_object_permission(self, request, view, obj):
+        if request.user.is_staff or request.user.role in ['DOCTOR', 'ADMIN']:
+            return True
+        return request.user.role == 'PATIENT' and owns(request.user, obj.record, 'patient')
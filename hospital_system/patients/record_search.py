@@ -0,0 +1,103 @@
+import re
+from django.db import connection
+from django.db.models import Expression, Q
+from .models import MedicalRecord
+
+MAX_RESULTS = 100
+# Only the newest matches of a very common term are ranked, so "flu" costs the same as "sarcoidosis"
+RANK_CANDIDATES = 1000
+RECORD_TABLE = 'patients_medicalrecord_search'
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def search_records(query, patient_id=None, limit=20):
+    """
+    Medical records containing every word of the query in their diagnosis,
+    treatment or notes, best match first (diagnosis counts most, notes least),
+    newest first among equal matches.
+    """
+    terms = search_terms(query)
+    limit = min(limit, MAX_RESULTS)
+    if not terms:
+        return []
+    if connection.vendor == 'postgresql':
+        return list(postgresql_queryset(terms, patient_id)[:limit])
+    if connection.vendor == 'sqlite':
+        return search_sqlite(terms, patient_id, limit)
+    return search_fallback(terms, patient_id, limit)
+
+
+class SearchVectorColumn(Expression):
+    """
+    The search_vector column, which isn't on the model. It is qualified with the
+    alias the query gives patients_medicalrecord, so it stays correct when the
+    table is renamed inside a subquery.
+    """
+    def __init__(self):
+        from django.contrib.postgres.search import SearchVectorField
+        super().__init__(output_field=SearchVectorField())
+
+    def as_sql(self, compiler, connection):
+        alias = compiler.query.get_initial_alias()
+        return f'{compiler.quote_name_unless_alias(alias)}.{connection.ops.quote_name("search_vector")}', []
+
+
+def postgresql_queryset(terms, patient_id):
+    """
+    The newest RANK_CANDIDATES matches through the GIN index on search_vector,
+    ranked with ts_rank.
+    """
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    text = ' '.join(terms)
+    candidates = MedicalRecord.objects.alias(search_vector=SearchVectorColumn()).filter(
+        search_vector=SearchQuery(text, config='english')
+    )
+    if patient_id is not None:
+        candidates = candidates.filter(patient_id=patient_id)
+
+    return (
+        MedicalRecord.objects.select_related('created_by')
+        # The newest matches; without an ordering PostgreSQL may return any of them
+        .filter(pk__in=candidates.order_by('-visit_date', '-id').values('pk')[:RANK_CANDIDATES])
+        .annotate(rank=SearchRank(SearchVectorColumn(), SearchQuery(text, config='english')))
+        .order_by('-rank', '-visit_date', '-id')
+    )
+
+
+def search_sqlite(terms, patient_id, limit):
+    """
+    The newest RANK_CANDIDATES matches (rowid DESC walks the index backwards),
+    ranked by bm25 with column weights like the PostgreSQL ones.
+    """
+    match = ' AND '.join(f'"{term}"' for term in terms)
+    conditions, params = [f'{RECORD_TABLE} MATCH %s'], [match]
+    if patient_id is not None:
+        # One chart holds few records, found through record_patient_visit_idx
+        conditions.append('rowid IN (SELECT id FROM patients_medicalrecord WHERE patient_id = %s)')
+        params.append(patient_id)
+    sql = (
+        f"SELECT id FROM (SELECT rowid AS id, bm25({RECORD_TABLE}, 10.0, 5.0, 1.0) AS score "
+        f"FROM {RECORD_TABLE} WHERE {' AND '.join(conditions)} ORDER BY rowid DESC LIMIT %s) "
+        f"ORDER BY score, id DESC LIMIT %s"
+    )
+    params += [RANK_CANDIDATES, limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+    records = MedicalRecord.objects.select_related('created_by').in_bulk(ids)
+    return [records[pk] for pk in ids if pk in records]
+
+
+def search_fallback(terms, patient_id, limit):
+    records = MedicalRecord.objects.select_related('created_by')
+    if patient_id is not None:
+        records = records.filter(patient_id=patient_id)
+    for term in terms:
+        records = records.filter(
+            Q(diagnosis__icontains=term) | Q(treatment__icontains=term) | Q(notes__icontains=term)
+        )
+    return list(records.order_by('-visit_date', '-id')[:limit])
@@ -0,0 +1,137 @@
+import re
+from datetime import date
+from django.db import connection
+from django.db.models import CharField, Func
+from .models import Patient
+
+MAX_RESULTS = 50
+# How many patients sharing a birth date are checked at most
+RANK_CANDIDATES = 500
+NAME_TABLE = 'patients_patient_name_search'
+PHONE_TABLE = 'patients_patient_phone_search'
+
+def optimize_search_index():
+    """
+    Merge the FTS5 segments left behind by many small writes, e.g. after a bulk import.
+    PostgreSQL keeps its GIN indexes compact on its own.
+    """
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for table in (NAME_TABLE, PHONE_TABLE):
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+
+class PhoneDigits(Func):
+    # Same expression as the patient_phone_digits_trgm index
+    template = "regexp_replace(%(expressions)s, '[^0-9]', '', 'g')"
+    output_field = CharField()
+
+
+def parse_query(query):
+    """
+    Split a free-text query into name words, phone digits and a date of birth,
+    e.g. "rossi 333 1980-05-02".
+    """
+    names, phones, date_of_birth = [], [], None
+    for token in query.split():
+        try:
+            date_of_birth = date.fromisoformat(token)
+            continue
+        except ValueError:
+            pass
+        digits = re.sub(r'\D', '', token)
+        if re.fullmatch(r'[\d\s+\-().]+', token) and len(digits) >= 3:
+            phones.append(digits)
+        else:
+            names.extend(re.findall(r'\w+', token.lower()))
+    return names, phones, date_of_birth
+
+
+def search_patients(query, limit=20):
+    """
+    Patients matching every term of the query, best match first.
+    """
+    names, phones, date_of_birth = parse_query(query)
+    limit = min(limit, MAX_RESULTS)
+    if date_of_birth:
+        return search_by_birth_date(date_of_birth, names, phones, limit)
+    if not (names or phones):
+        return []
+    if connection.vendor == 'postgresql':
+        return search_postgresql(names, phones, limit)
+    if connection.vendor == 'sqlite':
+        return search_sqlite(names, phones, limit)
+    return search_fallback(names, phones, limit)
+
+
+def search_by_birth_date(date_of_birth, names, phones, limit):
+    """
+    A birth date narrows the search to a handful of rows through patient_dob_idx,
+    so the remaining terms are checked on those rows directly.
+    """
+    patients = Patient.objects.select_related('user').filter(date_of_birth=date_of_birth)
+    matches = []
+    for patient in patients.order_by('search_name', 'pk')[:RANK_CANDIDATES]:
+        words = patient.search_name.split()
+        digits = re.sub(r'\D', '', patient.phone_number)
+        if all(any(word.startswith(name) for word in words) for name in names) and all(d in digits for d in phones):
+            # Whole-word hits rank above prefix hits
+            matches.append((-sum(name in words for name in names), patient))
+    matches.sort(key=lambda match: match[0])
+    return [patient for _, patient in matches[:limit]]
+
+
+def search_postgresql(names, phones, limit):
+    """
+    Names match by trigram word similarity, so typos and prefixes still find the
+    patient; phone digits by substring. Both use the GIN trigram indexes. Every
+    hit is ranked before the limit, so the best matches are never cut off.
+    """
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    candidates = Patient.objects.all()
+    if phones:
+        candidates = candidates.alias(phone_digits=PhoneDigits('phone_number'))
+        for digits in phones:
+            candidates = candidates.filter(phone_digits__contains=digits)
+    if names:
+        candidates = candidates.filter(search_name__trigram_word_similar=' '.join(names))
+
+    patients = candidates.select_related('user')
+    if names:
+        patients = patients.annotate(rank=TrigramWordSimilarity(' '.join(names), 'search_name'))
+        return list(patients.order_by('-rank', 'search_name', 'pk')[:limit])
+    return list(patients.order_by('search_name', 'pk')[:limit])
+
+
+def search_sqlite(names, phones, limit):
+    """
+    Name prefixes and phone substrings through the FTS5 indexes, every hit ranked
+    by bm25 before the limit.
+    """
+    name_match = ' AND '.join(f'"{name}"*' for name in names)
+    phone_match = ' AND '.join(f'"{digits}"' for digits in phones)
+
+    # Rank on the names when there are any, otherwise on the phone match
+    table, match = (NAME_TABLE, name_match) if names else (PHONE_TABLE, phone_match)
+    conditions, params = [f'{table} MATCH %s'], [match]
+    if names and phones:
+        conditions.append(f'rowid IN (SELECT rowid FROM {PHONE_TABLE} WHERE {PHONE_TABLE} MATCH %s)')
+        params.append(phone_match)
+    sql = f"SELECT rowid FROM {table} WHERE {' AND '.join(conditions)} ORDER BY rank LIMIT %s"
+    params.append(limit)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        ids = [row[0] for row in cursor.fetchall()]
+    patients = Patient.objects.select_related('user').in_bulk(ids)
+    return [patients[pk] for pk in ids if pk in patients]
+
+
+def search_fallback(names, phones, limit):
+    patients = Patient.objects.select_related('user')
+    for name in names:
+        patients = patients.filter(search_name__contains=name)
+    for digits in phones:
+        patients = patients.filter(phone_number__contains=digits)
+    return list(patients.order_by('search_name', 'pk')[:limit])
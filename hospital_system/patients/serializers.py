@@ -1,8 +1,57 @@
+import re
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, IntegerField, Max, Value, When
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
 from rest_framework import serializers
-from .models import MedicalRecord, Patient
+from .models import MedicalRecord, MedicalRecordAttachment, Patient
 from users.models import CustomUser
 import uuid
 
+# Attempts at a free username before giving up when concurrent creates keep taking it
+USERNAME_RETRIES = 5
+
+
+# Room left after the base for a "_<n>" suffix, so a suffixed username still fits
+USERNAME_SUFFIX_ROOM = 8
+
+
+def base_username_for(first_name, last_name):
+    max_length = CustomUser._meta.get_field('username').max_length - USERNAME_SUFFIX_ROOM
+    return f"patient_{first_name.lower()}_{last_name.lower()}"[:max_length]
+
+
+def highest_username_suffix(base_username):
+    """
+    None if neither base_username nor any base_username_<n> is taken, else the
+    highest n taken (0 for base_username itself), from one aggregate query.
+    """
+    taken = CustomUser.objects.filter(
+        username__startswith=base_username, username__regex=rf'^{re.escape(base_username)}(_[0-9]+)?$'
+    ).aggregate(
+        count=Count('id'),
+        highest=Max(Case(
+            When(username=base_username, then=Value(0)),
+            default=Cast(Substr('username', len(base_username) + 2), IntegerField()),
+        )),
+    )
+    return taken['highest'] if taken['count'] else None
+
+
+def next_free_username(base_username):
+    """
+    base_username if free, otherwise base_username_<highest suffix + 1>, found
+    with one aggregate query however many namesakes exist.
+    """
+    highest = highest_username_suffix(base_username)
+    if highest is None:
+        return base_username
+    return f"{base_username}_{highest + 1}"
+
+
 class PatientSerializer(serializers.ModelSerializer):
     full_name = serializers.CharField(source='user.get_full_name', read_only=True)
     user_id = serializers.ReadOnlyField()
@@ -26,27 +75,25 @@ class PatientSerializer(serializers.ModelSerializer):
         email = validated_data.pop('email', '')
         
         # Creating a unique username for the patient
-        base_username = f"patient_{first_name.lower()}_{last_name.lower()}"
-        username = base_username
-        counter = 1
-        
-        # Ensuring the username is unique
-        while CustomUser.objects.filter(username=username).exists():
-            username = f"{base_username}_{counter}"
-            counter += 1
-
-        # Creating the user
-        user = CustomUser.objects.create(
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-            email=email,
-            role='PATIENT'
-        )
-        
-        # Creating the patient instance
-        patient = Patient.objects.create(user=user, **validated_data)
-        return patient
+        base_username = base_username_for(first_name, last_name)
+
+        for attempt in range(USERNAME_RETRIES):
+            username = next_free_username(base_username)
+            try:
+                with transaction.atomic():
+                    # Creating the user and the patient instance
+                    user = CustomUser.objects.create(
+                        username=username,
+                        first_name=first_name,
+                        last_name=last_name,
+                        email=email,
+                        role='PATIENT'
+                    )
+                    return Patient.objects.create(user=user, **validated_data)
+            except IntegrityError:
+                # A concurrent create took the same username; look again
+                if attempt == USERNAME_RETRIES - 1 or not CustomUser.objects.filter(username=username).exists():
+                    raise
 
 
 class MedicalRecordSerializer(serializers.ModelSerializer):
@@ -55,4 +102,87 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicalRecord
         fields = ('id', 'visit_date', 'diagnosis', 'treatment', 'notes', 'patient', 'created_by', 'created_by_name')
-        read_only_fields = ['created_by', 'patient']
\ No newline at end of file
+        read_only_fields = ['created_by', 'patient']
+
+class MedicalRecordAttachmentSerializer(serializers.ModelSerializer):
+    """
+    Creating an attachment only announces it; the content follows in PATCH
+    requests to its upload URL.
+    """
+    class Meta:
+        model = MedicalRecordAttachment
+        fields = (
+            'id', 'record', 'filename', 'content_type', 'size', 'received', 'status',
+            'uploaded_by', 'created_at', 'completed_at'
+        )
+        read_only_fields = ['record', 'received', 'status', 'uploaded_by', 'created_at', 'completed_at']
+
+    def validate_filename(self, value):
+        name = os.path.basename(value.replace('\\', '/')).strip()
+        if not name:
+            raise serializers.ValidationError("Must name a file.")
+        return name
+
+    def validate_size(self, value):
+        if not 0 < value <= settings.ATTACHMENT_MAX_SIZE:
+            raise serializers.ValidationError(f"Must be between 1 and {settings.ATTACHMENT_MAX_SIZE} bytes.")
+        return value
+
+
+class PatientSearchQuerySerializer(serializers.Serializer):
+    """
+    ?q= free text (name, phone digits and/or a YYYY-MM-DD date of birth) and ?limit=
+    """
+    q = serializers.CharField(min_length=2, max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=20)
+
+
+class PatientImportSerializer(serializers.Serializer):
+    """
+    One row of a patient import file.
+    """
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    email = serializers.EmailField(required=False, allow_blank=True, default='')
+    date_of_birth = serializers.DateField()
+    address = serializers.CharField(max_length=255)
+    phone_number = serializers.CharField(max_length=30)
+
+
+class TimelineQuerySerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class RecordSearchQuerySerializer(serializers.Serializer):
+    """
+    ?q= words to look for, optionally ?patient= to stay within one chart, and ?limit=
+    """
+    q = serializers.CharField(min_length=2, max_length=200)
+    patient = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=20)
+
+
+class AnalyticsQuerySerializer(serializers.Serializer):
+    """
+    Optional ?from=&to= dates of the diagnosis analytics, defaulting to the last
+    30 days, and ?limit= for the top diagnoses.
+    """
+    MAX_RANGE = timedelta(days=366 * 5)
+
+    def get_fields(self):
+        # "from" is a Python keyword, so the fields can't be class attributes
+        return {
+            'from': serializers.DateField(source='first_day', required=False),
+            'to': serializers.DateField(source='last_day', required=False),
+            'limit': serializers.IntegerField(min_value=1, max_value=100, default=10),
+        }
+
+    def validate(self, data):
+        data.setdefault('last_day', timezone.localdate())
+        data.setdefault('first_day', data['last_day'] - timedelta(days=29))
+        if data['last_day'] < data['first_day']:
+            raise serializers.ValidationError({'to': "Must not be earlier than 'from'."})
+        if data['last_day'] - data['first_day'] > self.MAX_RANGE:
+            raise serializers.ValidationError({'to': f"Range can span at most {self.MAX_RANGE.days} days."})
+        return data
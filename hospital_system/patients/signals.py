@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from scheduling.models import Appointment
+from . import analytics
+from .attachments import remove_file
+from .models import MedicalRecord, MedicalRecordAttachment, Patient, search_name_for
+from .timeline import invalidate_timeline
+
+
+# User fields shown in (or exported with) patients and medical records
+SHOWN_USER_FIELDS = ('first_name', 'last_name', 'username', 'email')
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def remember_shown_user_fields(sender, instance, update_fields=None, **kwargs):
+    # Saves that touch none of them (e.g. last_login on every login) skip the comparison
+    instance._previous_shown = None
+    if instance.pk is None or (update_fields is not None and not set(SHOWN_USER_FIELDS) & set(update_fields)):
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(field in loaded for field in SHOWN_USER_FIELDS):
+        instance._previous_shown = tuple(loaded[field] for field in SHOWN_USER_FIELDS)
+    else:
+        # Only instances not read from the database, or read with these fields deferred
+        instance._previous_shown = sender.objects.filter(pk=instance.pk).values_list(*SHOWN_USER_FIELDS).first()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def sync_shown_user_fields(sender, instance, created, **kwargs):
+    """
+    Carry a changed name into Patient.search_name, and bump the updated_at of the
+    patient, of the records the user wrote and of the appointments showing their
+    name, so conditional GETs, calendar feeds and incremental exports don't keep
+    serving the old values.
+    """
+    previous = getattr(instance, '_previous_shown', None)
+    current = tuple(getattr(instance, field) for field in SHOWN_USER_FIELDS)
+    if created or previous is None or previous == current:
+        return
+    now = timezone.now()
+    Patient.objects.filter(user_id=instance.pk).update(
+        search_name=search_name_for(instance.first_name, instance.last_name), updated_at=now
+    )
+    if previous[:2] != current[:2]:
+        MedicalRecord.objects.filter(created_by_id=instance.pk).update(updated_at=now)
+        Appointment.objects.filter(Q(doctor_id=instance.pk) | Q(patient_id=instance.pk)).update(updated_at=now)
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def touch_records_of_deleted_author(sender, instance, **kwargs):
+    # on_delete=SET_NULL clears created_by with an UPDATE that leaves updated_at alone
+    MedicalRecord.objects.filter(created_by_id=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def fold_stats_of_deleted_author(sender, instance, **kwargs):
+    analytics.fold_deleted_author(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+@receiver([post_save, post_delete], sender=MedicalRecord)
+def invalidate_patient_timeline(sender, instance, **kwargs):
+    # Bulk .update() calls skip signals and invalidate the timeline themselves
+    invalidate_timeline([instance.patient_id])
+
+
+@receiver(pre_save, sender=MedicalRecord)
+def remember_record_stat_key(sender, instance, **kwargs):
+    # The counter the record is in before this save, to move it if it changes
+    instance._stat_key = None
+    if instance.pk is not None:
+        previous = MedicalRecord.objects.filter(pk=instance.pk).values('visit_date', 'diagnosis', 'created_by_id').first()
+        if previous is not None:
+            instance._stat_key = analytics.stat_key(MedicalRecord(**previous))
+
+
+@receiver(post_save, sender=MedicalRecord)
+def count_saved_record(sender, instance, created, **kwargs):
+    analytics.record_saved(instance, getattr(instance, '_stat_key', None), created)
+
+
+@receiver(post_delete, sender=MedicalRecord)
+def count_deleted_record(sender, instance, **kwargs):
+    analytics.record_deleted(instance)
+
+
+@receiver(post_delete, sender=MedicalRecordAttachment)
+def remove_attachment_file(sender, instance, **kwargs):
+    # Also runs for attachments deleted along with their record or patient
+    transaction.on_commit(lambda: remove_file(instance))
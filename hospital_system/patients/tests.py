@@ -1,3 +1,727 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from datetime import datetime, timedelta
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.utils import timezone
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from scheduling.models import Appointment
+from users.models import CustomUser
+from .attachments import attachment_path
+from .models import DiagnosisDailyStat, MedicalRecord, MedicalRecordAttachment, Patient
+from .record_search import postgresql_queryset
 
-# Create your tests here.
+
+def create_patient(username, **kwargs):
+    user = CustomUser.objects.create_user(
+        username=username, password='password123', role='PATIENT', **kwargs
+    )
+    return Patient.objects.create(
+        user=user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+    )
+
+
+class PatientQueryCountTest(APITestCase):
+    """
+    List and detail endpoints must load related users in a constant number of queries.
+    """
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', password='password123', first_name='John', last_name='Doe', role='DOCTOR'
+        )
+        self.patients = [create_patient(f'patient{i}', first_name='Jane', last_name=f'Roe{i}') for i in range(5)]
+        self.patient = self.patients[0]
+        for patient in self.patients:
+            for _ in range(3):
+                MedicalRecord.objects.create(
+                    patient=patient, created_by=self.doctor, diagnosis='Flu', treatment='Rest'
+                )
+
+    def test_patient_list(self):
+        self.client.force_authenticate(user=self.doctor)
+        # The conditional GET probe, the page count and the page itself
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('patients-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['full_name'], 'Jane Roe0')
+
+    def test_patient_detail(self):
+        self.client.force_authenticate(user=self.doctor)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('patients-detail', args=[self.patient.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_record_list(self):
+        self.client.force_authenticate(user=self.doctor)
+        url = reverse('patient-records-list', kwargs={'patient_pk': self.patient.pk})
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(response.data['results'][0]['created_by_name'], 'John Doe')
+
+    def test_record_detail(self):
+        self.client.force_authenticate(user=self.doctor)
+        record = self.patient.medical_records.first()
+        url = reverse('patient-records-detail', kwargs={'patient_pk': self.patient.pk, 'pk': record.pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_my_history(self):
+        self.client.force_authenticate(user=self.patient.user)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('my-medical-history'))
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_patient_reads_own_profile_and_records(self):
+        # Like token authentication, only the fields it vouches for are loaded;
+        # ownership is checked on the ids of the row, without loading the patient
+        user = CustomUser.objects.only('id', 'role', 'is_staff').get(pk=self.patient.pk)
+        self.client.force_authenticate(user=user)
+        record = self.patient.medical_records.first()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('patients-detail', args=[self.patient.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        url = reverse('patient-records-detail', kwargs={'patient_pk': self.patient.pk, 'pk': record.pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('patients-detail', args=[self.patients[1].pk]))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_staff_patient_reads_every_profile_and_record(self):
+        staff = CustomUser.objects.create_user(username='superuser', role='PATIENT', is_staff=True)
+        self.client.force_authenticate(user=staff)
+        record = self.patient.medical_records.first()
+        response = self.client.get(reverse('patients-detail', args=[self.patient.pk]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        url = reverse('patient-records-detail', kwargs={'patient_pk': self.patient.pk, 'pk': record.pk})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', password='password123', first_name='John', last_name='Doe', role='DOCTOR'
+        )
+        self.patient = create_patient('testpatient', first_name='Jane', last_name='Roe')
+        self.record = MedicalRecord.objects.create(
+            patient=self.patient, created_by=self.doctor, diagnosis='Flu', treatment='Rest'
+        )
+        self.client.force_authenticate(user=self.doctor)
+
+    def revalidate(self, url, queries):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(queries):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_resources_answer_304(self):
+        urls = {
+            reverse('patients-list'): 1,
+            reverse('patients-detail', args=[self.patient.pk]): 1,
+            reverse('patient-records-list', args=[self.patient.pk]): 1,
+            reverse('patient-records-detail', args=[self.patient.pk, self.record.pk]): 1,
+        }
+        for url, queries in urls.items():
+            with self.subTest(url=url):
+                response = self.revalidate(url, queries)
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+                self.assertEqual(response.content, b'')
+
+    def test_changes_invalidate_the_etag(self):
+        records_url = reverse('patient-records-list', args=[self.patient.pk])
+        etag = self.client.get(records_url)['ETag']
+        self.record.treatment = 'Antivirals'
+        self.record.save()
+        self.assertEqual(self.client.get(records_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+        # Deleting leaves MAX(updated_at) alone but not the count
+        MedicalRecord.objects.create(patient=self.patient, created_by=self.doctor, diagnosis='Cold', treatment='Tea')
+        etag = self.client.get(records_url)['ETag']
+        self.record.delete()
+        self.assertEqual(self.client.get(records_url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+
+    def test_renaming_users_touches_what_shows_their_name(self):
+        patient_url = reverse('patients-detail', args=[self.patient.pk])
+        record_url = reverse('patient-records-detail', args=[self.patient.pk, self.record.pk])
+        etags = {url: self.client.get(url)['ETag'] for url in (patient_url, record_url)}
+        self.patient.user.last_name = 'Smith'
+        self.patient.user.save()
+        self.doctor.first_name = 'Jack'
+        self.doctor.save()
+        for url, etag in etags.items():
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created_by_name'], 'Jack Doe')
+
+    def test_saving_a_loaded_user_compares_without_reading_it_again(self):
+        user = CustomUser.objects.get(pk=self.patient.pk)
+        # Just the UPDATE of the user: the name did not change
+        with self.assertNumQueries(1):
+            user.save()
+        user.last_name = 'Smith'
+        # The user, their patient row, the records they wrote and their appointments
+        with self.assertNumQueries(4):
+            user.save()
+        self.assertEqual(Patient.objects.get(pk=self.patient.pk).search_name, 'jane smith')
+        with self.assertNumQueries(1):
+            user.save()
+
+
+class MedicalHistoryCursorPaginationTest(APITestCase):
+    def setUp(self):
+        self.patient = create_patient('testpatient')
+        for i in range(25):
+            MedicalRecord.objects.create(patient=self.patient, diagnosis=f'Visit {i}', treatment='Rest')
+        self.client.force_authenticate(user=self.patient.user)
+
+    def test_newest_first_across_pages(self):
+        first = self.client.get(reverse('my-medical-history'), {'pagination': 'cursor'})
+        second = self.client.get(first.data['next'])
+        ids = [item['id'] for item in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, list(self.patient.medical_records.order_by('-visit_date', '-id').values_list('id', flat=True)))
+        self.assertIsNone(second.data['next'])
+
+    def test_order_names_the_direction_not_a_reversal(self):
+        newest_first = list(self.patient.medical_records.order_by('-visit_date', '-id').values_list('id', flat=True))
+        for params in ({'order': 'desc'}, {'order': 'desc', 'pagination': 'cursor'}):
+            response = self.client.get(reverse('my-medical-history'), params)
+            self.assertEqual([item['id'] for item in response.data['results']], newest_first[:20])
+        response = self.client.get(reverse('my-medical-history'), {'order': 'asc', 'pagination': 'cursor'})
+        self.assertEqual([item['id'] for item in response.data['results']], newest_first[::-1][:20])
+
+
+class MedicalRecordExportTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', password='password123', first_name='John', last_name='Doe', role='DOCTOR'
+        )
+        self.patient = create_patient('testpatient')
+        self.other = create_patient('otherpatient')
+        for i in range(30):
+            MedicalRecord.objects.create(
+                patient=self.patient, created_by=self.doctor, diagnosis=f'Visit {i}', treatment='Rest, fluids'
+            )
+        self.url = reverse('patient-records-export', kwargs={'patient_pk': self.patient.pk})
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_streams_every_record_in_one_query(self):
+        self.client.force_authenticate(user=self.doctor)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+            lines = self.read(response).splitlines()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(lines[0], 'id,visit_date,diagnosis,treatment,notes,patient,created_by,created_by_name')
+        self.assertEqual(len(lines), 31)
+        self.assertTrue(lines[1].endswith(',Visit 0,"Rest, fluids",,%d,%d,John Doe' % (self.patient.pk, self.doctor.pk)))
+
+    def test_ndjson(self):
+        self.client.force_authenticate(user=self.patient.user)
+        response = self.client.get(self.url, {'format': 'ndjson'})
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual([row['diagnosis'] for row in rows], [f'Visit {i}' for i in range(30)])
+
+    def test_same_rules_as_the_record_list(self):
+        self.client.force_authenticate(user=self.other.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.get(reverse('my-medical-history-export'))
+        self.assertEqual(self.read(response).splitlines()[1:], [])
+
+        self.client.force_authenticate(user=self.patient.user)
+        response = self.client.get(reverse('my-medical-history-export'))
+        self.assertEqual(len(self.read(response).splitlines()), 31)
+
+
+class PatientTimelineAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', password='password123', first_name='John', last_name='Doe', role='DOCTOR'
+        )
+        self.patient = create_patient('testpatient')
+        self.base = timezone.make_aware(datetime(2030, 1, 1, 9))
+        self.expected = []
+        for day in range(5):
+            time = self.base + timedelta(days=day)
+            appointment = Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, start_time=time, end_time=time + timedelta(minutes=30)
+            )
+            record = MedicalRecord.objects.create(patient=self.patient, created_by=self.doctor, diagnosis=f'Day {day}', treatment='Rest')
+            # Same moment as the appointment, to exercise the tie-break
+            MedicalRecord.objects.filter(pk=record.pk).update(visit_date=time)
+            self.expected = [('appointment', appointment.pk), ('medical_record', record.pk)] + self.expected
+        self.url = reverse('patient-timeline', kwargs={'patient_pk': self.patient.pk})
+        self.client.force_authenticate(user=self.doctor)
+
+    def entries(self, response):
+        return [(entry['type'], entry['id']) for entry in response.data['results']]
+
+    def test_interleaved_newest_first_across_pages(self):
+        seen = []
+        response = self.client.get(self.url, {'page_size': 3})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += self.entries(response)
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, self.expected)
+
+    def test_one_query_per_source_then_cached(self):
+        with self.assertNumQueries(2):
+            first = self.client.get(self.url)
+        self.assertEqual(first.data['results'][0]['doctor_name'], 'John Doe')
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(self.entries(second), self.entries(first))
+
+    def test_saving_a_record_invalidates_the_cache(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            record = MedicalRecord.objects.create(patient=self.patient, diagnosis='Latest', treatment='Rest')
+        # Visited today, long before the 2030 appointments, so it comes last
+        self.assertEqual(self.entries(self.client.get(self.url))[-1], ('medical_record', record.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('appointment-bulk-status'),
+                {'status': 'CANCELLED', 'ids': [self.expected[0][1]]}, format='json'
+            )
+        self.assertEqual(self.client.get(self.url).data['results'][0]['status'], 'CANCELLED')
+
+    def test_doctors_only_see_their_own_appointments(self):
+        self.client.get(self.url)
+        other_doctor = CustomUser.objects.create_user(username='otherdoctor', role='DOCTOR')
+        self.client.force_authenticate(user=other_doctor)
+        # Every record, but none of the first doctor's appointments, even with their page cached
+        self.assertEqual({kind for kind, _ in self.entries(self.client.get(self.url))}, {'medical_record'})
+        admin = CustomUser.objects.create_user(username='testadmin', role='ADMIN')
+        self.client.force_authenticate(user=admin)
+        self.assertEqual(self.entries(self.client.get(self.url)), self.expected)
+
+    def test_patients_only_see_their_own(self):
+        other = create_patient('otherpatient')
+        self.client.force_authenticate(user=other.user)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+        self.client.force_authenticate(user=self.patient.user)
+        self.assertEqual(len(self.client.get(self.url).data['results']), 10)
+
+
+class PatientSearchAPITest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', password='password123', role='DOCTOR')
+        self.mario = create_patient('mario', first_name='Mario', last_name='Rossi')
+        self.maria = create_patient('maria', first_name='Maria', last_name='Rossetti')
+        self.luca = create_patient('luca', first_name='Luca', last_name='Bianchi')
+        Patient.objects.filter(pk=self.luca.pk).update(phone_number='+39 333-123-4567')
+        self.luca.refresh_from_db()
+        self.luca.date_of_birth = '1980-05-02'
+        self.luca.save()
+        self.client.force_authenticate(user=self.doctor)
+
+    def search(self, q, **params):
+        response = self.client.get(reverse('patients-search'), {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [patient['user_id'] for patient in response.data['results']]
+
+    def test_name_prefix(self):
+        self.assertEqual(set(self.search('ross')), {self.mario.pk, self.maria.pk})
+        self.assertEqual(self.search('mario ross'), [self.mario.pk])
+
+    def test_phone_digits_and_date_of_birth(self):
+        self.assertEqual(self.search('3331234'), [self.luca.pk])
+        self.assertEqual(self.search('1980-05-02'), [self.luca.pk])
+        self.assertEqual(self.search('bianchi 1980-05-02'), [self.luca.pk])
+        self.assertEqual(self.search('rossi 1980-05-02'), [])
+
+    def test_renaming_the_user_updates_the_index(self):
+        user = self.mario.user
+        user.last_name = 'Verdi'
+        user.save()
+        self.assertEqual(self.search('verdi'), [self.mario.pk])
+        self.assertEqual(self.search('mario ross'), [])
+
+    def test_patients_cannot_search(self):
+        self.client.force_authenticate(user=self.mario.user)
+        response = self.client.get(reverse('patients-search'), {'q': 'rossi'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PatientUsernameTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', password='password123', role='DOCTOR')
+        self.client.force_authenticate(user=self.doctor)
+        self.data = {
+            'first_name': 'John', 'last_name': 'Smith', 'date_of_birth': '1990-01-01',
+            'address': 'Via Roma 1', 'phone_number': '123'
+        }
+
+    def create(self):
+        response = self.client.post(reverse('patients-list'), self.data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return CustomUser.objects.get(pk=response.data['user_id']).username
+
+    def test_suffix_follows_the_highest_namesake(self):
+        self.assertEqual(self.create(), 'patient_john_smith')
+        self.assertEqual(self.create(), 'patient_john_smith_1')
+        CustomUser.objects.create_user(username='patient_john_smith_41')
+        CustomUser.objects.create_user(username='patient_john_smith_jr')
+        self.assertEqual(self.create(), 'patient_john_smith_42')
+
+    def test_query_count_does_not_grow_with_namesakes(self):
+        self.create()
+        with self.assertNumQueries(6) as few:
+            self.create()
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f'patient_john_smith_{i}') for i in range(2, 50)
+        )
+        with self.assertNumQueries(len(few.captured_queries)):
+            self.assertEqual(self.create(), 'patient_john_smith_50')
+
+    def test_retries_when_a_concurrent_create_takes_the_name(self):
+        CustomUser.objects.create_user(username='patient_john_smith')
+        # The first lookup misses the namesake, as it would under a race
+        with mock.patch('patients.serializers.next_free_username', side_effect=['patient_john_smith', 'patient_john_smith_1']):
+            self.assertEqual(self.create(), 'patient_john_smith_1')
+
+
+class ImportPatientsCommandTest(TestCase):
+    HEADER = 'first_name,last_name,email,date_of_birth,address,phone_number\n'
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_patients', path, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_in_batches_with_namesakes_and_invalid_rows(self):
+        CustomUser.objects.create_user(username='patient_john_smith')
+        path = self.write('patients.csv', self.HEADER + (
+            'John,Smith,john@example.com,1980-01-01,Via Roma 1,111\n'
+            'John,Smith,,1981-01-01,Via Roma 2,222\n'
+            'Jane,Doe,,not-a-date,Via Roma 3,333\n'
+            'Ann,Lee,,1990-02-03,Via Roma 4,444\n'
+        ))
+        out, err = self.run_import(path, batch_size=2)
+
+        self.assertIn('Row 3 skipped', err)
+        self.assertIn('patients/s', out)
+        self.assertEqual(
+            sorted(Patient.objects.values_list('user__username', 'search_name')),
+            [('patient_ann_lee', 'ann lee'), ('patient_john_smith_1', 'john smith'), ('patient_john_smith_2', 'john smith')]
+        )
+        self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+    def test_suffixed_namesakes_and_long_names(self):
+        # The base itself is free, but a suffixed username is already taken
+        CustomUser.objects.create_user(username='patient_ann_lee_1')
+        long_name = 'x' * 140
+        path = self.write('patients.csv', self.HEADER + (
+            'Ann,Lee,,1990-02-03,Via Roma 1,111\n'
+            'Ann,Lee,,1990-02-03,Via Roma 2,222\n'
+            f'{long_name},Lee,,1990-02-03,Via Roma 3,333\n'
+            f'{long_name},Lee,,1990-02-03,Via Roma 4,444\n'
+        ))
+        self.run_import(path)
+
+        usernames = sorted(Patient.objects.values_list('user__username', flat=True))
+        self.assertEqual(usernames[:2], ['patient_ann_lee_2', 'patient_ann_lee_3'])
+        self.assertEqual([len(username) for username in usernames[2:]], [142, 144])
+
+    def test_resumes_after_the_checkpoint(self):
+        path = self.write('patients.ndjson', ''.join(
+            json.dumps({
+                'first_name': f'Name{i}', 'last_name': 'Test', 'date_of_birth': '1990-01-01',
+                'address': 'Via Roma 1', 'phone_number': str(i)
+            }) + '\n'
+            for i in range(5)
+        ))
+        # A previous run committed the first three rows before failing
+        self.write('patients.ndjson.checkpoint', json.dumps({'rows': 3, 'imported': 3, 'invalid': 0}))
+
+        out, _ = self.run_import(path, batch_size=2)
+
+        self.assertIn('Resuming after row 3', out)
+        self.assertEqual(
+            sorted(Patient.objects.values_list('user__first_name', flat=True)), ['Name3', 'Name4']
+        )
+
+
+class MedicalRecordSearchAPITest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', password='password123', role='DOCTOR')
+        self.patient = create_patient('testpatient')
+        self.other = create_patient('otherpatient')
+        self.flu = MedicalRecord.objects.create(
+            patient=self.patient, created_by=self.doctor, diagnosis='Influenza', treatment='Rest and fluids'
+        )
+        self.note = MedicalRecord.objects.create(
+            patient=self.patient, created_by=self.doctor, diagnosis='Checkup', treatment='None',
+            notes='Recovered from influenza'
+        )
+        self.other_flu = MedicalRecord.objects.create(
+            patient=self.other, created_by=self.doctor, diagnosis='Influenza', treatment='Antibiotics'
+        )
+        self.url = reverse('medical-record-search')
+
+    def search(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [record['id'] for record in response.data['results']]
+
+    def test_diagnosis_ranks_above_notes(self):
+        self.client.force_authenticate(user=self.doctor)
+        results = self.search('influenza')
+        self.assertEqual(set(results), {self.flu.pk, self.note.pk, self.other_flu.pk})
+        self.assertEqual(results[-1], self.note.pk)
+        # Stemming: "fluid" finds "fluids"
+        self.assertEqual(self.search('fluid rest'), [self.flu.pk])
+        self.assertEqual(self.search('influenza', patient=self.other.pk), [self.other_flu.pk])
+        # Within one chart too, the diagnosis hit ranks above the newer notes hit
+        self.assertEqual(self.search('influenza', patient=self.patient.pk), [self.flu.pk, self.note.pk])
+
+    def test_postgresql_matches_inside_the_candidate_subquery(self):
+        postgresql = DatabaseWrapper({**connection.settings_dict, 'ENGINE': 'django.db.backends.postgresql'}, alias='pg')
+        query = postgresql_queryset(['influenza'], self.patient.pk)[:20].query
+        sql, params = query.get_compiler(connection=postgresql).as_sql()
+        # The match uses the subquery's own alias, not a correlated reference to the outer table
+        self.assertIn('FROM "patients_medicalrecord" U0 WHERE (U0."search_vector" @@ (plainto_tsquery(', sql)
+        self.assertIn('ORDER BY U0."visit_date" DESC, U0."id" DESC LIMIT 1000', sql)
+        self.assertIn('ts_rank("patients_medicalrecord"."search_vector", plainto_tsquery(', sql)
+        self.assertEqual(params, ('english', 'influenza', 'english', 'influenza', self.patient.pk))
+
+    def test_edits_and_deletes_reach_the_index(self):
+        self.client.force_authenticate(user=self.doctor)
+        self.flu.diagnosis = 'Bronchitis'
+        self.flu.save()
+        self.other_flu.delete()
+        self.assertEqual(self.search('influenza'), [self.note.pk])
+        self.assertEqual(self.search('bronchitis'), [self.flu.pk])
+
+    def test_patients_search_only_their_own_records(self):
+        self.client.force_authenticate(user=self.other.user)
+        self.assertEqual(self.search('influenza'), [self.other_flu.pk])
+        self.assertEqual(self.search('influenza', patient=self.patient.pk), [self.other_flu.pk])
+
+
+class DiagnosisAnalyticsTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', password='password123', role='DOCTOR')
+        self.other_doctor = CustomUser.objects.create_user(username='otherdoctor', password='password123', role='DOCTOR')
+        self.admin = CustomUser.objects.create_user(username='testadmin', password='password123', role='ADMIN')
+        self.patient = create_patient('testpatient')
+        for diagnosis in ['Influenza', 'Influenza', 'Migraine']:
+            MedicalRecord.objects.create(patient=self.patient, created_by=self.doctor, diagnosis=diagnosis, treatment='Rest')
+        self.other_flu = MedicalRecord.objects.create(
+            patient=self.patient, created_by=self.other_doctor, diagnosis='Influenza ', treatment='Rest'
+        )
+
+    def counters(self):
+        return set(DiagnosisDailyStat.objects.values_list('diagnosis', 'created_by', 'visits'))
+
+    def test_counters_follow_creates_edits_and_deletes(self):
+        self.assertEqual(self.counters(), {
+            ('Influenza', self.doctor.pk, 2), ('Migraine', self.doctor.pk, 1), ('Influenza', self.other_doctor.pk, 1),
+        })
+        self.other_flu.diagnosis = 'Migraine'
+        self.other_flu.save()
+        MedicalRecord.objects.filter(diagnosis='Influenza').first().delete()
+        self.assertEqual(self.counters(), {
+            ('Influenza', self.doctor.pk, 1), ('Migraine', self.doctor.pk, 1), ('Migraine', self.other_doctor.pk, 1),
+        })
+
+    def test_rebuild_matches_incremental_counters(self):
+        incremental = self.counters()
+        DiagnosisDailyStat.objects.all().delete()
+        call_command('rebuild_diagnosis_stats', stdout=StringIO())
+        self.assertEqual(self.counters(), incremental)
+
+    def test_deleted_doctors_share_one_counter_per_group(self):
+        MedicalRecord.objects.create(patient=self.patient, diagnosis='Influenza', treatment='Rest')
+        self.doctor.delete()
+        self.other_doctor.delete()
+        self.assertEqual(self.counters(), {('Influenza', None, 4), ('Migraine', None, 1)})
+        MedicalRecord.objects.filter(diagnosis='Migraine').delete()
+        self.assertEqual(self.counters(), {('Influenza', None, 4)})
+
+    def test_one_counter_per_group_without_a_doctor(self):
+        DiagnosisDailyStat.objects.create(day='2030-01-01', diagnosis='Influenza', visits=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DiagnosisDailyStat.objects.create(day='2030-01-01', diagnosis='Influenza', visits=1)
+
+    def test_signals_and_rebuild_trim_alike(self):
+        # A no-break space is not trimmed by SQL TRIM(), so neither is it here
+        MedicalRecord.objects.create(
+            patient=self.patient, created_by=self.doctor, diagnosis='\u00a0Influenza ', treatment='Rest'
+        )
+        incremental = self.counters()
+        self.assertIn(('\u00a0Influenza', self.doctor.pk, 1), incremental)
+        call_command('rebuild_diagnosis_stats', stdout=StringIO())
+        self.assertEqual(self.counters(), incremental)
+
+    def test_reports_read_only_the_summary(self):
+        self.client.force_authenticate(user=self.admin)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('analytics-top-diagnoses'), {'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'diagnosis': 'Influenza', 'visits': 3}])
+
+        response = self.client.get(reverse('analytics-visits-per-doctor'))
+        self.assertEqual([(row['doctor'], row['visits']) for row in response.data['results']],
+                         [(self.doctor.pk, 3), (self.other_doctor.pk, 1)])
+
+        response = self.client.get(reverse('analytics-visits-per-week'))
+        self.assertEqual(sum(row['visits'] for row in response.data['results']), 4)
+
+    def test_doctors_see_their_own_visits(self):
+        self.client.force_authenticate(user=self.other_doctor)
+        response = self.client.get(reverse('analytics-top-diagnoses'))
+        self.assertEqual(response.data['results'], [{'diagnosis': 'Influenza', 'visits': 1}])
+
+        self.client.force_authenticate(user=self.patient.user)
+        response = self.client.get(reverse('analytics-top-diagnoses'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class MedicalRecordAttachmentTest(APITestCase):
+    CONTENT = b'%PDF-1.7 ' + bytes(range(256)) * 40
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        settings_override = override_settings(ATTACHMENT_ROOT=self.root.name, ATTACHMENT_ACCEL_PREFIX='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', password='password123', role='DOCTOR')
+        self.patient = create_patient('testpatient')
+        self.other = create_patient('otherpatient')
+        self.record = MedicalRecord.objects.create(
+            patient=self.patient, created_by=self.doctor, diagnosis='Fracture', treatment='Cast'
+        )
+        self.list_url = reverse('record-attachments-list', args=[self.patient.pk, self.record.pk])
+
+    def announce(self):
+        self.client.force_authenticate(user=self.doctor)
+        response = self.client.post(self.list_url, {
+            'filename': '../../x-ray.pdf', 'content_type': 'application/pdf', 'size': len(self.CONTENT)
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['filename'], 'x-ray.pdf')
+        return MedicalRecordAttachment.objects.get(pk=response.data['id'])
+
+    def send(self, attachment, offset, chunk):
+        url = reverse('record-attachments-upload', args=[self.patient.pk, self.record.pk, attachment.pk])
+        return self.client.patch(
+            url, chunk, content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def upload(self):
+        attachment = self.announce()
+        self.send(attachment, 0, self.CONTENT[:4000])
+        self.send(attachment, 4000, self.CONTENT[4000:])
+        return attachment
+
+    def test_chunked_upload_resumes_from_received(self):
+        attachment = self.announce()
+        response = self.send(attachment, 0, self.CONTENT[:4000])
+        self.assertEqual(response['Upload-Offset'], '4000')
+        self.assertEqual(response.data['status'], 'UPLOADING')
+
+        # A retried or out-of-order chunk is refused with the offset to resume from
+        response = self.send(attachment, 1000, self.CONTENT[1000:5000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['received'], 4000)
+        response = self.send(attachment, 4000, self.CONTENT[4000:] + b'extra')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.send(attachment, 4000, self.CONTENT[4000:])
+        self.assertEqual(response.data['status'], 'COMPLETE')
+        with open(attachment_path(attachment), 'rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+
+    def test_download_supports_ranges(self):
+        attachment = self.upload()
+        url = reverse('record-attachments-download', args=[self.patient.pk, self.record.pk, attachment.pk])
+        self.client.force_authenticate(user=self.patient.user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertIn('x-ray.pdf', response['Content-Disposition'])
+
+        response = self.client.get(url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.CONTENT)}')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[100:200])
+        response = self.client.get(url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[-10:])
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(self.CONTENT)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def test_download_is_handed_to_nginx(self):
+        attachment = self.upload()
+        url = reverse('record-attachments-download', args=[self.patient.pk, self.record.pk, attachment.pk])
+        with self.settings(ATTACHMENT_ACCEL_PREFIX='/protected-attachments/'):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-attachments/{attachment.key.hex[:2]}/{attachment.key.hex}')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response.content, b'')
+
+    def test_patients_only_read_their_own_attachments(self):
+        attachment = self.upload()
+        self.client.force_authenticate(user=self.patient.user)
+        self.assertEqual(self.client.get(self.list_url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.send(attachment, 0, b'x').status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=self.other.user)
+        url = reverse('record-attachments-download', args=[self.patient.pk, self.record.pk, attachment.pk])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        url = reverse('record-attachments-download', args=[self.other.pk, self.record.pk, attachment.pk])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_deleting_removes_the_file(self):
+        attachment = self.upload()
+        url = reverse('record-attachments-detail', args=[self.patient.pk, self.record.pk, attachment.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(os.path.exists(attachment_path(attachment)))
+
+
+class BenchmarkPatientSearchCommandTest(TransactionTestCase):
+    def test_small_run_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_patient_search', patients=30, batch_size=16, repeat=2, cleanup=True, stdout=out)
+        self.assertIn('surname prefix', out.getvalue())
+        self.assertFalse(Patient.objects.exists())
+
+
+class BenchmarkRecordSearchCommandTest(TransactionTestCase):
+    def test_small_run_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_record_search', patients=5, records=50, batch_size=16, repeat=2, cleanup=True, stdout=out)
+        self.assertIn('rare term', out.getvalue())
+        self.assertFalse(MedicalRecord.objects.exists())
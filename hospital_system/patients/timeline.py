@@ -0,0 +1,142 @@
+import base64
+import binascii
+import heapq
+import json
+import uuid
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from hospital_system.ownership import scope_by_role
+from scheduling.models import Appointment
+from .models import MedicalRecord
+
+INVALID_CURSOR = 'Invalid cursor'
+
+# Entries are ordered newest first by (time, kind, id); kind breaks ties between the sources.
+# Each source is scoped to the viewer like its list endpoint, on doctor_field for doctors.
+SOURCES = {
+    'appointment': {
+        'rank': 1,
+        'model': Appointment,
+        'time': 'start_time',
+        'fields': ('id', 'start_time', 'end_time', 'status', 'notes', 'doctor_id', 'doctor__first_name', 'doctor__last_name'),
+        'person': 'doctor',
+        'doctor_field': 'doctor',
+    },
+    'medical_record': {
+        'rank': 0,
+        'model': MedicalRecord,
+        'time': 'visit_date',
+        'fields': ('id', 'visit_date', 'diagnosis', 'treatment', 'notes', 'created_by_id', 'created_by__first_name', 'created_by__last_name'),
+        'person': 'created_by',
+        'doctor_field': None,
+    },
+}
+
+
+def version_key(patient_id):
+    return f'timeline-version:{patient_id}'
+
+
+def invalidate_timeline(patient_ids):
+    """
+    Give the patients' timelines a new cache version, which orphans every cached page.
+    Done again on commit, so a page read before the commit isn't cached as current.
+    """
+    def bump():
+        cache.set_many({version_key(pk): uuid.uuid4().hex for pk in patient_ids}, None)
+
+    patient_ids = set(patient_ids)
+    if patient_ids:
+        bump()
+        transaction.on_commit(bump)
+
+
+def encode_cursor(entry):
+    payload = json.dumps({'t': entry['time'].isoformat(), 'k': entry['type'], 'i': entry['id']}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(encoded):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+        return datetime.fromisoformat(payload['t']), SOURCES[payload['k']]['rank'], int(payload['i'])
+    except (TypeError, ValueError, KeyError, binascii.Error):
+        raise NotFound(INVALID_CURSOR)
+
+
+def before(source, cursor):
+    """
+    Rows of one source strictly after the cursor in (time, kind, id) descending order.
+    """
+    time, rank, pk = cursor
+    field = source['time']
+    if source['rank'] < rank:
+        return Q(**{f'{field}__lte': time})
+    if source['rank'] > rank:
+        return Q(**{f'{field}__lt': time})
+    return Q(**{f'{field}__lt': time}) | Q(**{field: time, 'id__lt': pk})
+
+
+def source_entries(kind, user, patient_id, cursor, limit):
+    """
+    One query on the (patient, time) index of a source, newest first, limited
+    to the rows the user may see.
+    """
+    source = SOURCES[kind]
+    rows = scope_by_role(source['model'].objects.filter(patient_id=patient_id), user, doctor_field=source['doctor_field'])
+    if cursor is not None:
+        rows = rows.filter(before(source, cursor))
+    rows = rows.order_by(f"-{source['time']}", '-id').values(*source['fields'])[:limit]
+    for row in rows:
+        person = source['person']
+        first_name = row.pop(f'{person}__first_name') or ''
+        last_name = row.pop(f'{person}__last_name') or ''
+        row[f'{person}_name'] = f"{first_name} {last_name}".strip()
+        yield {'type': kind, 'time': row[source['time']], **row}
+
+
+def timeline_page(user, patient_id, cursor, page_size):
+    """
+    One page of the patient's appointments and medical records the user may see,
+    merged newest first. Each source is read lazily and only up to page_size + 1 rows.
+    """
+    decoded = decode_cursor(cursor) if cursor else None
+    merged = heapq.merge(
+        *(source_entries(kind, user, patient_id, decoded, page_size + 1) for kind in SOURCES),
+        key=lambda entry: (entry['time'], SOURCES[entry['type']]['rank'], entry['id']),
+        reverse=True,
+    )
+    entries = []
+    for entry in merged:
+        entries.append(entry)
+        if len(entries) > page_size:
+            break
+    has_more = len(entries) > page_size
+    entries = entries[:page_size]
+    return {
+        'next_cursor': encode_cursor(entries[-1]) if has_more else None,
+        'results': entries,
+    }
+
+
+def cached_timeline_page(user, patient_id, cursor, page_size):
+    """
+    timeline_page, cached per patient and viewer until one of the patient's
+    appointments or records changes. What a page holds depends on who reads it,
+    so the viewer is part of the key.
+    """
+    version = cache.get(version_key(patient_id))
+    if version is None:
+        # add() keeps whichever version a concurrent request stored first
+        cache.add(version_key(patient_id), uuid.uuid4().hex, None)
+        version = cache.get(version_key(patient_id))
+    key = f'timeline:{patient_id}:{user.pk}:{version}:{page_size}:{cursor or ""}'
+    page = cache.get(key)
+    if page is None:
+        page = timeline_page(user, patient_id, cursor, page_size)
+        cache.set(key, page, settings.TIMELINE_CACHE_TTL)
+    return page
@@ -1,6 +1,9 @@
 from django.urls import path
 from rest_framework_nested import routers
-from .views import MedicalRecordViewSet, MyMedicalHistoryView, PatientViewSet
+from .views import (
+    MedicalRecordAttachmentViewSet, MedicalRecordSearchView, MedicalRecordViewSet, MyMedicalHistoryExportView, MyMedicalHistoryView,
+    PatientTimelineView, PatientViewSet, DiagnosisAnalyticsView
+)
 
 router = routers.SimpleRouter()
 router.register(r'', PatientViewSet, basename='patients')
@@ -8,8 +11,20 @@ router.register(r'', PatientViewSet, basename='patients')
 records_router = routers.NestedSimpleRouter(router, r'', lookup='patient')
 records_router.register(r'records', MedicalRecordViewSet, basename='patient-records')
 
+attachments_router = routers.NestedSimpleRouter(records_router, r'records', lookup='record')
+attachments_router.register(r'attachments', MedicalRecordAttachmentViewSet, basename='record-attachments')
+
 
 
 urlpatterns = [
     path('my-history/', MyMedicalHistoryView.as_view(), name='my-medical-history'),
-] + router.urls + records_router.urls
\ No newline at end of file
+    path('my-history/export/', MyMedicalHistoryExportView.as_view(), name='my-medical-history-export'),
+    path('records/search/', MedicalRecordSearchView.as_view(), name='medical-record-search'),
+    path('analytics/top-diagnoses/', DiagnosisAnalyticsView.as_view(), {'report': 'top-diagnoses'},
+         name='analytics-top-diagnoses'),
+    path('analytics/visits-per-doctor/', DiagnosisAnalyticsView.as_view(), {'report': 'visits-per-doctor'},
+         name='analytics-visits-per-doctor'),
+    path('analytics/visits-per-week/', DiagnosisAnalyticsView.as_view(), {'report': 'visits-per-week'},
+         name='analytics-visits-per-week'),
+    path('<int:patient_pk>/timeline/', PatientTimelineView.as_view(), name='patient-timeline'),
+] + router.urls + records_router.urls + attachments_router.urls
\ No newline at end of file
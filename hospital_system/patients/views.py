@@ -1,39 +1,61 @@
-from django.shortcuts import render
-from rest_framework import viewsets, permissions, generics
-from .models import MedicalRecord, Patient
-from .serializers import MedicalRecordSerializer, PatientSerializer
-from .permissions import IsDoctorOrAdmin, CanViewPatients, CanViewMedicalRecords
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from rest_framework import mixins, viewsets, permissions, generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+from . import analytics
+from .attachments import attachment_response, write_chunk
+from .export import CSVRenderer, NDJSONRenderer, export_response
+from .models import MedicalRecord, MedicalRecordAttachment, Patient
+from .record_search import search_records
+from .search import search_patients
+from .serializers import (
+    AnalyticsQuerySerializer, MedicalRecordAttachmentSerializer, MedicalRecordSerializer, PatientSerializer, PatientSearchQuerySerializer,
+    RecordSearchQuerySerializer, TimelineQuerySerializer
+)
+from .timeline import cached_timeline_page
+from .permissions import IsDoctorOrAdmin, CanViewPatients, CanViewMedicalRecords, CanViewRecordAttachments
+from hospital_system.conditional import ConditionalGetMixin
+from hospital_system.ownership import scope_by_role
+from hospital_system.pagination import KeysetPagination
 
-class PatientViewSet(viewsets.ModelViewSet):
+class MedicalRecordPagination(KeysetPagination):
+    # Newest visits first, like the patient's own history
+    ordering = ('-visit_date', '-id')
+
+class PatientViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated, CanViewPatients]
     
     def get_queryset(self):
-        user = self.request.user
-        if user.role in ['DOCTOR', 'ADMIN']:
-            # Doctors and admins can see all patients
-            return Patient.objects.all()
-        elif user.role == 'PATIENT':
-            # Patients can only see their own profile
-            return Patient.objects.filter(user=user)
-        return Patient.objects.none()
-
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+        # Patients only see their own profile, doctors and admins all of them
+        return scope_by_role(Patient.objects.select_related('user'), self.request.user, patient_field='user')
+
+    @action(detail=False, permission_classes=[permissions.IsAuthenticated, IsDoctorOrAdmin])
+    def search(self, request):
+        """
+        Ranked patient search over name, phone number and date of birth, e.g.
+        ?q=rossi 1980-05-02. Served from the search indexes, never a table scan.
+        """
+        query = PatientSearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        patients = search_patients(query.validated_data['q'], query.validated_data['limit'])
+        return Response({'results': self.get_serializer(patients, many=True).data})
+
+class MedicalRecordViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = MedicalRecordSerializer
     permission_classes = [permissions.IsAuthenticated, CanViewMedicalRecords]
+    pagination_class = MedicalRecordPagination
 
     def get_queryset(self):
-        patient_pk = self.kwargs['patient_pk']
-        
-        # If patient is requesting their own records, return them
-        if self.request.user.role == 'PATIENT':
-            if str(self.request.user.id) == str(patient_pk):
-                return MedicalRecord.objects.filter(patient__user=self.request.user)
-            else:
-                return MedicalRecord.objects.none()
-        
-        # Doctors and admins can see all records for the patient
-        return MedicalRecord.objects.filter(patient_id=patient_pk)
+        # Patients only get their own records back, whatever patient_pk says
+        records = MedicalRecord.objects.select_related('created_by').filter(patient_id=self.kwargs['patient_pk'])
+        return scope_by_role(records, self.request.user)
     
     def perform_create(self, serializer):
         # Only doctors and admins can create medical records
@@ -42,14 +64,175 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Only doctors and admins can create medical records.")
             
         try:
-            patient = Patient.objects.get(user_id=self.kwargs['patient_pk'])
+            patient = Patient.objects.select_related('user').get(user_id=self.kwargs['patient_pk'])
             serializer.save(patient=patient, created_by=self.request.user)
         except Patient.DoesNotExist:
             raise ValueError("Patient does not exist.")
-        
+
+    @action(detail=False, renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request, patient_pk=None):
+        """
+        The patient's whole history as CSV (default) or NDJSON (?format=ndjson), streamed.
+        """
+        return export_response(self.get_queryset(), request.accepted_renderer, f'medical-records-{patient_pk}')
+
+class MedicalRecordAttachmentViewSet(mixins.CreateModelMixin, mixins.ListModelMixin, mixins.RetrieveModelMixin,
+                                     mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    """
+    Files attached to a medical record. POST announces a file (name, type, size),
+    then its bytes are sent in any number of PATCH .../upload/ requests, each with
+    an Upload-Offset header equal to the bytes received so far. An interrupted
+    upload resumes from the "received" of the attachment.
+    """
+    serializer_class = MedicalRecordAttachmentSerializer
+    permission_classes = [permissions.IsAuthenticated, CanViewRecordAttachments]
+
+    def get_queryset(self):
+        return MedicalRecordAttachment.objects.select_related('record').filter(
+            record_id=self.kwargs['record_pk'], record__patient_id=self.kwargs['patient_pk']
+        )
+
+    def perform_create(self, serializer):
+        record = get_object_or_404(MedicalRecord, pk=self.kwargs['record_pk'], patient_id=self.kwargs['patient_pk'])
+        serializer.save(record=record, uploaded_by=self.request.user)
+
+    @action(detail=True, methods=['patch'])
+    def upload(self, request, patient_pk=None, record_pk=None, pk=None):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError({'Upload-Offset': "Required, the number of bytes already received."})
+
+        with transaction.atomic():
+            # The row lock keeps two clients from appending the same range at once
+            attachment = get_object_or_404(self.get_queryset().select_for_update(), pk=pk)
+            self.check_object_permissions(request, attachment)
+            headers = {'Upload-Offset': str(attachment.received)}
+            if attachment.status == MedicalRecordAttachment.Status.COMPLETE or offset != attachment.received:
+                return Response(
+                    {'detail': "Upload-Offset does not match the bytes received so far.", 'received': attachment.received},
+                    status=status.HTTP_409_CONFLICT, headers=headers,
+                )
+            if offset + length > attachment.size:
+                raise ValidationError({'detail': "The chunk runs past the announced size."})
+
+            # request.stream reads the body as it arrives instead of loading it first
+            attachment.received = offset + write_chunk(attachment, offset, request.stream, length)
+            update_fields = ['received']
+            if attachment.received == attachment.size:
+                attachment.status = MedicalRecordAttachment.Status.COMPLETE
+                attachment.completed_at = timezone.now()
+                update_fields += ['status', 'completed_at']
+            attachment.save(update_fields=update_fields)
+
+        return Response(self.get_serializer(attachment).data, headers={'Upload-Offset': str(attachment.received)})
+
+    @action(detail=True)
+    def download(self, request, patient_pk=None, record_pk=None, pk=None):
+        """
+        The file itself, sent by nginx after this permission check (X-Accel-Redirect).
+        """
+        attachment = self.get_object()
+        if attachment.status != MedicalRecordAttachment.Status.COMPLETE:
+            raise Http404
+        return attachment_response(request, attachment)
+
+
 class MyMedicalHistoryView(generics.ListAPIView):
     serializer_class = MedicalRecordSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = MedicalRecordPagination
 
     def get_queryset(self):
-        return MedicalRecord.objects.filter(patient__user=self.request.user).order_by('-visit_date')
\ No newline at end of file
+        return (
+            MedicalRecord.objects
+            .select_related('created_by')
+            .filter(patient_id=self.request.user.pk)
+            .order_by('-visit_date')
+        )
+
+
+class MedicalRecordSearchView(generics.GenericAPIView):
+    """
+    Full-text search over diagnosis, treatment and notes, best match first.
+    Patients only ever search their own records, like in MedicalRecordViewSet.
+    """
+    serializer_class = MedicalRecordSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        query = RecordSearchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        patient_id = params.get('patient')
+        if request.user.role == 'PATIENT':
+            patient_id = request.user.id
+        elif request.user.role not in ['DOCTOR', 'ADMIN']:
+            return Response({'results': []})
+
+        records = search_records(params['q'], patient_id=patient_id, limit=params['limit'])
+        return Response({'results': self.get_serializer(records, many=True).data})
+
+
+class MyMedicalHistoryExportView(generics.GenericAPIView):
+    """
+    The requesting patient's own history as CSV (default) or NDJSON (?format=ndjson), streamed.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    renderer_classes = [CSVRenderer, NDJSONRenderer]
+
+    def get(self, request):
+        records = MedicalRecord.objects.filter(patient_id=request.user.pk)
+        return export_response(records, request.accepted_renderer, 'medical-history')
+
+
+class PatientTimelineView(generics.GenericAPIView):
+    """
+    A patient's appointments and medical records interleaved newest first, paged
+    with ?cursor= from the previous page's "next". Same access rules as the records,
+    and doctors only see their own appointments, as in the appointment list.
+    """
+    permission_classes = [permissions.IsAuthenticated, CanViewMedicalRecords]
+
+    def get(self, request, patient_pk):
+        query = TimelineQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        page = cached_timeline_page(
+            request.user, patient_pk, query.validated_data.get('cursor'), query.validated_data['page_size']
+        )
+
+        next_url = None
+        if page['next_cursor']:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', page['next_cursor'])
+        return Response({'next': next_url, 'results': page['results']})
+
+
+# Report name (from the URL) -> rows for the user and the validated query
+DIAGNOSIS_REPORTS = {
+    'top-diagnoses': lambda user, params: analytics.top_diagnoses(
+        user, params['first_day'], params['last_day'], params['limit']
+    ),
+    'visits-per-doctor': lambda user, params: analytics.visits_per_doctor(user, params['first_day'], params['last_day']),
+    'visits-per-week': lambda user, params: analytics.visits_per_week(user, params['first_day'], params['last_day']),
+}
+
+
+class DiagnosisAnalyticsView(APIView):
+    """
+    The read-only diagnosis reports. They read the per-day summary counters,
+    never the records, so a long range costs about as much as a short one.
+    Doctors see their own visits, admins everyone's.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsDoctorOrAdmin]
+
+    def get(self, request, report):
+        query = AnalyticsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        return Response({
+            'from': params['first_day'],
+            'to': params['last_day'],
+            'results': DIAGNOSIS_REPORTS[report](request.user, params),
+        })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Appointment, DoctorSchedule
+from .models import Appointment, AppointmentSeries, DoctorSchedule, WaitlistEntry
 
 @admin.register(Appointment)
 class AppointmentAdmin(admin.ModelAdmin):
@@ -7,6 +7,16 @@ class AppointmentAdmin(admin.ModelAdmin):
     list_filter = ('status', 'doctor')
     search_fields = ('patient__first_name', 'patient__last_name', 'doctor__first_name', 'doctor__last_name', 'patient__user__username')
 
+@admin.register(AppointmentSeries)
+class AppointmentSeriesAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'doctor', 'frequency', 'interval', 'start_time')
+    list_filter = ('frequency', 'doctor')
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ('patient', 'doctor', 'earliest', 'latest', 'status')
+    list_filter = ('status', 'doctor')
+
 @admin.register(DoctorSchedule)
 class DoctorScheduleAdmin(admin.ModelAdmin):
     list_display = ('doctor', 'start_time', 'end_time')
@@ -0,0 +1,15 @@
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication
+from .models import CalendarFeed
+
+
+class CalendarFeedAuthentication(BaseAuthentication):
+    """
+    The key in a calendar subscription URL, for the feed view only.
+    """
+    def authenticate(self, request):
+        key = request.parser_context['kwargs'].get('key')
+        feed = CalendarFeed.objects.select_related('user').filter(key=key).first()
+        if feed is None or not feed.user.is_active:
+            raise exceptions.AuthenticationFailed('Invalid calendar feed.')
+        return feed.user, feed
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+from django.utils import timezone
+from .models import Appointment
+
+
+def merge_intervals(intervals):
+    """
+    Sort (start, end) pairs and merge the ones that overlap or touch.
+    """
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(windows, busy):
+    """
+    Remove the busy intervals from the windows in a single sweep.
+    Both lists must be sorted and merged (see merge_intervals).
+    """
+    free = []
+    i = 0
+    for window_start, window_end in windows:
+        cursor = window_start
+        # Busy intervals that end before this window can never matter again
+        while i < len(busy) and busy[i][1] <= cursor:
+            i += 1
+
+        j = i
+        while j < len(busy) and busy[j][0] < window_end:
+            busy_start, busy_end = busy[j]
+            if busy_start > cursor:
+                free.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+            j += 1
+
+        if cursor < window_end:
+            free.append((cursor, window_end))
+    return free
+
+
+def split_into_slots(free, duration):
+    """
+    Cut every free interval into back-to-back slots of the given timedelta.
+    """
+    slots = []
+    for start, end in free:
+        slot_start = start
+        while slot_start + duration <= end:
+            slots.append((slot_start, slot_start + duration))
+            slot_start += duration
+    return slots
+
+
+def schedule_windows(schedules, range_start, range_end):
+    """
+    Expand the daily DoctorSchedule times into concrete datetime windows
+    for every day in the range, clipped to the range itself.
+    """
+    tz = timezone.get_current_timezone()
+    windows = []
+    day = timezone.localtime(range_start, tz).date()
+    last_day = timezone.localtime(range_end, tz).date()
+
+    while day <= last_day:
+        for start_time, end_time in schedules:
+            start = timezone.make_aware(datetime.combine(day, start_time), tz)
+            end = timezone.make_aware(datetime.combine(day, end_time), tz)
+            # A window like 22:00 - 06:00 runs over midnight
+            if end <= start:
+                end += timedelta(days=1)
+            start = max(start, range_start)
+            end = min(end, range_end)
+            if start < end:
+                windows.append((start, end))
+        day += timedelta(days=1)
+
+    return merge_intervals(windows)
+
+
+def find_available_slots(doctor, range_start, range_end, duration):
+    """
+    Free slots of the doctor between range_start and range_end.
+    Costs one query for the schedule and one range query for the appointments.
+    """
+    schedules = doctor.schedule.values_list('start_time', 'end_time')
+    windows = schedule_windows(list(schedules), range_start, range_end)
+    if not windows:
+        return []
+
+    busy = (
+        Appointment.objects
+        .filter(doctor=doctor, start_time__lt=range_end, end_time__gt=range_start)
+        .exclude(status=Appointment.AppointmentStatus.CANCELLED)
+        .values_list('start_time', 'end_time')
+    )
+    free = subtract_intervals(windows, merge_intervals(busy))
+    return split_into_slots(free, duration)
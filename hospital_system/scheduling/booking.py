@@ -0,0 +1,211 @@
+import time
+from datetime import timedelta
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from patients.timeline import invalidate_timeline
+from users.models import CustomUser
+from .models import Appointment, AppointmentSeries
+
+# Name of the PostgreSQL exclusion constraint created in migration 0002
+OVERLAP_CONSTRAINT = 'scheduling_appointment_no_overlap'
+
+SQLITE_LOCK_RETRIES = 10
+SQLITE_LOCK_BACKOFF = 0.05
+
+
+class AppointmentConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The doctor already has an appointment in this time slot.'
+    default_code = 'appointment_conflict'
+
+    def __init__(self, conflicting_ids=None):
+        super().__init__()
+        if conflicting_ids:
+            # Kept as a plain dict so the ids stay integers in the response
+            self.detail = {'detail': self.detail, 'conflicting_appointments': list(conflicting_ids)}
+
+
+def lock_doctor(doctor_id):
+    """
+    Serialize bookings for one doctor until the surrounding transaction ends.
+    PostgreSQL locks the doctor row. SQLite has no row locks, so a no-op write
+    takes the database write lock up front instead (retrying while another
+    connection holds it).
+    """
+    if connection.features.has_select_for_update:
+        list(CustomUser.objects.select_for_update().filter(pk=doctor_id).values_list('pk', flat=True))
+        return
+
+    for attempt in range(SQLITE_LOCK_RETRIES):
+        try:
+            # Its own savepoint, so a failed attempt leaves the caller's transaction usable
+            with transaction.atomic():
+                CustomUser.objects.filter(pk=doctor_id).update(role=F('role'))
+            return
+        except OperationalError as e:
+            if 'locked' not in str(e) or attempt == SQLITE_LOCK_RETRIES - 1:
+                raise
+            time.sleep(SQLITE_LOCK_BACKOFF * (attempt + 1))
+
+
+def conflicting_appointments(doctor_id, start_time, end_time, exclude_id=None):
+    """
+    Non-cancelled appointments of the doctor overlapping [start_time, end_time).
+    """
+    queryset = (
+        Appointment.objects
+        .filter(doctor_id=doctor_id, start_time__lt=end_time, end_time__gt=start_time)
+        .exclude(status=Appointment.AppointmentStatus.CANCELLED)
+    )
+    if exclude_id is not None:
+        queryset = queryset.exclude(pk=exclude_id)
+    return queryset
+
+
+def save_without_overlap(serializer, **kwargs):
+    """
+    Save an appointment serializer inside a transaction that holds the doctor
+    lock, raising AppointmentConflict (HTTP 409) instead of double-booking.
+    """
+    instance = serializer.instance
+    data = {**serializer.validated_data, **kwargs}
+
+    doctor = data.get('doctor', getattr(instance, 'doctor', None))
+    start_time = data.get('start_time', getattr(instance, 'start_time', None))
+    end_time = data.get('end_time', getattr(instance, 'end_time', None))
+    appointment_status = data.get('status', getattr(instance, 'status', Appointment.AppointmentStatus.SCHEDULED))
+
+    try:
+        with transaction.atomic():
+            if appointment_status != Appointment.AppointmentStatus.CANCELLED:
+                lock_doctor(doctor.pk)
+                conflicts = conflicting_appointments(
+                    doctor.pk, start_time, end_time, exclude_id=getattr(instance, 'pk', None)
+                )
+                conflicting_ids = list(conflicts.values_list('pk', flat=True)[:10])
+                if conflicting_ids:
+                    raise AppointmentConflict(conflicting_ids)
+            return serializer.save(**kwargs)
+    except IntegrityError as e:
+        # The exclusion constraint caught a booking the lock didn't see
+        if OVERLAP_CONSTRAINT in str(e):
+            raise AppointmentConflict()
+        raise
+
+
+
+def find_conflicts(doctor_id, intervals, exclude_series=None):
+    """
+    Ids of the doctor's non-cancelled appointments overlapping any of the sorted,
+    non-overlapping intervals. One range query plus a sweep over both lists.
+    """
+    if not intervals:
+        return []
+    busy = conflicting_appointments(doctor_id, intervals[0][0], intervals[-1][1]).order_by('start_time')
+    if exclude_series is not None:
+        busy = busy.exclude(series=exclude_series)
+    busy = list(busy.values_list('pk', 'start_time', 'end_time'))
+
+    conflicts = []
+    i = 0
+    for start, end in intervals:
+        while i < len(busy) and busy[i][2] <= start:
+            i += 1
+        j = i
+        while j < len(busy) and busy[j][1] < end:
+            if busy[j][2] > start and busy[j][0] not in conflicts:
+                conflicts.append(busy[j][0])
+            j += 1
+    return conflicts
+
+
+def upcoming_occurrences(series):
+    return series.appointments.filter(
+        start_time__gte=timezone.now(), status=Appointment.AppointmentStatus.SCHEDULED
+    )
+
+
+def create_series(validated_data):
+    """
+    Save a series and bulk-insert all of its occurrences after a single
+    conflict check, or raise AppointmentConflict.
+    """
+    series = AppointmentSeries(**validated_data)
+    occurrences = series.occurrences()
+    try:
+        with transaction.atomic():
+            lock_doctor(series.doctor_id)
+            conflicts = find_conflicts(series.doctor_id, occurrences)
+            if conflicts:
+                raise AppointmentConflict(conflicts[:10])
+            series.save()
+            Appointment.objects.bulk_create([
+                Appointment(
+                    series=series, patient=series.patient, doctor=series.doctor,
+                    start_time=start, end_time=end, notes=series.notes
+                )
+                for start, end in occurrences
+            ])
+            invalidate_timeline([series.patient_id])
+    except IntegrityError as e:
+        if OVERLAP_CONSTRAINT in str(e):
+            raise AppointmentConflict()
+        raise
+    return series
+
+
+def update_series(series, validated_data):
+    """
+    Apply a new start time, duration or notes to every upcoming occurrence with
+    one UPDATE. A start time change shifts the occurrences by the same delta.
+    """
+    shift = validated_data.get('start_time', series.start_time) - series.start_time
+    length = timedelta(minutes=validated_data.get('duration', series.duration))
+    upcoming = upcoming_occurrences(series)
+
+    changes = {}
+    if 'notes' in validated_data:
+        changes['notes'] = validated_data['notes']
+    if shift or length != timedelta(minutes=series.duration):
+        changes['start_time'] = F('start_time') + shift
+        changes['end_time'] = F('start_time') + shift + length
+
+    try:
+        with transaction.atomic():
+            if 'start_time' in changes:
+                lock_doctor(series.doctor_id)
+                intervals = [
+                    (start + shift, start + shift + length)
+                    for start in upcoming.order_by('start_time').values_list('start_time', flat=True)
+                ]
+                conflicts = find_conflicts(series.doctor_id, intervals, exclude_series=series)
+                if conflicts:
+                    raise AppointmentConflict(conflicts[:10])
+            if changes:
+                upcoming.update(updated_at=timezone.now(), **changes)
+                invalidate_timeline([series.patient_id])
+            for field, value in validated_data.items():
+                setattr(series, field, value)
+            series.save()
+    except IntegrityError as e:
+        if OVERLAP_CONSTRAINT in str(e):
+            raise AppointmentConflict()
+        raise
+    return series
+
+
+def cancel_series(series):
+    """
+    Cancel every upcoming occurrence with one UPDATE; returns the cancelled ids.
+    """
+    with transaction.atomic():
+        upcoming = upcoming_occurrences(series).select_for_update()
+        cancelled_ids = list(upcoming.values_list('pk', flat=True))
+        Appointment.objects.filter(pk__in=cancelled_ids).update(
+            status=Appointment.AppointmentStatus.CANCELLED, updated_at=timezone.now()
+        )
+        invalidate_timeline([series.patient_id])
+    return cancelled_ids
@@ -0,0 +1,101 @@
+from datetime import timezone as dt_timezone
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+CHUNK_SIZE = 500
+PRODID = '-//Hospital Management System//Appointments//EN'
+
+FEED_FIELDS = (
+    'id', 'start_time', 'end_time', 'status', 'notes', 'updated_at',
+    'doctor__first_name', 'doctor__last_name',
+    'patient__user__first_name', 'patient__user__last_name',
+)
+
+ICAL_STATUS = {
+    'SCHEDULED': 'CONFIRMED',
+    'COMPLETED': 'CONFIRMED',
+    'CANCELLED': 'CANCELLED',
+}
+
+
+class ICalendarRenderer(BaseRenderer):
+    """
+    Lets calendar clients that send Accept: text/calendar through content
+    negotiation. The feed itself is streamed, so this only renders errors.
+    """
+    media_type = 'text/calendar'
+    format = 'ics'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict) and 'detail' in data:
+            return str(data['detail']).encode(self.charset)
+        return str(data or '').encode(self.charset)
+
+
+def escape(text):
+    return (
+        (text or '')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """
+    Lines longer than 75 octets continue on the next line after a space (RFC 5545 3.1).
+    """
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Never split a multi-byte character
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def stream_calendar(queryset, name, host):
+    """
+    Yield the VCALENDAR line by line, reading appointments in chunks so
+    memory stays flat however long the history is.
+    """
+    yield 'BEGIN:VCALENDAR\r\n'
+    yield 'VERSION:2.0\r\n'
+    yield f'PRODID:{PRODID}\r\n'
+    yield 'CALSCALE:GREGORIAN\r\n'
+    yield fold(f'X-WR-CALNAME:{escape(name)}')
+
+    stamp = format_datetime(timezone.now())
+    rows = queryset.order_by('start_time', 'id').values(*FEED_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    for row in rows:
+        doctor = f"{row['doctor__first_name']} {row['doctor__last_name']}".strip()
+        patient = f"{row['patient__user__first_name']} {row['patient__user__last_name']}".strip()
+        lines = [
+            'BEGIN:VEVENT',
+            f"UID:appointment-{row['id']}@{host}",
+            f'DTSTAMP:{stamp}',
+            f"DTSTART:{format_datetime(row['start_time'])}",
+            f"DTEND:{format_datetime(row['end_time'])}",
+            f"LAST-MODIFIED:{format_datetime(row['updated_at'])}",
+            f"SUMMARY:{escape(f'Appointment: {patient} with Dr. {doctor}')}",
+            f"STATUS:{ICAL_STATUS.get(row['status'], 'CONFIRMED')}",
+        ]
+        if row['notes']:
+            lines.append(f"DESCRIPTION:{escape(row['notes'])}")
+        lines.append('END:VEVENT')
+        yield ''.join(fold(line) for line in lines)
+
+    yield 'END:VCALENDAR\r\n'
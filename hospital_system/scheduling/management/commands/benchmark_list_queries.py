@@ -0,0 +1,211 @@
+import os
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from patients.models import MedicalRecord, Patient
+from scheduling.models import Appointment
+from users.models import CustomUser
+
+BENCH_PREFIX = 'bench_'
+# The composite indexes this benchmark compares; any other index is left alone
+BENCHMARKED_INDEXES = {
+    Appointment: ['appointment_doctor_start_idx', 'appointment_patient_start_idx', 'appointment_status_start_idx'],
+    MedicalRecord: ['record_patient_visit_idx'],
+}
+TARGET_MS = 10
+
+
+def is_scratch_database():
+    # An in-memory database or one named like Django's test databases
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        return True
+    return os.path.basename(str(connection.settings_dict['NAME'])).startswith('test_')
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large data set and compare the list-endpoint queries with and '
+        'without the composite indexes on Appointment and MedicalRecord'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=10_000)
+        parser.add_argument('--appointments', type=int, default=1_000_000)
+        parser.add_argument('--records', type=int, default=1_000_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query, the median is reported')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows seeded by a previous run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows when done')
+        parser.add_argument(
+            '--i-know', action='store_true',
+            help='Run against a database that is not a scratch one: it drops indexes and writes millions of rows'
+        )
+
+    def handle(self, *args, **options):
+        if not (options['i_know'] or is_scratch_database()):
+            raise CommandError(
+                f"{connection.settings_dict['NAME']} does not look like a scratch database. This command drops "
+                f"indexes and seeds millions of rows; pass --i-know to run it anyway."
+            )
+        if not options['skip_seed']:
+            self.seed(options)
+
+        doctor = CustomUser.objects.filter(username__startswith=BENCH_PREFIX, role=CustomUser.Role.DOCTOR).first()
+        patient = Patient.objects.filter(user__username__startswith=BENCH_PREFIX).first()
+        if doctor is None or patient is None:
+            self.stderr.write(self.style.ERROR('No benchmark data found, run without --skip-seed first.'))
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        queries = self.list_queries(doctor, patient)
+        try:
+            self.set_indexes(present=False)
+            without = self.measure(queries, options['repeat'], 'without composite indexes')
+        finally:
+            self.set_indexes(present=True)
+        with_indexes = self.measure(queries, options['repeat'], 'with composite indexes')
+
+        self.stdout.write('')
+        self.stdout.write(f"{'query':<36} {'before':>10} {'after':>10}")
+        for label, _ in queries:
+            after = with_indexes[label]
+            style = self.style.SUCCESS if after < TARGET_MS else self.style.WARNING
+            self.stdout.write(style(f"{label:<36} {without[label]:>8.2f}ms {after:>8.2f}ms"))
+
+        if options['cleanup']:
+            self.cleanup()
+
+    def seed(self, options):
+        batch_size = options['batch_size']
+        password = make_password(None)
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            doctors = CustomUser.objects.bulk_create(
+                CustomUser(username=f"{BENCH_PREFIX}doctor_{i}", password=password, role=CustomUser.Role.DOCTOR)
+                for i in range(options['doctors'])
+            )
+            users = CustomUser.objects.bulk_create(
+                (CustomUser(username=f"{BENCH_PREFIX}patient_{i}", password=password, role=CustomUser.Role.PATIENT)
+                 for i in range(options['patients'])),
+                batch_size=batch_size,
+            )
+            Patient.objects.bulk_create(
+                (Patient(user=user, date_of_birth='1980-01-01', address='Benchmark', phone_number=str(i))
+                 for i, user in enumerate(users)),
+                batch_size=batch_size,
+            )
+        self.stdout.write(f"Seeded {len(doctors)} doctors and {len(users)} patients")
+
+        doctor_ids = [doctor.id for doctor in doctors]
+        patient_ids = [user.id for user in users]
+        statuses = [choice for choice, _ in Appointment.AppointmentStatus.choices]
+        base = timezone.now() - timedelta(days=365)
+        slot = timedelta(minutes=30)
+
+        def appointments():
+            for i in range(options['appointments']):
+                # Round-robin over doctors so one doctor's slots never overlap
+                start = base + slot * (i // len(doctor_ids))
+                yield Appointment(
+                    doctor_id=doctor_ids[i % len(doctor_ids)],
+                    patient_id=random.choice(patient_ids),
+                    start_time=start,
+                    end_time=start + slot,
+                    status=random.choice(statuses),
+                )
+
+        def records():
+            for _ in range(options['records']):
+                yield MedicalRecord(
+                    patient_id=random.choice(patient_ids),
+                    created_by_id=random.choice(doctor_ids),
+                    diagnosis='Benchmark diagnosis',
+                    treatment='Benchmark treatment',
+                )
+
+        self.bulk_insert(Appointment, appointments(), options['appointments'], batch_size)
+        self.bulk_insert(MedicalRecord, records(), options['records'], batch_size)
+        self.stdout.write(f"Seeding took {time.perf_counter() - started:.1f}s")
+
+    def bulk_insert(self, model, rows, total, batch_size):
+        inserted = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                inserted += len(batch)
+                batch = []
+                self.stdout.write(f"\r{model.__name__}: {inserted}/{total}", ending='')
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+            inserted += len(batch)
+        self.stdout.write(f"\r{model.__name__}: {inserted}/{total}")
+
+    def list_queries(self, doctor, patient):
+        """
+        The querysets behind the appointment and medical record list endpoints.
+        """
+        month_start = timezone.now() - timedelta(days=30)
+        month_end = timezone.now()
+        return [
+            ('appointments of a doctor', Appointment.objects.filter(
+                doctor=doctor, start_time__range=(month_start, month_end)).order_by('start_time')[:20]),
+            ('appointments of a patient', Appointment.objects.filter(
+                patient__user=patient.user).order_by('start_time')[:20]),
+            ('appointments by status', Appointment.objects.filter(
+                status=Appointment.AppointmentStatus.SCHEDULED,
+                start_time__range=(month_start, month_end)).order_by('start_time')[:20]),
+            ('medical history of a patient', MedicalRecord.objects.filter(
+                patient__user=patient.user).order_by('-visit_date')[:20]),
+        ]
+
+    def measure(self, queries, repeat, phase):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nQuery plans {phase}:"))
+        timings = {}
+        for label, queryset in queries:
+            self.stdout.write(f"  {label}:")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"    {line}")
+
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[label] = statistics.median(samples)
+        return timings
+
+    def set_indexes(self, present):
+        with connection.schema_editor() as editor:
+            for model, names in BENCHMARKED_INDEXES.items():
+                for index in (index for index in model._meta.indexes if index.name in names):
+                    if present:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+
+    def cleanup(self):
+        # Raw DELETEs: .delete() would load every row and run its post_delete signals,
+        # millions of queries for a full seed. The seeded rows have nothing else pointing at them.
+        bench_users = CustomUser.objects.filter(username__startswith=BENCH_PREFIX).values('pk')
+        with transaction.atomic():
+            for rows in (
+                Appointment.objects.filter(doctor_id__in=bench_users),
+                MedicalRecord.objects.filter(patient_id__in=bench_users),
+                Patient.objects.filter(user_id__in=bench_users),
+                CustomUser.objects.filter(pk__in=bench_users),
+            ):
+                rows._raw_delete(rows.db)
+        self.stdout.write(self.style.SUCCESS('Removed benchmark data'))
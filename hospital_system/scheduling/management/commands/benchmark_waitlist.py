@@ -0,0 +1,141 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from patients.models import Patient
+from scheduling.models import WaitlistEntry
+from scheduling.waitlist import waiting_candidates
+from users.models import CustomUser
+
+BENCH_PREFIX = 'bench_waitlist_'
+TARGET_MS = 10
+
+
+class Command(BaseCommand):
+    help = 'Seed a large waitlist and time the candidate query the matcher runs for every cancelled slot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--patients', type=int, default=10_000)
+        parser.add_argument('--entries', type=int, default=100_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query, the median is reported')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse rows seeded by a previous run')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded rows when done')
+
+    def handle(self, *args, **options):
+        if not options['skip_seed']:
+            self.seed(options)
+
+        doctors = list(
+            CustomUser.objects.filter(username__startswith=BENCH_PREFIX, role=CustomUser.Role.DOCTOR)
+            .values_list('pk', flat=True)
+        )
+        if not doctors:
+            self.stderr.write(self.style.ERROR('No benchmark data found, run without --skip-seed first.'))
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        # Random 30 minute slots over the seeded period, the same ones for both runs
+        rng = random.Random(0)
+        now = timezone.now()
+        slots = []
+        for _ in range(options['repeat']):
+            start = now + timedelta(minutes=30 * rng.randrange(0, 2 * 48 * 60))
+            slots.append((rng.choice(doctors), start, start + timedelta(minutes=30)))
+
+        index = next(index for index in WaitlistEntry._meta.indexes if index.name == 'waitlist_match_idx')
+        try:
+            with connection.schema_editor() as editor:
+                editor.remove_index(WaitlistEntry, index)
+            without = self.measure(slots, 'without waitlist_match_idx')
+        finally:
+            with connection.schema_editor() as editor:
+                editor.add_index(WaitlistEntry, index)
+        with_index = self.measure(slots, 'with waitlist_match_idx')
+
+        style = self.style.SUCCESS if with_index < TARGET_MS else self.style.WARNING
+        self.stdout.write('')
+        self.stdout.write(f"{'query':<24} {'before':>10} {'after':>10}")
+        self.stdout.write(style(f"{'best candidate':<24} {without:>8.2f}ms {with_index:>8.2f}ms"))
+
+        if options['cleanup']:
+            self.cleanup()
+
+    def seed(self, options):
+        batch_size = options['batch_size']
+        password = make_password(None)
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            doctors = CustomUser.objects.bulk_create(
+                CustomUser(username=f"{BENCH_PREFIX}doctor_{i}", password=password, role=CustomUser.Role.DOCTOR)
+                for i in range(options['doctors'])
+            )
+            users = CustomUser.objects.bulk_create(
+                (CustomUser(username=f"{BENCH_PREFIX}patient_{i}", password=password, role=CustomUser.Role.PATIENT)
+                 for i in range(options['patients'])),
+                batch_size=batch_size,
+            )
+            patients = Patient.objects.bulk_create(
+                (Patient(user=user, date_of_birth='1980-01-01', address='Benchmark', phone_number=str(i))
+                 for i, user in enumerate(users)),
+                batch_size=batch_size,
+            )
+
+        doctor_ids = [doctor.pk for doctor in doctors]
+        patient_ids = [patient.pk for patient in patients]
+        now = timezone.now()
+        statuses = [WaitlistEntry.Status.WAITING] * 4 + [WaitlistEntry.Status.BOOKED]
+
+        batch = []
+        inserted = 0
+        for _ in range(options['entries']):
+            # Windows of a few hours up to three weeks, spread over the next 100 days
+            earliest = now + timedelta(minutes=random.randrange(0, 100 * 24 * 60))
+            batch.append(WaitlistEntry(
+                patient_id=random.choice(patient_ids),
+                doctor_id=random.choice(doctor_ids),
+                earliest=earliest,
+                latest=earliest + timedelta(hours=random.randrange(2, 21 * 24)),
+                duration=random.choice((15, 30, 45, 60)),
+                status=random.choice(statuses),
+            ))
+            if len(batch) == batch_size:
+                with transaction.atomic():
+                    WaitlistEntry.objects.bulk_create(batch)
+                inserted += len(batch)
+                batch = []
+                self.stdout.write(f"\rWaitlistEntry: {inserted}/{options['entries']}", ending='')
+        if batch:
+            with transaction.atomic():
+                WaitlistEntry.objects.bulk_create(batch)
+            inserted += len(batch)
+        self.stdout.write(f"\rWaitlistEntry: {inserted}/{options['entries']}")
+        self.stdout.write(f"Seeding took {time.perf_counter() - started:.1f}s")
+
+    def measure(self, slots, phase):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\nQuery plan {phase}:"))
+        doctor_id, start, end = slots[0]
+        for line in waiting_candidates(doctor_id, start, end)[:1].explain().splitlines():
+            self.stdout.write(f"    {line}")
+
+        samples = []
+        for doctor_id, start, end in slots:
+            started = time.perf_counter()
+            waiting_candidates(doctor_id, start, end).first()
+            samples.append((time.perf_counter() - started) * 1000)
+        return statistics.median(samples)
+
+    def cleanup(self):
+        bench_users = CustomUser.objects.filter(username__startswith=BENCH_PREFIX)
+        WaitlistEntry.objects.filter(doctor__in=bench_users).delete()
+        Patient.objects.filter(user__in=bench_users).delete()
+        bench_users.delete()
+        self.stdout.write(self.style.SUCCESS('Removed benchmark data'))
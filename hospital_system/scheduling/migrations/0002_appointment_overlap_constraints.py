@@ -0,0 +1,77 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:27
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, F, OuterRef
+
+# How many offending ids the error lists
+SHOWN_IDS = 50
+
+
+def check_existing_appointments(apps, schema_editor):
+    """
+    Nothing stopped double bookings or empty slots before these constraints, so
+    look for rows that would break them and stop with their ids, rather than
+    failing half way through adding the constraints. They need a person to
+    decide which booking to move or cancel, so nothing is changed here.
+    """
+    Appointment = apps.get_model('scheduling', 'Appointment')
+    db = schema_editor.connection.alias
+    problems = []
+    empty = list(
+        Appointment.objects.using(db).filter(end_time__lte=F('start_time')).order_by('pk').values_list('pk', flat=True)
+    )
+    if empty:
+        problems.append(f"ending at or before their start: {empty[:SHOWN_IDS]}")
+    if schema_editor.connection.vendor == 'postgresql':
+        active = Appointment.objects.using(db).exclude(status='CANCELLED')
+        clashing = active.filter(Exists(active.filter(
+            doctor_id=OuterRef('doctor_id'), start_time__lt=OuterRef('end_time'), end_time__gt=OuterRef('start_time'),
+        ).exclude(pk=OuterRef('pk'))))
+        overlapping = list(clashing.order_by('pk').values_list('pk', flat=True))
+        if overlapping:
+            problems.append(f"overlapping another active appointment of the same doctor: {overlapping[:SHOWN_IDS]}")
+    if problems:
+        raise RuntimeError(
+            "Cannot add the appointment constraints, fix or cancel these appointments first. Appointments "
+            + "; ".join(problems)
+        )
+
+
+def add_overlap_exclusion(apps, schema_editor):
+    # tstzrange exclusion constraints only exist on PostgreSQL; SQLite relies on
+    # the write lock taken in scheduling.booking.lock_doctor instead
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        "ALTER TABLE scheduling_appointment ADD CONSTRAINT scheduling_appointment_no_overlap "
+        "EXCLUDE USING gist (doctor_id WITH =, tstzrange(start_time, end_time, '[)') WITH &&) "
+        "WHERE (status <> 'CANCELLED')"
+    )
+
+
+def remove_overlap_exclusion(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE scheduling_appointment DROP CONSTRAINT IF EXISTS scheduling_appointment_no_overlap'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0001_initial'),
+        ('scheduling', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_existing_appointments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.CheckConstraint(condition=models.Q(('end_time__gt', models.F('start_time'))), name='appointment_end_after_start'),
+        ),
+        migrations.RunPython(add_overlap_exclusion, remove_overlap_exclusion),
+    ]
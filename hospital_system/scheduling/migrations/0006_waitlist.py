@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 19:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0002_composite_indexes'),
+        ('scheduling', '0005_appointment_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('earliest', models.DateTimeField(help_text='Earliest acceptable start')),
+                ('latest', models.DateTimeField(help_text='Latest acceptable end')),
+                ('duration', models.PositiveIntegerField(default=30, help_text='Minutes needed')),
+                ('status', models.CharField(choices=[('WAITING', 'Waiting'), ('BOOKED', 'Booked')], default='WAITING', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='scheduling.appointment')),
+                ('doctor', models.ForeignKey(limit_choices_to={'role': 'DOCTOR'}, on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='waitlist_entries', to='patients.patient')),
+            ],
+            options={
+                'verbose_name_plural': 'waitlist entries',
+                'indexes': [models.Index(fields=['doctor', 'status', 'earliest'], name='waitlist_match_idx')],
+            },
+        ),
+    ]
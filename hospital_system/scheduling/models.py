@@ -1,5 +1,8 @@
+import secrets
+from datetime import timedelta
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from patients.models import Patient
 
 class Appointment(models.Model):
@@ -28,6 +31,134 @@ class Appointment(models.Model):
         default=AppointmentStatus.SCHEDULED
     )
     notes = models.TextField(blank=True, null=True, help_text="Additional notes for the appointment")
+    series = models.ForeignKey(
+        'AppointmentSeries',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='appointments'
+    )
+    # Bulk .update() calls must set this themselves, auto_now only covers save()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(end_time__gt=models.F('start_time')),
+                name='appointment_end_after_start',
+            ),
+            # On PostgreSQL migration 0002 also adds the scheduling_appointment_no_overlap
+            # exclusion constraint, so overlapping bookings for one doctor can't be committed
+        ]
+        indexes = [
+            # Match the per-role list filters and the start_time range of AppointmentFilter
+            models.Index(fields=['doctor', 'start_time'], name='appointment_doctor_start_idx'),
+            models.Index(fields=['patient', 'start_time'], name='appointment_patient_start_idx'),
+            models.Index(fields=['status', 'start_time'], name='appointment_status_start_idx'),
+        ]
+
+
+class AppointmentSeries(models.Model):
+    """
+    A recurrence rule (every `interval` days or weeks, `count` times or until a
+    date) whose occurrences are stored as ordinary Appointment rows.
+    """
+    MAX_OCCURRENCES = 104
+
+    class Frequency(models.TextChoices):
+        DAILY = 'DAILY', 'Daily'
+        WEEKLY = 'WEEKLY', 'Weekly'
+
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.CASCADE,
+        related_name='appointment_series'
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='appointment_series',
+        limit_choices_to={'role': 'DOCTOR'}
+    )
+
+    start_time = models.DateTimeField(help_text="Start of the first occurrence")
+    duration = models.PositiveIntegerField(help_text="Length of every occurrence in minutes")
+    frequency = models.CharField(max_length=10, choices=Frequency.choices, default=Frequency.WEEKLY)
+    interval = models.PositiveSmallIntegerField(default=1, help_text="Repeat every N days or weeks, e.g. 2 for biweekly")
+    count = models.PositiveSmallIntegerField(blank=True, null=True, help_text="Number of occurrences")
+    until = models.DateTimeField(blank=True, null=True, help_text="No occurrence starts after this moment")
+    notes = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'appointment series'
+
+    def __str__(self):
+        return f"{self.get_frequency_display()} series for {self.patient} with Dr. {self.doctor.last_name}"
+
+    @property
+    def step(self):
+        days = 1 if self.frequency == self.Frequency.DAILY else 7
+        return timedelta(days=days * self.interval)
+
+    def occurrences(self):
+        """
+        (start, end) of every occurrence, capped at MAX_OCCURRENCES.
+        """
+        length = timedelta(minutes=self.duration)
+        limit = min(self.count or self.MAX_OCCURRENCES, self.MAX_OCCURRENCES)
+        result = []
+        start = self.start_time
+        while len(result) < limit and (self.until is None or start <= self.until):
+            result.append((start, start + length))
+            start += self.step
+        return result
+
+
+class WaitlistEntry(models.Model):
+    """
+    A patient waiting for a cancelled slot with a doctor inside an acceptable window.
+    """
+    # Windows are bounded so the matcher can use a range on `earliest`
+    MAX_WINDOW = timedelta(days=90)
+
+    class Status(models.TextChoices):
+        WAITING = 'WAITING', 'Waiting'
+        BOOKED = 'BOOKED', 'Booked'
+
+    patient = models.ForeignKey(
+        Patient,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries'
+    )
+    doctor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='waitlist_entries',
+        limit_choices_to={'role': 'DOCTOR'}
+    )
+
+    earliest = models.DateTimeField(help_text="Earliest acceptable start")
+    latest = models.DateTimeField(help_text="Latest acceptable end")
+    duration = models.PositiveIntegerField(default=30, help_text="Minutes needed")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.WAITING)
+    appointment = models.OneToOneField(
+        Appointment,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='waitlist_entry'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'waitlist entries'
+        indexes = [
+            models.Index(fields=['doctor', 'status', 'earliest'], name='waitlist_match_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.patient} waiting for Dr. {self.doctor.last_name}"
 
 
 class DoctorSchedule(models.Model):
@@ -41,4 +172,27 @@ class DoctorSchedule(models.Model):
     end_time = models.TimeField()
 
     def __str__(self):
-        return f"Schedule for Dr. {self.doctor.first_name} {self.doctor.last_name}: {self.start_time.strftime('%Y-%m-%d %H:%M')} - {self.end_time.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
+        return f"Schedule for Dr. {self.doctor.first_name} {self.doctor.last_name}: {self.start_time.strftime('%Y-%m-%d %H:%M')} - {self.end_time.strftime('%Y-%m-%d %H:%M')}"
+
+
+class CalendarFeed(models.Model):
+    """
+    The secret in a user's calendar subscription URL. Calendar apps can't send an
+    Authorization header, so the key stands for the user on that URL only;
+    replacing or deleting it revokes the old URL.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='calendar_feed'
+    )
+    key = models.CharField(max_length=40, unique=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Calendar feed of {self.user_id}"
+
+    @staticmethod
+    def generate_key():
+        return secrets.token_hex(20)
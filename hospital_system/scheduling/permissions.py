@@ -1,7 +1,12 @@
 from rest_framework import permissions
+from hospital_system.ownership import owns
 
 class IsOwnerOrDoctorOrAdmin(permissions.BasePermission):
+    """
+    The patient and the doctor may read, only the patient (or staff) may change.
+    Compares ids, so it never loads the patient or the doctor.
+    """
     def has_object_permission(self, request, view, obj):
-        if request.method in permissions.SAFE_METHODS:
-            return request.user.is_staff or request.user == obj.patient.user or request.user == obj.doctor
-        return request.user.is_staff or request.user == obj.patient.user 
\ No newline at end of file
+        if request.user.is_staff or owns(request.user, obj, 'patient'):
+            return True
+        return request.method in permissions.SAFE_METHODS and owns(request.user, obj, 'doctor')
@@ -1,5 +1,8 @@
+from datetime import timedelta
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Appointment, DoctorSchedule
+from .models import Appointment, AppointmentSeries, DoctorSchedule, WaitlistEntry
+from .booking import create_series, update_series
 from patients.models import Patient
 
 class AppointmentSerializer(serializers.ModelSerializer):
@@ -8,10 +11,162 @@ class AppointmentSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Appointment
-        fields = ('id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'start_time', 'end_time', 'status', 'notes')
-        read_only_fields = ['patient']
+        fields = ('id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'start_time', 'end_time', 'status', 'notes', 'series')
+        read_only_fields = ['patient', 'series']
+
+    def validate(self, data):
+        start_time = data.get('start_time', getattr(self.instance, 'start_time', None))
+        end_time = data.get('end_time', getattr(self.instance, 'end_time', None))
+        if start_time and end_time and end_time <= start_time:
+            raise serializers.ValidationError({'end_time': "Must be later than start_time."})
+        return data
+
+class AppointmentSeriesSerializer(serializers.ModelSerializer):
+    patient_name = serializers.CharField(source='patient.get_full_name', read_only=True)
+    doctor_name = serializers.CharField(source='doctor.get_full_name', read_only=True)
+
+    # The recurrence rule is fixed once the occurrences exist
+    RULE_FIELDS = ('doctor', 'frequency', 'interval', 'count', 'until')
+
+    class Meta:
+        model = AppointmentSeries
+        fields = (
+            'id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'start_time', 'duration',
+            'frequency', 'interval', 'count', 'until', 'notes', 'created_at'
+        )
+        read_only_fields = ['patient', 'created_at']
+
+    def validate(self, data):
+        if 'duration' in data and not 5 <= data['duration'] <= 480:
+            raise serializers.ValidationError({'duration': "Must be between 5 and 480 minutes."})
+
+        if self.instance is not None:
+            changed = [field for field in self.RULE_FIELDS if field in data]
+            if changed:
+                raise serializers.ValidationError(
+                    {field: "Can't be changed on an existing series, create a new one instead." for field in changed}
+                )
+            return data
+
+        if (data.get('count') is None) == (data.get('until') is None):
+            raise serializers.ValidationError("Provide exactly one of 'count' or 'until'.")
+        if data.get('count') is not None and not 1 <= data['count'] <= AppointmentSeries.MAX_OCCURRENCES:
+            raise serializers.ValidationError(
+                {'count': f"Must be between 1 and {AppointmentSeries.MAX_OCCURRENCES}."}
+            )
+        if data.get('until') is not None and data['until'] < data['start_time']:
+            raise serializers.ValidationError({'until': "Must not be earlier than start_time."})
+        if data.get('interval', 1) < 1:
+            raise serializers.ValidationError({'interval': "Must be at least 1."})
+        return data
+
+    def create(self, validated_data):
+        return create_series(validated_data)
+
+    def update(self, instance, validated_data):
+        return update_series(instance, validated_data)
+
+class WaitlistEntrySerializer(serializers.ModelSerializer):
+    patient_name = serializers.CharField(source='patient.get_full_name', read_only=True)
+    doctor_name = serializers.CharField(source='doctor.get_full_name', read_only=True)
+
+    class Meta:
+        model = WaitlistEntry
+        fields = (
+            'id', 'patient', 'patient_name', 'doctor', 'doctor_name', 'earliest', 'latest', 'duration',
+            'status', 'appointment', 'created_at'
+        )
+        read_only_fields = ['patient', 'status', 'appointment', 'created_at']
+
+    def validate(self, data):
+        if not 5 <= data.get('duration', 30) <= 480:
+            raise serializers.ValidationError({'duration': "Must be between 5 and 480 minutes."})
+        if data['latest'] - data['earliest'] < timedelta(minutes=data.get('duration', 30)):
+            raise serializers.ValidationError({'latest': "The window must fit at least one appointment."})
+        if data['latest'] - data['earliest'] > WaitlistEntry.MAX_WINDOW:
+            raise serializers.ValidationError(
+                {'latest': f"The window can span at most {WaitlistEntry.MAX_WINDOW.days} days."}
+            )
+        if data['latest'] <= timezone.now():
+            raise serializers.ValidationError({'latest': "Must be in the future."})
+        return data
 
 class DoctorScheduleSerializer(serializers.ModelSerializer):
     class Meta:
         model = DoctorSchedule
-        fields = ('id', 'doctor', 'start_time', 'end_time')
\ No newline at end of file
+        fields = ('id', 'doctor', 'start_time', 'end_time')
+
+class AvailabilityQuerySerializer(serializers.Serializer):
+    """
+    Query parameters of the availability endpoint: ?from=&to=&duration=
+    """
+    MAX_RANGE = timedelta(days=31)
+    DATE_INPUT_FORMATS = ['iso-8601', '%Y-%m-%d']
+
+    def get_fields(self):
+        # "from" is a Python keyword, so the fields can't be class attributes
+        return {
+            'from': serializers.DateTimeField(source='range_start', input_formats=self.DATE_INPUT_FORMATS),
+            'to': serializers.DateTimeField(source='range_end', input_formats=self.DATE_INPUT_FORMATS),
+            'duration': serializers.IntegerField(min_value=5, max_value=480, default=30, help_text="Slot length in minutes"),
+        }
+
+    def validate(self, data):
+        if data['range_end'] <= data['range_start']:
+            raise serializers.ValidationError({'to': "Must be later than 'from'."})
+        if data['range_end'] - data['range_start'] > self.MAX_RANGE:
+            raise serializers.ValidationError({'to': f"Range can span at most {self.MAX_RANGE.days} days."})
+        data['duration'] = timedelta(minutes=data['duration'])
+        return data
+
+
+class AvailableSlotSerializer(serializers.Serializer):
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+
+
+class DashboardStatsQuerySerializer(serializers.Serializer):
+    """
+    Optional ?from=&to= dates of the dashboard statistics, defaulting to the coming week.
+    """
+    MAX_RANGE = timedelta(days=366)
+
+    def get_fields(self):
+        # "from" is a Python keyword, so the fields can't be class attributes
+        return {
+            'from': serializers.DateField(source='first_day', required=False),
+            'to': serializers.DateField(source='last_day', required=False),
+        }
+
+    def validate(self, data):
+        data.setdefault('first_day', timezone.localdate())
+        data.setdefault('last_day', data['first_day'] + timedelta(days=6))
+        if data['last_day'] < data['first_day']:
+            raise serializers.ValidationError({'to': "Must not be earlier than 'from'."})
+        if data['last_day'] - data['first_day'] > self.MAX_RANGE:
+            raise serializers.ValidationError({'to': f"Range can span at most {self.MAX_RANGE.days} days."})
+        return data
+
+
+class BulkStatusSerializer(serializers.Serializer):
+    """
+    Either a list of ids, or a day (optionally narrowed to one doctor).
+    """
+    MAX_IDS = 500
+
+    status = serializers.ChoiceField(
+        choices=[Appointment.AppointmentStatus.COMPLETED, Appointment.AppointmentStatus.CANCELLED]
+    )
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False, max_length=MAX_IDS)
+    doctor = serializers.IntegerField(required=False)
+    date = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if ('ids' in data) == ('date' in data):
+            raise serializers.ValidationError("Provide either 'ids' or 'date'.")
+        if 'doctor' in data and 'date' not in data:
+            raise serializers.ValidationError({'doctor': "Only valid together with 'date'."})
+        if 'ids' in data:
+            # Keep the request order but drop duplicates
+            data['ids'] = list(dict.fromkeys(data['ids']))
+        return data
\ No newline at end of file
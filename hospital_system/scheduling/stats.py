@@ -0,0 +1,105 @@
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from patients.models import Patient
+from users.models import CustomUser
+from .models import Appointment
+
+STATUSES = [choice for choice, _ in Appointment.AppointmentStatus.choices]
+
+
+def day_bounds(first_day, last_day):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_day, time.min), tz)
+    end = timezone.make_aware(datetime.combine(last_day + timedelta(days=1), time.min), tz)
+    return start, end
+
+
+def empty_counts():
+    counts = dict.fromkeys(STATUSES, 0)
+    counts['total'] = 0
+    return counts
+
+
+def dashboard_statistics(user, first_day, last_day):
+    """
+    Appointment counts per day and per doctor (split by status) plus patient,
+    user and appointment totals. Every section is one GROUP BY or aggregate query.
+    """
+    appointments = Appointment.objects.all()
+    if user.role == CustomUser.Role.DOCTOR:
+        # Doctors get the numbers of their own practice
+        appointments = appointments.filter(doctor=user)
+
+    range_start, range_end = day_bounds(first_day, last_day)
+    today_start, today_end = day_bounds(timezone.localdate(), timezone.localdate())
+    in_range = appointments.filter(start_time__gte=range_start, start_time__lt=range_end)
+
+    per_day = {}
+    day_rows = (
+        in_range
+        .annotate(day=TruncDate('start_time'))
+        .values('day', 'status')
+        .annotate(count=Count('id'))
+        .order_by('day')
+    )
+    for row in day_rows:
+        counts = per_day.setdefault(row['day'], empty_counts())
+        counts[row['status']] = row['count']
+        counts['total'] += row['count']
+
+    per_doctor = {}
+    doctor_rows = (
+        in_range
+        .values('doctor', 'doctor__first_name', 'doctor__last_name', 'status')
+        .annotate(count=Count('id'))
+        .order_by('doctor')
+    )
+    for row in doctor_rows:
+        entry = per_doctor.setdefault(row['doctor'], {
+            'doctor': row['doctor'],
+            'doctor_name': f"{row['doctor__first_name']} {row['doctor__last_name']}".strip(),
+            **empty_counts(),
+        })
+        entry[row['status']] = row['count']
+        entry['total'] += row['count']
+
+    appointment_totals = appointments.aggregate(
+        appointments=Count('id'),
+        appointments_today=Count('id', filter=Q(start_time__gte=today_start, start_time__lt=today_end)),
+    )
+    user_totals = CustomUser.objects.aggregate(
+        users=Count('id'),
+        active_users=Count('id', filter=Q(is_active=True)),
+        doctors=Count('id', filter=Q(role=CustomUser.Role.DOCTOR)),
+    )
+
+    return {
+        'from': first_day,
+        'to': last_day,
+        'totals': {
+            'patients': Patient.objects.count(),
+            **user_totals,
+            **appointment_totals,
+        },
+        'per_day': [{'date': day, **counts} for day, counts in sorted(per_day.items())],
+        'per_doctor': list(per_doctor.values()),
+        'generated_at': timezone.now(),
+    }
+
+
+def cached_dashboard_statistics(user, first_day, last_day):
+    """
+    dashboard_statistics, kept for DASHBOARD_STATS_TTL seconds. Admins share one
+    entry per range; doctors get their own because their numbers are scoped.
+    """
+    scope = f'doctor-{user.pk}' if user.role == CustomUser.Role.DOCTOR else 'all'
+    key = f'dashboard-stats:{scope}:{first_day.isoformat()}:{last_day.isoformat()}'
+    stats = cache.get(key)
+    if stats is None:
+        stats = dashboard_statistics(user, first_day, last_day)
+        cache.set(key, stats, settings.DASHBOARD_STATS_TTL)
+    return stats
@@ -0,0 +1,18 @@
+from celery import shared_task
+from .models import Appointment
+from .waitlist import backfill_slot
+
+
+@shared_task
+def backfill_cancelled_slots(appointment_ids):
+    """
+    Offer every cancelled slot to the waitlist, earliest slot first.
+    """
+    cancelled = Appointment.objects.filter(
+        pk__in=appointment_ids, status=Appointment.AppointmentStatus.CANCELLED
+    ).order_by('start_time')
+    booked = 0
+    for appointment in cancelled:
+        if backfill_slot(appointment) is not None:
+            booked += 1
+    return booked
@@ -1,3 +1,834 @@
-from django.test import TestCase
+import random
+import threading
+from datetime import datetime, time, timedelta
+from io import StringIO
+from unittest import mock
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+from users.models import CustomUser
+from patients.models import Patient
+from .models import Appointment, AppointmentSeries, DoctorSchedule, WaitlistEntry
+from .availability import merge_intervals, subtract_intervals
+from .booking import conflicting_appointments
+from .waitlist import MAX_CANDIDATES, backfill_slot
 
-# Create your tests here.
+
+def aware(*args):
+    return timezone.make_aware(datetime(*args))
+
+
+class IntervalSweepTest(TestCase):
+    def test_merge_intervals(self):
+        merged = merge_intervals([(5, 7), (1, 3), (2, 4), (7, 8)])
+        self.assertEqual(merged, [(1, 4), (5, 8)])
+
+    def test_subtract_intervals(self):
+        free = subtract_intervals([(0, 10), (20, 30)], [(2, 4), (8, 22), (25, 26)])
+        self.assertEqual(free, [(0, 2), (4, 8), (22, 25), (26, 30)])
+
+
+class DoctorAvailabilityAPITest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', password='password123', role='DOCTOR'
+        )
+        patient_user = CustomUser.objects.create_user(
+            username='testpatient', password='password123', role='PATIENT'
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        DoctorSchedule.objects.create(doctor=self.doctor, start_time=time(9), end_time=time(12))
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            start_time=aware(2030, 1, 7, 10), end_time=aware(2030, 1, 7, 10, 30)
+        )
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, status=Appointment.AppointmentStatus.CANCELLED,
+            start_time=aware(2030, 1, 7, 11), end_time=aware(2030, 1, 7, 12)
+        )
+        self.url = reverse('doctor-availability', args=[self.doctor.id])
+        self.client.force_authenticate(user=patient_user)
+
+    def test_booked_time_is_removed_from_schedule(self):
+        response = self.client.get(self.url, {'from': '2030-01-07', 'to': '2030-01-08', 'duration': 30})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        starts = [slot['start_time'][11:16] for slot in response.data['slots']]
+        # 10:00 is booked, the cancelled 11:00-12:00 appointment frees its time again
+        self.assertEqual(starts, ['09:00', '09:30', '10:30', '11:00', '11:30'])
+
+    def test_slots_span_multiple_days(self):
+        response = self.client.get(self.url, {'from': '2030-01-08', 'to': '2030-01-10', 'duration': 60})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['slots']), 6)
+
+    def test_query_count_does_not_grow_with_range(self):
+        with self.assertNumQueries(3):
+            self.client.get(self.url, {'from': '2030-01-01', 'to': '2030-01-31', 'duration': 15})
+
+    def test_invalid_range(self):
+        response = self.client.get(self.url, {'from': '2030-01-08', 'to': '2030-01-07'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_doctor(self):
+        url = reverse('doctor-availability', args=[self.patient.user_id])
+        response = self.client.get(url, {'from': '2030-01-07', 'to': '2030-01-08'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+
+class AppointmentQueryCountTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', password='password123', first_name='John', last_name='Doe', role='DOCTOR'
+        )
+        self.admin = CustomUser.objects.create_user(
+            username='testadmin', password='password123', role='ADMIN', is_staff=True
+        )
+        patient_user = CustomUser.objects.create_user(
+            username='testpatient', password='password123', first_name='Jane', last_name='Roe', role='PATIENT'
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        for hour in range(8, 18):
+            self.appointment = Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor,
+                start_time=aware(2030, 1, 7, hour), end_time=aware(2030, 1, 7, hour, 30)
+            )
+
+    def test_list_for_each_role(self):
+        for user in (self.admin, self.doctor, self.patient.user):
+            self.client.force_authenticate(user=user)
+            with self.assertNumQueries(2):
+                response = self.client.get(reverse('appointment-list-create'))
+            self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(response.data['results'][0]['patient_name'], 'Jane Roe')
+        self.assertEqual(response.data['results'][0]['doctor_name'], 'John Doe')
+
+    def test_detail(self):
+        self.client.force_authenticate(user=self.doctor)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('appointment-detail', args=[self.appointment.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ObjectPermissionQueryTest(APITestCase):
+    """
+    Ownership is checked on the ids of the row, so authorization adds no queries;
+    rows of other users are not in the queryset at all.
+    """
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', role='DOCTOR')
+        self.patient = Patient.objects.create(
+            user=CustomUser.objects.create_user(username='testpatient', role='PATIENT'),
+            date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        self.other_patient = Patient.objects.create(
+            user=CustomUser.objects.create_user(username='otherpatient', role='PATIENT'),
+            date_of_birth='1990-01-01', address='Via Roma 2', phone_number='456'
+        )
+        self.appointment = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            start_time=aware(2030, 1, 7, 9), end_time=aware(2030, 1, 7, 9, 30)
+        )
+        self.series = AppointmentSeries.objects.create(
+            patient=self.patient, doctor=self.doctor, start_time=aware(2030, 1, 7, 10),
+            duration=30, count=1
+        )
+        self.entry = WaitlistEntry.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            earliest=aware(2030, 1, 7, 8), latest=aware(2030, 1, 7, 18)
+        )
+        self.url = reverse('appointment-detail', args=[self.appointment.id])
+
+    def authenticate(self, user):
+        # Like token authentication, only the fields it vouches for are loaded
+        self.client.force_authenticate(user=CustomUser.objects.only('id', 'role', 'is_staff').get(pk=user.pk))
+
+    def test_patient_reads_and_updates_own_appointment(self):
+        self.authenticate(self.patient.user)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The row, then the doctor lock, overlap check and write inside savepoints
+        with self.assertNumQueries(8):
+            response = self.client.patch(self.url, {'notes': 'Running late'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_doctor_reads_but_cannot_update(self):
+        self.authenticate(self.doctor)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):
+            response = self.client.patch(self.url, {'notes': 'Moved'})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_other_patient_does_not_find_it(self):
+        self.authenticate(self.other_patient.user)
+        for url in (
+            self.url,
+            reverse('appointment-series-detail', args=[self.series.id]),
+            reverse('waitlist-detail', args=[self.entry.id]),
+        ):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_staff_sees_every_row_whatever_its_role(self):
+        # createsuperuser leaves the role at its PATIENT default
+        staff = CustomUser.objects.create_user(username='superuser', role='PATIENT', is_staff=True)
+        self.authenticate(staff)
+        for url in (
+            self.url,
+            reverse('appointment-series-detail', args=[self.series.id]),
+            reverse('waitlist-detail', args=[self.entry.id]),
+        ):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.patch(self.url, {'notes': 'Moved by the front desk'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('appointment-series-cancel', args=[self.series.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_series_and_waitlist_detail(self):
+        self.authenticate(self.doctor)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('waitlist-detail', args=[self.entry.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('appointment-series-cancel', args=[self.series.id]))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+
+class AppointmentCursorPaginationTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', role='DOCTOR')
+        patient_user = CustomUser.objects.create_user(username='testpatient', role='PATIENT')
+        self.patient = Patient.objects.create(
+            user=patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        doctors = [self.doctor] + [
+            CustomUser.objects.create_user(username=f'otherdoctor{i}', role='DOCTOR') for i in range(2)
+        ]
+        # Several appointments share a start_time, so the id tie-breaker matters
+        for day in range(1, 16):
+            for doctor in doctors:
+                Appointment.objects.create(
+                    patient=self.patient, doctor=doctor,
+                    start_time=aware(2030, 1, day, 9), end_time=aware(2030, 1, day, 10)
+                )
+        self.client.force_authenticate(user=patient_user)
+        self.url = reverse('appointment-list-create')
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen = []
+        response = self.client.get(self.url, {'pagination': 'cursor'})
+        while True:
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        expected = list(Appointment.objects.order_by('start_time', 'id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_descending_order_newest_first(self):
+        seen = []
+        response = self.client.get(self.url, {'pagination': 'cursor', 'order': 'desc'})
+        while True:
+            seen.extend(item['id'] for item in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        expected = list(Appointment.objects.order_by('-start_time', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+        response = self.client.get(self.url, {'order': 'desc'})
+        self.assertEqual(response.data['results'][0]['id'], expected[0])
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get(self.url, {'pagination': 'cursor'})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(
+            [item['id'] for item in back.data['results']],
+            [item['id'] for item in first.data['results']]
+        )
+        self.assertIsNone(back.data['previous'])
+
+    def test_deep_page_is_a_single_query(self):
+        response = self.client.get(self.url, {'pagination': 'cursor'})
+        with self.assertNumQueries(1):
+            self.client.get(response.data['next'])
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 45)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+
+class DashboardStatsAPITest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', first_name='John', last_name='Doe', role='DOCTOR'
+        )
+        self.other_doctor = CustomUser.objects.create_user(username='otherdoctor', role='DOCTOR')
+        self.admin = CustomUser.objects.create_user(username='testadmin', role='ADMIN')
+        patient_user = CustomUser.objects.create_user(username='testpatient', role='PATIENT')
+        self.patient = Patient.objects.create(
+            user=patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        statuses = ['SCHEDULED', 'COMPLETED', 'CANCELLED', 'SCHEDULED']
+        for hour, appointment_status in enumerate(statuses, start=9):
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, status=appointment_status,
+                start_time=aware(2030, 1, 7, hour), end_time=aware(2030, 1, 7, hour, 30)
+            )
+        Appointment.objects.create(
+            patient=self.patient, doctor=self.other_doctor,
+            start_time=aware(2030, 1, 8, 9), end_time=aware(2030, 1, 8, 9, 30)
+        )
+        self.url = reverse('dashboard-stats')
+        self.params = {'from': '2030-01-07', 'to': '2030-01-08'}
+
+    def test_admin_sees_all_counts(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['totals']['patients'], 1)
+        self.assertEqual(response.data['totals']['users'], 4)
+        self.assertEqual(response.data['totals']['appointments'], 5)
+        first_day = response.data['per_day'][0]
+        self.assertEqual((first_day['SCHEDULED'], first_day['COMPLETED'], first_day['CANCELLED']), (2, 1, 1))
+        self.assertEqual(len(response.data['per_doctor']), 2)
+        self.assertEqual(response.data['per_doctor'][0]['doctor_name'], 'John Doe')
+
+    def test_doctor_sees_own_practice(self):
+        self.client.force_authenticate(user=self.doctor)
+        response = self.client.get(self.url, self.params)
+        self.assertEqual(response.data['totals']['appointments'], 4)
+        self.assertEqual([row['total'] for row in response.data['per_day']], [4])
+
+    def test_cached_after_first_request(self):
+        self.client.force_authenticate(user=self.admin)
+        with self.assertNumQueries(5):
+            self.client.get(self.url, self.params)
+        with self.assertNumQueries(0):
+            self.client.get(self.url, self.params)
+
+    def test_patient_is_forbidden(self):
+        self.client.force_authenticate(user=self.patient.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class AppointmentConflictAPITest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', password='password123', role='DOCTOR'
+        )
+        self.patient_user = CustomUser.objects.create_user(
+            username='testpatient', password='password123', role='PATIENT'
+        )
+        self.patient = Patient.objects.create(
+            user=self.patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        self.existing = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            start_time=aware(2030, 1, 7, 10), end_time=aware(2030, 1, 7, 11)
+        )
+        self.url = reverse('appointment-list-create')
+        self.client.force_authenticate(user=self.patient_user)
+
+    def book(self, start, end):
+        return self.client.post(self.url, {
+            'doctor': self.doctor.id, 'start_time': start.isoformat(), 'end_time': end.isoformat()
+        })
+
+    def test_overlapping_booking_is_rejected(self):
+        response = self.book(aware(2030, 1, 7, 10, 30), aware(2030, 1, 7, 11, 30))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['conflicting_appointments'], [self.existing.id])
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_adjacent_booking_is_accepted(self):
+        response = self.book(aware(2030, 1, 7, 11), aware(2030, 1, 7, 11, 30))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_cancelled_appointment_frees_the_slot(self):
+        self.existing.status = Appointment.AppointmentStatus.CANCELLED
+        self.existing.save()
+        response = self.book(aware(2030, 1, 7, 10), aware(2030, 1, 7, 11))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_end_before_start_is_rejected(self):
+        response = self.book(aware(2030, 1, 7, 12), aware(2030, 1, 7, 11))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_update_into_taken_slot_is_rejected(self):
+        other = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            start_time=aware(2030, 1, 7, 14), end_time=aware(2030, 1, 7, 15)
+        )
+        url = reverse('appointment-detail', args=[other.id])
+        response = self.client.patch(url, {'start_time': aware(2030, 1, 7, 10, 45).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        # Moving an appointment within its own slot is not a conflict
+        response = self.client.patch(url, {'start_time': aware(2030, 1, 7, 14, 15).isoformat()})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ConcurrentBookingStressTest(TransactionTestCase):
+    """
+    Many threads book random, heavily overlapping slots for the same doctor.
+    Whatever the interleaving, no two committed appointments may overlap.
+    """
+    THREADS = 8
+    BOOKINGS_PER_THREAD = 15
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("shared-cache in-memory SQLite locks whole tables and can't show real concurrency")
+        self.doctor = CustomUser.objects.create_user(username='stressdoctor', role='DOCTOR')
+        self.patients = []
+        for i in range(self.THREADS):
+            user = CustomUser.objects.create_user(username=f'stresspatient{i}', role='PATIENT')
+            self.patients.append(Patient.objects.create(
+                user=user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number=str(i)
+            ))
+
+    def test_no_overlaps_under_concurrent_booking(self):
+        url = reverse('appointment-list-create')
+        day = aware(2030, 1, 7, 8)
+        results = []
+
+        def worker(patient, seed):
+            from rest_framework.test import APIClient
+            client = APIClient()
+            client.force_authenticate(user=patient.user)
+            rng = random.Random(seed)
+            try:
+                for _ in range(self.BOOKINGS_PER_THREAD):
+                    start = day + timedelta(minutes=15 * rng.randrange(16))
+                    response = client.post(url, {
+                        'doctor': self.doctor.id,
+                        'start_time': start.isoformat(),
+                        'end_time': (start + timedelta(minutes=30)).isoformat(),
+                    })
+                    results.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(p, i)) for i, p in enumerate(self.patients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(set(results) - {201, 409}, set())
+        self.assertEqual(results.count(201), Appointment.objects.count())
+        for appointment in Appointment.objects.all():
+            overlapping = conflicting_appointments(
+                self.doctor.id, appointment.start_time, appointment.end_time, exclude_id=appointment.id
+            )
+            self.assertFalse(overlapping.exists())
+
+
+
+class BenchmarkListQueriesCommandTest(TransactionTestCase):
+    def test_small_run_restores_indexes_and_cleans_up(self):
+        out = StringIO()
+        call_command(
+            'benchmark_list_queries', doctors=2, patients=5, appointments=40, records=40,
+            batch_size=16, repeat=1, cleanup=True, stdout=out
+        )
+        self.assertIn('appointments by status', out.getvalue())
+        self.assertFalse(CustomUser.objects.filter(username__startswith='bench_').exists())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Appointment._meta.db_table)
+        self.assertIn('appointment_status_start_idx', constraints)
+
+    def test_refuses_a_database_that_is_not_a_scratch_one(self):
+        with mock.patch('scheduling.management.commands.benchmark_list_queries.is_scratch_database', return_value=False):
+            with self.assertRaises(CommandError):
+                call_command('benchmark_list_queries', doctors=1, patients=1, appointments=1, records=1, stdout=StringIO())
+        self.assertFalse(CustomUser.objects.exists())
+
+
+
+class AppointmentSeriesAPITest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', role='DOCTOR')
+        patient_user = CustomUser.objects.create_user(username='testpatient', role='PATIENT')
+        self.patient = Patient.objects.create(
+            user=patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        self.client.force_authenticate(user=patient_user)
+        self.url = reverse('appointment-series-list-create')
+
+    def create_series(self, **overrides):
+        data = {
+            'doctor': self.doctor.id, 'start_time': aware(2030, 1, 7, 9).isoformat(), 'duration': 30,
+            'frequency': 'WEEKLY', 'interval': 2, 'count': 6, **overrides
+        }
+        return self.client.post(self.url, data)
+
+    def test_occurrences_are_generated(self):
+        response = self.create_series()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        starts = list(Appointment.objects.filter(series=response.data['id'])
+                      .order_by('start_time').values_list('start_time', flat=True))
+        self.assertEqual(len(starts), 6)
+        self.assertEqual(starts[1] - starts[0], timedelta(weeks=2))
+
+    def test_until_limits_occurrences(self):
+        response = self.create_series(count='', until=aware(2030, 2, 1).isoformat(), interval=1)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Appointment.objects.count(), 4)
+
+    def test_query_count_does_not_grow_with_occurrences(self):
+        with self.assertNumQueries(10):
+            self.create_series(count=2)
+        with self.assertNumQueries(10):
+            self.create_series(count=50, start_time=aware(2031, 1, 7, 9).isoformat())
+
+    def test_conflicting_occurrence_rejects_whole_series(self):
+        taken = Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor,
+            start_time=aware(2030, 2, 4, 9, 15), end_time=aware(2030, 2, 4, 10)
+        )
+        response = self.create_series()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['conflicting_appointments'], [taken.id])
+        self.assertFalse(AppointmentSeries.objects.exists())
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_edit_shifts_upcoming_occurrences(self):
+        series_id = self.create_series().data['id']
+        url = reverse('appointment-series-detail', args=[series_id])
+        response = self.client.patch(url, {
+            'start_time': aware(2030, 1, 7, 10).isoformat(), 'duration': 45, 'notes': 'Moved'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for appointment in Appointment.objects.filter(series=series_id):
+            self.assertEqual(appointment.start_time.hour, 10)
+            self.assertEqual(appointment.end_time - appointment.start_time, timedelta(minutes=45))
+            self.assertEqual(appointment.notes, 'Moved')
+
+    def test_rule_fields_are_read_only_after_creation(self):
+        series_id = self.create_series().data['id']
+        url = reverse('appointment-series-detail', args=[series_id])
+        response = self.client.patch(url, {'count': 3})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_cancel_series(self):
+        series_id = self.create_series().data['id']
+        response = self.client.post(reverse('appointment-series-cancel', args=[series_id]))
+        self.assertEqual(response.data['cancelled'], 6)
+        self.assertFalse(
+            Appointment.objects.exclude(status=Appointment.AppointmentStatus.CANCELLED).exists()
+        )
+
+
+
+class AppointmentBulkStatusAPITest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', role='DOCTOR')
+        self.other_doctor = CustomUser.objects.create_user(username='otherdoctor', role='DOCTOR')
+        patient_user = CustomUser.objects.create_user(username='testpatient', role='PATIENT')
+        self.patient = Patient.objects.create(
+            user=patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        self.mine = [
+            Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor,
+                start_time=aware(2030, 1, 7, hour), end_time=aware(2030, 1, 7, hour, 30)
+            )
+            for hour in range(9, 14)
+        ]
+        self.theirs = Appointment.objects.create(
+            patient=self.patient, doctor=self.other_doctor,
+            start_time=aware(2030, 1, 7, 9), end_time=aware(2030, 1, 7, 9, 30)
+        )
+        self.url = reverse('appointment-bulk-status')
+
+    def test_doctor_completes_own_appointments_by_id(self):
+        self.mine[0].status = Appointment.AppointmentStatus.CANCELLED
+        self.mine[0].save()
+        self.client.force_authenticate(user=self.doctor)
+        ids = [a.id for a in self.mine] + [self.theirs.id, 999999]
+        with self.assertNumQueries(4):
+            response = self.client.post(self.url, {'status': 'COMPLETED', 'ids': ids}, format='json')
+
+        results = {item['id']: item['result'] for item in response.data['results']}
+        self.assertEqual(response.data['updated'], 4)
+        self.assertEqual(results[self.mine[0].id], 'invalid_transition')
+        self.assertEqual(results[self.theirs.id], 'not_found')
+        self.assertEqual(results[999999], 'not_found')
+        self.theirs.refresh_from_db()
+        self.assertEqual(self.theirs.status, Appointment.AppointmentStatus.SCHEDULED)
+
+    def test_doctor_completes_a_whole_day(self):
+        self.client.force_authenticate(user=self.doctor)
+        response = self.client.post(self.url, {'status': 'COMPLETED', 'date': '2030-01-07'}, format='json')
+        self.assertEqual(response.data['updated'], 5)
+        self.assertEqual(Appointment.objects.filter(status='COMPLETED').count(), 5)
+
+    def test_patient_can_only_cancel(self):
+        self.client.force_authenticate(user=self.patient.user)
+        ids = [self.mine[0].id]
+        response = self.client.post(self.url, {'status': 'COMPLETED', 'ids': ids}, format='json')
+        self.assertEqual(response.data['results'][0]['result'], 'not_found')
+        response = self.client.post(self.url, {'status': 'CANCELLED', 'ids': ids}, format='json')
+        self.assertEqual(response.data['results'][0]['result'], 'updated')
+
+    def test_ids_or_date_required(self):
+        self.client.force_authenticate(user=self.doctor)
+        response = self.client.post(self.url, {'status': 'COMPLETED'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+
+class AppointmentCalendarFeedTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(
+            username='testdoctor', first_name='John', last_name='Doe', role='DOCTOR'
+        )
+        other_doctor = CustomUser.objects.create_user(username='otherdoctor', role='DOCTOR')
+        patient_user = CustomUser.objects.create_user(
+            username='testpatient', first_name='Jane', last_name='Roe', role='PATIENT'
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+        )
+        for day in range(1, 6):
+            self.appointment = Appointment.objects.create(
+                patient=self.patient, doctor=self.doctor, notes='Bring results; fasting, please',
+                start_time=aware(2030, 1, day, 9), end_time=aware(2030, 1, day, 9, 30)
+            )
+        Appointment.objects.create(
+            patient=self.patient, doctor=other_doctor,
+            start_time=aware(2030, 1, 1, 9), end_time=aware(2030, 1, 1, 9, 30)
+        )
+        self.url = reverse('appointment-calendar')
+        self.client.force_authenticate(user=self.doctor)
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_doctor_feed_contains_own_appointments(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/calendar')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/calendar'))
+        body = self.read(response)
+        self.assertTrue(body.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(body.count('BEGIN:VEVENT'), 5)
+        self.assertIn('DTSTART:20300101T090000Z', body)
+        self.assertIn('Bring results\\; fasting\\, please', body)
+
+    def test_list_filters_apply(self):
+        response = self.client.get(self.url, {'start_time_after': '2030-01-04T00:00:00Z'})
+        self.assertEqual(self.read(response).count('BEGIN:VEVENT'), 2)
+
+    def test_unchanged_feed_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.appointment.status = Appointment.AppointmentStatus.CANCELLED
+        self.appointment.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('STATUS:CANCELLED', self.read(response))
+
+    def test_renaming_the_doctor_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.doctor.last_name = 'Smith'
+        self.doctor.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Dr. John Smith', self.read(response))
+
+    def test_subscription_url_works_without_a_token_until_replaced(self):
+        url = self.client.get(reverse('appointment-calendar-feed')).data['url']
+        self.assertEqual(self.client.get(reverse('appointment-calendar-feed')).data['url'], url)
+        self.client.force_authenticate(user=None)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.read(response).count('BEGIN:VEVENT'), 5)
+
+        self.client.force_authenticate(user=self.doctor)
+        new_url = self.client.post(reverse('appointment-calendar-feed')).data['url']
+        self.assertNotEqual(new_url, url)
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_200_OK)
+
+        self.client.force_authenticate(user=self.doctor)
+        self.client.delete(reverse('appointment-calendar-feed'))
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(new_url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_long_lines_are_folded(self):
+        from .ical import fold
+        folded = fold('DESCRIPTION:' + 'é' * 100)
+        self.assertTrue(all(len(line.encode()) <= 75 for line in folded.split('\r\n')))
+        self.assertEqual(folded.replace('\r\n ', ''), 'DESCRIPTION:' + 'é' * 100 + '\r\n')
+
+
+class WaitlistBackfillTest(APITestCase):
+    def setUp(self):
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', role='DOCTOR')
+        self.patients = []
+        for name in ('first', 'second', 'third'):
+            user = CustomUser.objects.create_user(username=name, role='PATIENT')
+            self.patients.append(Patient.objects.create(
+                user=user, date_of_birth='1990-01-01', address='Via Roma 1', phone_number='123'
+            ))
+        self.start = aware(2030, 1, 7, 9)
+        self.appointment = Appointment.objects.create(
+            patient=self.patients[0], doctor=self.doctor,
+            start_time=self.start, end_time=self.start + timedelta(minutes=30)
+        )
+
+    def join(self, patient, earliest, latest, duration=30):
+        return WaitlistEntry.objects.create(
+            patient=patient, doctor=self.doctor, earliest=earliest, latest=latest, duration=duration
+        )
+
+    def cancel(self):
+        self.client.force_authenticate(user=self.patients[0].user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                reverse('appointment-detail', args=[self.appointment.pk]), {'status': 'CANCELLED'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_longest_waiting_matching_entry_gets_the_slot(self):
+        self.join(self.patients[0], self.start - timedelta(days=1), self.start + timedelta(days=1))
+        self.join(self.patients[1], self.start + timedelta(hours=1), self.start + timedelta(days=1))
+        first = self.join(self.patients[1], self.start - timedelta(days=2), self.start + timedelta(hours=2))
+        second = self.join(self.patients[2], self.start - timedelta(days=1), self.start + timedelta(days=1))
+
+        self.cancel()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, WaitlistEntry.Status.BOOKED)
+        self.assertEqual(first.appointment.patient, self.patients[1])
+        self.assertEqual(first.appointment.start_time, self.start)
+        self.assertEqual(second.status, WaitlistEntry.Status.WAITING)
+
+    def test_no_match_when_no_window_contains_the_slot(self):
+        entry = self.join(self.patients[1], self.start + timedelta(minutes=10), self.start + timedelta(days=1))
+        longer = self.join(self.patients[2], self.start, self.start + timedelta(days=1), duration=60)
+
+        self.cancel()
+
+        self.assertEqual(
+            set(WaitlistEntry.objects.filter(pk__in=[entry.pk, longer.pk]).values_list('status', flat=True)),
+            {WaitlistEntry.Status.WAITING}
+        )
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_shorter_entries_only_need_room_for_their_own_duration(self):
+        # Ends before the cancelled slot does, but 15 minutes from its start fit
+        entry = self.join(self.patients[1], self.start, self.start + timedelta(minutes=20), duration=15)
+
+        self.cancel()
+
+        entry.refresh_from_db()
+        self.assertEqual(entry.status, WaitlistEntry.Status.BOOKED)
+        self.assertEqual(entry.appointment.end_time, self.start + timedelta(minutes=15))
+
+    def test_entries_too_short_for_their_duration_never_use_up_the_candidates(self):
+        # More older entries than are ever tried, each window 5 minutes short of its duration
+        for _ in range(MAX_CANDIDATES + 1):
+            self.join(self.patients[1], self.start, self.start + timedelta(minutes=25))
+        fitting = self.join(self.patients[2], self.start, self.start + timedelta(minutes=30))
+
+        self.cancel()
+
+        fitting.refresh_from_db()
+        self.assertEqual(fitting.status, WaitlistEntry.Status.BOOKED)
+
+    def test_falls_through_to_an_entry_that_still_fits(self):
+        longer = self.join(self.patients[1], self.start - timedelta(days=1), self.start + timedelta(days=1))
+        shorter = self.join(self.patients[2], self.start - timedelta(days=1), self.start + timedelta(days=1), duration=15)
+        self.appointment.status = Appointment.AppointmentStatus.CANCELLED
+        self.appointment.save()
+        # The second half of the slot was rebooked directly before the backfill ran
+        Appointment.objects.create(
+            patient=self.patients[0], doctor=self.doctor,
+            start_time=self.start + timedelta(minutes=15), end_time=self.start + timedelta(minutes=30)
+        )
+
+        self.assertEqual(backfill_slot(self.appointment).patient_id, shorter.patient_id)
+        longer.refresh_from_db()
+        self.assertEqual(longer.status, WaitlistEntry.Status.WAITING)
+
+    def test_bulk_cancellation_fills_every_slot(self):
+        later = Appointment.objects.create(
+            patient=self.patients[0], doctor=self.doctor,
+            start_time=self.start + timedelta(hours=1), end_time=self.start + timedelta(hours=1, minutes=30)
+        )
+        self.join(self.patients[1], self.start - timedelta(days=1), self.start + timedelta(days=1))
+        self.join(self.patients[2], self.start - timedelta(days=1), self.start + timedelta(days=1))
+
+        self.client.force_authenticate(user=self.doctor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse('appointment-bulk-status'),
+                {'status': 'CANCELLED', 'ids': [self.appointment.pk, later.pk]}, format='json'
+            )
+
+        booked = Appointment.objects.filter(status='SCHEDULED').order_by('start_time')
+        self.assertEqual(
+            [(a.patient_id, a.start_time) for a in booked],
+            [(self.patients[1].pk, self.start), (self.patients[2].pk, later.start_time)]
+        )
+
+    def test_patient_joins_waitlist(self):
+        self.client.force_authenticate(user=self.patients[1].user)
+        response = self.client.post(reverse('waitlist-list-create'), {
+            'doctor': self.doctor.id, 'earliest': self.start.isoformat(),
+            'latest': (self.start + timedelta(days=200)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(reverse('waitlist-list-create'), {
+            'doctor': self.doctor.id, 'earliest': self.start.isoformat(),
+            'latest': (self.start + timedelta(days=7)).isoformat(),
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['patient'], self.patients[1].pk)
+        self.assertEqual(response.data['status'], 'WAITING')
+
+        self.client.force_authenticate(user=self.doctor)
+        self.assertEqual(self.client.get(reverse('waitlist-list-create')).data['count'], 1)
+
+
+class BenchmarkWaitlistCommandTest(TransactionTestCase):
+    def test_small_run_restores_index_and_cleans_up(self):
+        out = StringIO()
+        call_command('benchmark_waitlist', doctors=2, patients=5, entries=50, batch_size=16, repeat=2, cleanup=True, stdout=out)
+        self.assertIn('best candidate', out.getvalue())
+        self.assertFalse(WaitlistEntry.objects.exists())
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, WaitlistEntry._meta.db_table)
+        self.assertIn('waitlist_match_idx', constraints)
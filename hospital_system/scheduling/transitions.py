@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.utils import timezone
+from patients.timeline import invalidate_timeline
+from users.models import CustomUser
+from .models import Appointment
+
+Status = Appointment.AppointmentStatus
+
+# Finished appointments are final; only scheduled ones can move on
+ALLOWED_TRANSITIONS = {
+    Status.SCHEDULED: {Status.COMPLETED, Status.CANCELLED},
+}
+
+
+def transitionable_appointments(user, target_status):
+    """
+    The appointments this user may move to target_status, as one queryset:
+    admins any, doctors their own, patients may only cancel their own.
+    """
+    appointments = Appointment.objects.all()
+    if user.is_staff or user.role == CustomUser.Role.ADMIN:
+        return appointments
+    if user.role == CustomUser.Role.DOCTOR:
+        return appointments.filter(doctor=user)
+    if user.role == CustomUser.Role.PATIENT and target_status == Status.CANCELLED:
+        return appointments.filter(patient_id=user.pk)
+    return appointments.none()
+
+
+def bulk_transition(user, target_status, ids=None, doctor_id=None, day_bounds=None):
+    """
+    Move many appointments to target_status with a single
+    UPDATE ... WHERE id IN (...). Returns one result per requested (or matched) id:
+    updated, unchanged, invalid_transition or not_found.
+    """
+    scope = transitionable_appointments(user, target_status)
+    if ids is None:
+        scope = scope.filter(start_time__gte=day_bounds[0], start_time__lt=day_bounds[1])
+        if doctor_id is not None:
+            scope = scope.filter(doctor_id=doctor_id)
+    else:
+        scope = scope.filter(pk__in=ids)
+
+    with transaction.atomic():
+        rows = list(scope.select_for_update().values_list('pk', 'status', 'patient_id'))
+        current = {pk: appointment_status for pk, appointment_status, _ in rows}
+        if ids is None:
+            ids = sorted(current)
+
+        results = {}
+        to_update = []
+        for pk in ids:
+            if pk not in current:
+                results[pk] = 'not_found'
+            elif current[pk] == target_status:
+                results[pk] = 'unchanged'
+            elif target_status in ALLOWED_TRANSITIONS.get(current[pk], ()):
+                to_update.append(pk)
+                results[pk] = 'updated'
+            else:
+                results[pk] = 'invalid_transition'
+
+        if to_update:
+            # The status guard keeps rows changed by someone else in the meantime untouched
+            Appointment.objects.filter(pk__in=to_update, status=Status.SCHEDULED).update(
+                status=target_status, updated_at=timezone.now()
+            )
+            updated = set(to_update)
+            invalidate_timeline(patient_id for pk, _, patient_id in rows if pk in updated)
+
+    return [{'id': pk, 'result': results[pk]} for pk in ids]
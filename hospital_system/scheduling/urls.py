@@ -1,8 +1,24 @@
 from django.urls import path
-from .views import AppointmentListCreateView, AppointmentDetailView, DoctorScheduleListView
+from .views import (
+    AppointmentListCreateView, AppointmentDetailView, AppointmentCalendarView, SubscribedCalendarView,
+    CalendarFeedView, AppointmentBulkStatusView,
+    AppointmentSeriesListCreateView, AppointmentSeriesDetailView, AppointmentSeriesCancelView,
+    WaitlistListCreateView, WaitlistDetailView, DoctorScheduleListView, DoctorAvailabilityView, DashboardStatsView
+)
 
 urlpatterns = [
     path('appointments/', AppointmentListCreateView.as_view(), name='appointment-list-create'),
     path('appointments/<int:pk>/', AppointmentDetailView.as_view(), name='appointment-detail'),
+    path('appointments/calendar.ics', AppointmentCalendarView.as_view(), name='appointment-calendar'),
+    path('appointments/calendar-feed/', CalendarFeedView.as_view(), name='appointment-calendar-feed'),
+    path('appointments/calendar/<str:key>.ics', SubscribedCalendarView.as_view(), name='appointment-calendar-subscription'),
+    path('appointments/bulk-status/', AppointmentBulkStatusView.as_view(), name='appointment-bulk-status'),
+    path('series/', AppointmentSeriesListCreateView.as_view(), name='appointment-series-list-create'),
+    path('series/<int:pk>/', AppointmentSeriesDetailView.as_view(), name='appointment-series-detail'),
+    path('series/<int:pk>/cancel/', AppointmentSeriesCancelView.as_view(), name='appointment-series-cancel'),
+    path('waitlist/', WaitlistListCreateView.as_view(), name='waitlist-list-create'),
+    path('waitlist/<int:pk>/', WaitlistDetailView.as_view(), name='waitlist-detail'),
     path('schedules/', DoctorScheduleListView.as_view(), name='schedule-list'),
+    path('doctors/<int:doctor_id>/availability/', DoctorAvailabilityView.as_view(), name='doctor-availability'),
+    path('stats/', DashboardStatsView.as_view(), name='dashboard-stats'),
 ]
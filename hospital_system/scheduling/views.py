@@ -1,8 +1,28 @@
-from django.shortcuts import render
-from rest_framework import generics, permissions
-from .models import Appointment, DoctorSchedule
-from .serializers import AppointmentSerializer, DoctorScheduleSerializer
+from django.http import StreamingHttpResponse
+from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import Appointment, AppointmentSeries, CalendarFeed, DoctorSchedule, WaitlistEntry
+from .serializers import (
+    AppointmentSerializer, AppointmentSeriesSerializer, DoctorScheduleSerializer, AvailabilityQuerySerializer,
+    AvailableSlotSerializer, DashboardStatsQuerySerializer, BulkStatusSerializer, WaitlistEntrySerializer
+)
+from .availability import find_available_slots
+from .stats import cached_dashboard_statistics, day_bounds
+from .transitions import bulk_transition
+from .authentication import CalendarFeedAuthentication
+from .ical import ICalendarRenderer, stream_calendar
+from .booking import save_without_overlap, cancel_series
+from .waitlist import schedule_backfill
 from patients.models import Patient
+from users.models import CustomUser
+from patients.permissions import IsDoctorOrAdmin
+from hospital_system.conditional import fingerprint, not_modified_response, set_validators
+from hospital_system.ownership import scope_by_role
+from hospital_system.pagination import KeysetPagination
 from .permissions import IsOwnerOrDoctorOrAdmin
 import django_filters
 
@@ -14,44 +34,253 @@ class AppointmentFilter(django_filters.FilterSet):
         fields = {
             'status': ['exact'],
             'doctor': ['exact'],
+            'series': ['exact'],
             'patient__user__username': ['icontains'],
         }
 
-class AppointmentListCreateView(generics.ListCreateAPIView):
+class AppointmentPagination(KeysetPagination):
+    ordering = ('start_time', 'id')
+
+class RoleScopedAppointmentsMixin:
+    """
+    Patients see their own appointments, doctors the ones they give, admins all.
+    """
+    def get_queryset(self):
+        # The serializer shows both names, so load both users in the same query
+        appointments = Appointment.objects.select_related('doctor', 'patient__user')
+        return scope_by_role(appointments, self.request.user, doctor_field='doctor')
+
+class AppointmentListCreateView(RoleScopedAppointmentsMixin, generics.ListCreateAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
     filterset_class = AppointmentFilter
+    pagination_class = AppointmentPagination
 
-    def get_queryset(self):
-        user = self.request.user
-
-        if user.role == 'PATIENT':
-            return Appointment.objects.filter(patient__user=user)
-        elif user.role == 'DOCTOR':
-            return Appointment.objects.filter(doctor=user)
-        elif user.role == 'ADMIN':
-            # Admin can see all appointments
-            return Appointment.objects.all()
-
-        return Appointment.objects.none()
-    
     def perform_create(self, serializer):
+        if self.request.user.role != 'PATIENT':
+            raise PermissionDenied("Only patients can create appointments.")
         try:
-            patient_profile = Patient.objects.get(user=self.request.user)
-            if self.request.user.role != 'PATIENT':
-                raise ValueError("Only patients can create appointments.")
-            serializer.save(patient=patient_profile)
+            patient_profile = Patient.objects.select_related('user').get(user=self.request.user)
         except Patient.DoesNotExist:
-            raise ValueError("Patient profile does not exist for the current user.")
-        
+            raise PermissionDenied("Patient profile does not exist for the current user.")
+        # Conflicting bookings come back as 409 instead of being saved
+        save_without_overlap(serializer, patient=patient_profile)
+
 
-class AppointmentDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Appointment.objects.all()
+class AppointmentDetailView(RoleScopedAppointmentsMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrDoctorOrAdmin]
 
+    def perform_update(self, serializer):
+        was_cancelled = serializer.instance.status == Appointment.AppointmentStatus.CANCELLED
+        appointment = save_without_overlap(serializer)
+        if appointment.status == Appointment.AppointmentStatus.CANCELLED and not was_cancelled:
+            # The freed slot is offered to the waitlist by the worker, not this request
+            schedule_backfill([appointment.pk])
+
+
+class AppointmentCalendarView(RoleScopedAppointmentsMixin, generics.GenericAPIView):
+    """
+    iCalendar feed of the appointments the user can see, narrowed with the same
+    filters as the list endpoint (e.g. ?doctor=, ?status=). Streamed in chunks;
+    an unchanged feed is answered with 304 from one aggregate query.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    filterset_class = AppointmentFilter
+    renderer_classes = [ICalendarRenderer]
+
+    def get(self, request, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        # Renaming a doctor or patient bumps the updated_at of their appointments; the
+        # calendar's own name is the viewer's, so it goes into the ETag as is
+        name = f"Appointments of {request.user.get_full_name() or request.user.username}"
+        etag, last_modified = fingerprint(queryset, salt=f'{request.user.pk}|{name}|{request.GET.urlencode()}')
+        not_modified = not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = StreamingHttpResponse(
+            stream_calendar(queryset, name, request.get_host()),
+            content_type='text/calendar; charset=utf-8'
+        )
+        response['Content-Disposition'] = 'inline; filename="appointments.ics"'
+        return set_validators(response, etag, last_modified)
+
+
+class SubscribedCalendarView(AppointmentCalendarView):
+    """
+    The same feed at the user's secret subscription URL, for calendar apps.
+    """
+    authentication_classes = [CalendarFeedAuthentication]
+
+
+class CalendarFeedView(APIView):
+    """
+    The user's calendar subscription URL, created on first request. POST
+    replaces it with a new one and DELETE revokes it; either way the old URL stops working.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        feed, _ = CalendarFeed.objects.get_or_create(user=request.user, defaults={'key': CalendarFeed.generate_key()})
+        return Response(self.describe(feed))
+
+    def post(self, request):
+        feed, _ = CalendarFeed.objects.update_or_create(user=request.user, defaults={'key': CalendarFeed.generate_key()})
+        return Response(self.describe(feed), status=status.HTTP_201_CREATED)
+
+    def delete(self, request):
+        CalendarFeed.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def describe(self, feed):
+        return {'url': self.request.build_absolute_uri(reverse('appointment-calendar-subscription', args=[feed.key]))}
+
+
+class AppointmentBulkStatusView(APIView):
+    """
+    Mark many appointments COMPLETED or CANCELLED in one request. Permissions are
+    applied to the whole set through the queryset and the change is one UPDATE.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        bounds = day_bounds(data['date'], data['date']) if 'date' in data else None
+        results = bulk_transition(
+            request.user, data['status'], ids=data.get('ids'), doctor_id=data.get('doctor'), day_bounds=bounds
+        )
+        if data['status'] == Appointment.AppointmentStatus.CANCELLED:
+            schedule_backfill(result['id'] for result in results if result['result'] == 'updated')
+        return Response({
+            'status': data['status'],
+            'updated': sum(1 for result in results if result['result'] == 'updated'),
+            'results': results,
+        })
+
+
+class AppointmentSeriesListCreateView(generics.ListCreateAPIView):
+    serializer_class = AppointmentSeriesSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        series = AppointmentSeries.objects.select_related('doctor', 'patient__user').order_by('-created_at')
+        return scope_by_role(series, self.request.user, doctor_field='doctor')
+
+    def perform_create(self, serializer):
+        if self.request.user.role != 'PATIENT':
+            raise PermissionDenied("Only patients can create appointments.")
+        try:
+            patient_profile = Patient.objects.select_related('user').get(user=self.request.user)
+        except Patient.DoesNotExist:
+            raise PermissionDenied("Patient profile does not exist for the current user.")
+        # All occurrences are checked for conflicts at once and inserted with one bulk_create
+        serializer.save(patient=patient_profile)
+
+
+class AppointmentSeriesDetailView(generics.RetrieveUpdateAPIView):
+    """
+    Changing start_time, duration or notes rewrites every upcoming occurrence in one UPDATE.
+    """
+    serializer_class = AppointmentSeriesSerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrDoctorOrAdmin]
+
+    def get_queryset(self):
+        series = AppointmentSeries.objects.select_related('doctor', 'patient__user')
+        return scope_by_role(series, self.request.user, doctor_field='doctor')
+
+
+class AppointmentSeriesCancelView(generics.GenericAPIView):
+    """
+    Cancel all upcoming occurrences of a series in one UPDATE.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrDoctorOrAdmin]
+
+    def get_queryset(self):
+        # Nothing is serialized and the permission only reads ids, so no joins
+        return scope_by_role(AppointmentSeries.objects.all(), self.request.user, doctor_field='doctor')
+
+    def post(self, request, *args, **kwargs):
+        series = self.get_object()
+        cancelled_ids = cancel_series(series)
+        schedule_backfill(cancelled_ids)
+        return Response({'cancelled': len(cancelled_ids)})
+
+
+class WaitlistListCreateView(generics.ListCreateAPIView):
+    """
+    Patients join the waitlist of a doctor for a time window; when a matching
+    appointment is cancelled the slot is booked for the longest-waiting entry.
+    """
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        entries = WaitlistEntry.objects.select_related('doctor', 'patient__user').order_by('-created_at')
+        return scope_by_role(entries, self.request.user, doctor_field='doctor')
+
+    def perform_create(self, serializer):
+        if self.request.user.role != 'PATIENT':
+            raise PermissionDenied("Only patients can join the waitlist.")
+        try:
+            patient_profile = Patient.objects.select_related('user').get(user=self.request.user)
+        except Patient.DoesNotExist:
+            raise PermissionDenied("Patient profile does not exist for the current user.")
+        serializer.save(patient=patient_profile)
+
+
+class WaitlistDetailView(generics.RetrieveDestroyAPIView):
+    serializer_class = WaitlistEntrySerializer
+    permission_classes = [permissions.IsAuthenticated, IsOwnerOrDoctorOrAdmin]
+
+    def get_queryset(self):
+        entries = WaitlistEntry.objects.select_related('doctor', 'patient__user')
+        return scope_by_role(entries, self.request.user, doctor_field='doctor')
+
 
 class DoctorScheduleListView(generics.ListAPIView):
     queryset = DoctorSchedule.objects.all()
     serializer_class = DoctorScheduleSerializer
-    permission_classes = [permissions.IsAuthenticated]
\ No newline at end of file
+    permission_classes = [permissions.IsAuthenticated]
+
+
+class DoctorAvailabilityView(APIView):
+    """
+    Free bookable slots of a doctor: the DoctorSchedule windows minus the
+    doctor's non-cancelled appointments, cut into slots of `duration` minutes.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, doctor_id):
+        doctor = get_object_or_404(CustomUser, pk=doctor_id, role=CustomUser.Role.DOCTOR)
+
+        query = AvailabilityQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        slots = find_available_slots(doctor, params['range_start'], params['range_end'], params['duration'])
+        return Response({
+            'doctor': doctor.id,
+            'duration': int(params['duration'].total_seconds() // 60),
+            'slots': AvailableSlotSerializer(
+                [{'start_time': start, 'end_time': end} for start, end in slots], many=True
+            ).data,
+        })
+
+
+class DashboardStatsView(APIView):
+    """
+    Everything the dashboard shows in one cheap request: appointment counts per
+    day and per doctor by status, plus patient, user and appointment totals.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsDoctorOrAdmin]
+
+    def get(self, request):
+        query = DashboardStatsQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+        return Response(cached_dashboard_statistics(request.user, params['first_day'], params['last_day']))
\ No newline at end of file
@@ -0,0 +1,93 @@
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import DurationField, Func, Value
+from django.utils import timezone
+from .booking import lock_doctor, conflicting_appointments
+from .models import Appointment, WaitlistEntry
+
+logger = logging.getLogger('hospital_system')
+
+
+# Waiting entries tried for one freed slot before it is left free
+MAX_CANDIDATES = 20
+
+
+class Minutes(Func):
+    """
+    An integer column of minutes as a duration. Django can't multiply a duration
+    on SQLite, where durations are stored as microseconds, so that is done by hand.
+    """
+    template = "(%(expressions)s * INTERVAL '1 minute')"
+    output_field = DurationField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(%(expressions)s * 60000000)', **extra_context)
+
+
+def waiting_candidates(doctor_id, start, end):
+    """
+    Waiting entries short enough for [start, end) whose window starts by start
+    and lasts their own duration from there, oldest first. The bounded window
+    lets the (doctor, status, earliest) index answer this with a short range
+    scan instead of reading the whole waitlist.
+    """
+    minutes = int((end - start).total_seconds() // 60)
+    return (
+        WaitlistEntry.objects
+        .filter(
+            doctor_id=doctor_id,
+            status=WaitlistEntry.Status.WAITING,
+            earliest__gte=start - WaitlistEntry.MAX_WINDOW,
+            earliest__lte=start,
+            duration__lte=minutes,
+            latest__gte=Value(start) + Minutes('duration'),
+        )
+        .order_by('created_at', 'id')
+    )
+
+
+def backfill_slot(appointment):
+    """
+    Offer a cancelled appointment's slot to the longest-waiting matching patient.
+    Returns the new appointment, or None if the slot stays free.
+    """
+    if appointment.status != Appointment.AppointmentStatus.CANCELLED or appointment.start_time <= timezone.now():
+        return None
+
+    with transaction.atomic():
+        lock_doctor(appointment.doctor_id)
+        candidates = waiting_candidates(appointment.doctor_id, appointment.start_time, appointment.end_time)
+        # The patient who cancelled does not want this slot back
+        candidates = candidates.exclude(patient_id=appointment.patient_id)
+
+        for entry in candidates.select_for_update()[:MAX_CANDIDATES]:
+            end_time = appointment.start_time + timedelta(minutes=entry.duration)
+            if conflicting_appointments(appointment.doctor_id, appointment.start_time, end_time).exists():
+                # Someone rebooked part of the slot directly in the meantime; a shorter entry may still fit
+                continue
+            booked = Appointment.objects.create(
+                patient_id=entry.patient_id,
+                doctor_id=appointment.doctor_id,
+                start_time=appointment.start_time,
+                end_time=end_time,
+                notes="Booked from the waitlist",
+            )
+            entry.status = WaitlistEntry.Status.BOOKED
+            entry.appointment = booked
+            entry.save(update_fields=['status', 'appointment'])
+            logger.info("Waitlist entry %s booked into appointment %s", entry.pk, booked.pk)
+            return booked
+    return None
+
+
+def schedule_backfill(appointment_ids):
+    """
+    Queue waitlist matching for cancelled appointments once the current
+    transaction commits, so the request that cancelled them isn't slowed down.
+    """
+    from .tasks import backfill_cancelled_slots
+
+    appointment_ids = list(appointment_ids)
+    if appointment_ids:
+        transaction.on_commit(lambda: backfill_cancelled_slots.delay(appointment_ids))
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import AuthToken, CustomUser
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -9,4 +9,11 @@ class CustomUserAdmin(UserAdmin):
         ('Role', {'fields': ('role',)}),
     )
 
-admin.site.register(CustomUser, CustomUserAdmin)
\ No newline at end of file
+admin.site.register(CustomUser, CustomUserAdmin)
+
+
+class AuthTokenAdmin(admin.ModelAdmin):
+    list_display = ('user', 'created', 'expires_at')
+    raw_id_fields = ('user',)
+
+admin.site.register(AuthToken, AuthTokenAdmin)
@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'users'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # rest_framework.authtoken stays installed for the migration that copied its tokens
+        # into AuthToken, but its Token rows no longer log anyone in, so they can't be made
+        # in the admin either. The admin has registered every app's models by now.
+        from django.contrib import admin
+        from rest_framework.authtoken.models import TokenProxy
+        if admin.site.is_registered(TokenProxy):
+            admin.site.unregister(TokenProxy)
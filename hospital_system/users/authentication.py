@@ -0,0 +1,159 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from .models import AuthToken, CustomUser
+
+# What authentication vouches for; any other user field loads on first access
+Claims = namedtuple('Claims', ['user_id', 'role', 'is_staff', 'expires_at', 'created'])
+
+
+class LocalTokenCache:
+    """
+    Bounded LRU of token -> claims for this process. Entries also expire after
+    `ttl` seconds, which bounds how long another process's invalidation takes to
+    reach this one.
+    """
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            claims, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return claims
+
+    def set(self, key, claims):
+        with self.lock:
+            self.entries[key] = (claims, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Read at import, so a settings module without them must not break startup
+local_tokens = LocalTokenCache(getattr(settings, 'TOKEN_CACHE_SIZE', 10000), getattr(settings, 'TOKEN_CACHE_LOCAL_TTL', 10))
+
+
+def shared_key(key):
+    # Tokens are credentials, so the shared cache only ever sees their digest
+    return f'auth-token:{hashlib.sha256(key.encode()).hexdigest()}'
+
+
+def forget_token(key):
+    local_tokens.discard(key)
+    cache.delete(shared_key(key))
+
+
+def forget_user_tokens(user_id):
+    for key in AuthToken.objects.filter(user_id=user_id).values_list('key', flat=True):
+        forget_token(key)
+
+
+def remember_claims(key, claims):
+    # Never cache a token past its expiry
+    timeout = min(getattr(settings, 'TOKEN_CACHE_TTL', 300), int((claims.expires_at - timezone.now()).total_seconds()))
+    if timeout > 0:
+        cache.set(shared_key(key), claims, timeout)
+        local_tokens.set(key, claims)
+
+
+def load_claims(key):
+    """
+    Claims of a token from the in-process LRU, else the shared cache, else one
+    token/user query. Only active users' tokens are cached.
+    """
+    claims = local_tokens.get(key)
+    if claims is not None:
+        return claims
+    claims = cache.get(shared_key(key))
+    if claims is not None:
+        local_tokens.set(key, claims)
+        return claims
+    row = (
+        AuthToken.objects.filter(key=key)
+        .values_list('user_id', 'user__role', 'user__is_staff', 'expires_at', 'created', 'user__is_active')
+        .first()
+    )
+    if row is None:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+    if not row[5]:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    claims = Claims(*row[:5])
+    remember_claims(key, claims)
+    return claims
+
+
+def renew(key, claims, now):
+    """
+    Slide the expiry of a token in use forward. Written at most once per
+    TOKEN_RENEW_INTERVAL, so most requests only compare timestamps.
+    """
+    expires_at = AuthToken.expiry(claims.created, now)
+    if expires_at - claims.expires_at < timedelta(seconds=settings.TOKEN_RENEW_INTERVAL):
+        return claims
+    AuthToken.objects.filter(key=key, expires_at__lt=expires_at).update(expires_at=expires_at)
+    claims = claims._replace(expires_at=expires_at)
+    remember_claims(key, claims)
+    return claims
+
+
+def from_claims(model, values):
+    # A model instance with only these fields loaded; the rest are deferred and
+    # load on access, and save() only writes the loaded ones
+    loaded = dict(values)
+    field_names = [f.attname for f in model._meta.concrete_fields if f.attname in loaded]
+    return model.from_db(model.objects.db, field_names, [loaded[name] for name in field_names])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication without the token/user query on every request: the user
+    id, role and is_staff behind a token, and its expiry, come from the caches
+    above. Tokens are forgotten when deleted (e.g. on logout) and when their user's
+    role, staff or active flag changes (see users.signals).
+    """
+    model = AuthToken
+
+    def authenticate_credentials(self, key):
+        claims = load_claims(key)
+        now = timezone.now()
+        if claims.expires_at <= now:
+            # Another process may have renewed it since this one cached it
+            forget_token(key)
+            claims = load_claims(key)
+            if claims.expires_at <= now:
+                raise exceptions.AuthenticationFailed(_('Token has expired.'))
+        claims = renew(key, claims, now)
+
+        user = from_claims(CustomUser, [
+            ('id', claims.user_id), ('role', claims.role), ('is_staff', claims.is_staff), ('is_active', True)
+        ])
+        token = from_claims(AuthToken, [
+            ('key', key), ('user_id', claims.user_id), ('created', claims.created), ('expires_at', claims.expires_at)
+        ])
+        return user, token
@@ -1,25 +1,52 @@
+import time
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from rest_framework.authtoken.models import Token
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from users.models import AuthToken, CustomUser
 
 
 class Command(BaseCommand):
-    help = 'Create tokens for all users in the system'
+    help = 'Create a token for every user that has no live one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--role', choices=CustomUser.Role.values, help='Only users with this role')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the users that would get a token')
 
     def handle(self, *args, **options):
         User = get_user_model()
-        users = User.objects.all()
-        
+        now = timezone.now()
+        # One anti-join finds the users without a token that is still valid
+        users = User.objects.filter(~Exists(AuthToken.objects.filter(user=OuterRef('pk'), expires_at__gt=now)))
+        if options['role']:
+            users = users.filter(role=options['role'])
+
+        total = users.count()
+        if options['dry_run']:
+            self.stdout.write(f'{total} users would get a new token')
+            return
+
+        batch_size = options['batch_size']
+        expires_at = AuthToken.expiry(now, now)
+        started = time.perf_counter()
         created_count = 0
-        for user in users:
-            token, created = Token.objects.get_or_create(user=user)
-            if created:
-                created_count += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'Created token for user: {user.username}')
-                )
-            else:
-                self.stdout.write(f'Token for user {user.username} already exists')
+        last_pk = 0
+        while True:
+            # Walk the users by primary key so every batch is a short indexed range
+            ids = list(users.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                AuthToken.objects.bulk_create([
+                    AuthToken(key=AuthToken.generate_key(), user_id=pk, created=now, expires_at=expires_at)
+                    for pk in ids
+                ])
+            created_count += len(ids)
+            last_pk = ids[-1]
+            rate = created_count / max(time.perf_counter() - started, 1e-6)
+            self.stdout.write(f'{created_count}/{total} tokens created, {rate:.0f} tokens/s')
 
         self.stdout.write(
             self.style.SUCCESS(f'Total new tokens created: {created_count}')
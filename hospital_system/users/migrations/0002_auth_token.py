@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-18 20:23
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from datetime import timedelta
+from django.db import migrations, models
+
+
+def copy_existing_tokens(apps, schema_editor):
+    # Tokens issued before expiry existed start their lifetime now rather than dying at once
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('users', 'AuthToken')
+    now = django.utils.timezone.now()
+    expires_at = now + timedelta(seconds=settings.TOKEN_TTL)
+    batch = []
+    for key, user_id in Token.objects.values_list('key', 'user_id').iterator(chunk_size=2000):
+        batch.append(AuthToken(key=key, user_id=user_id, created=now, expires_at=expires_at))
+        if len(batch) == 2000:
+            AuthToken.objects.bulk_create(batch)
+            batch = []
+    AuthToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+        ('authtoken', '0004_alter_tokenproxy_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('key', models.CharField(max_length=40, primary_key=True, serialize=False)),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='token_expires_idx')],
+            },
+        ),
+        migrations.RunPython(copy_existing_tokens, migrations.RunPython.noop),
+    ]
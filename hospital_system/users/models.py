@@ -1,4 +1,8 @@
+import secrets
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 class CustomUser(AbstractUser):
@@ -11,4 +15,52 @@ class CustomUser(AbstractUser):
         max_length=50, 
         choices=Role.choices,
         default=Role.PATIENT,
-    )
\ No newline at end of file
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What was read, so a later save can tell what changed without reading it again
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # post_save receivers compared with the values before this save; later saves compare with these
+        if hasattr(self, '_loaded_values'):
+            update_fields = kwargs.get('update_fields')
+            saved = self._loaded_values.keys() if update_fields is None else set(self._loaded_values) & set(update_fields)
+            self._loaded_values.update({field: getattr(self, field) for field in saved})
+
+class AuthToken(models.Model):
+    """
+    API token. It expires TOKEN_TTL after it was last used, since use keeps
+    renewing it, and TOKEN_MAX_AGE after it was issued at the latest; clients
+    rotate it for a new one before that.
+    """
+    key = models.CharField(max_length=40, primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='auth_tokens')
+    created = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The sweeper deletes expired tokens oldest first
+            models.Index(fields=['expires_at'], name='token_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"Token of {self.user_id} until {self.expires_at:%Y-%m-%d %H:%M}"
+
+    @staticmethod
+    def generate_key():
+        return secrets.token_hex(20)
+
+    @staticmethod
+    def expiry(created, now):
+        return min(now + timedelta(seconds=settings.TOKEN_TTL), created + timedelta(seconds=settings.TOKEN_MAX_AGE))
+
+    @classmethod
+    def issue(cls, user):
+        now = timezone.now()
+        return cls.objects.create(key=cls.generate_key(), user=user, created=now, expires_at=cls.expiry(now, now))
@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .authentication import forget_token, forget_user_tokens
+from .models import AuthToken
+
+# Fields whose change must reach cached token claims at once
+CLAIM_AFFECTING_FIELDS = {'role', 'is_staff', 'is_active'}
+
+
+@receiver(post_delete, sender=AuthToken)
+def forget_deleted_token(sender, instance, **kwargs):
+    # Also covers logout and tokens deleted with their user
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def forget_tokens_of_changed_user(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not CLAIM_AFFECTING_FIELDS & set(update_fields)):
+        return
+    loaded = getattr(instance, '_loaded_values', {})
+    if all(field in loaded and loaded[field] == getattr(instance, field) for field in CLAIM_AFFECTING_FIELDS):
+        # Read from the database and none of them changed
+        return
+    forget_user_tokens(instance.pk)
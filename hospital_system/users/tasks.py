@@ -0,0 +1,23 @@
+from celery import shared_task
+from django.utils import timezone
+from .models import AuthToken
+
+
+@shared_task
+def sweep_expired_tokens(batch_size=1000, max_batches=100):
+    """
+    Delete expired tokens in batches of batch_size, each its own short DELETE,
+    so the sweep never holds long locks however many tokens expired. What is
+    left over after max_batches waits for the next run.
+    """
+    now = timezone.now()
+    deleted = 0
+    for _ in range(max_batches):
+        keys = list(
+            AuthToken.objects.filter(expires_at__lte=now).order_by('expires_at').values_list('key', flat=True)[:batch_size]
+        )
+        if not keys:
+            break
+        AuthToken.objects.filter(key__in=keys).delete()
+        deleted += len(keys)
+    return deleted
@@ -1,8 +1,20 @@
-from django.test import TestCase
+from django.contrib import admin
+from django.core.cache import cache
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.authtoken.models import TokenProxy
 from django.urls import reverse
-from .models import CustomUser
+from .models import AuthToken, CustomUser
 from rest_framework.test import APITestCase
+from .authentication import CachedTokenAuthentication, local_tokens
+from .tasks import sweep_expired_tokens
+from .throttling import LocalBuckets, RoleRateThrottle, local_buckets
 
 
 class DoctorListAPITest(APITestCase):
@@ -31,4 +43,215 @@ class DoctorListAPITest(APITestCase):
     def test_patient_cannot_access_doctor_list(self):
         self.client.force_authenticate(user=self.patient)
         response = self.client.get(self.url)
-        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+class CachedTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = CustomUser.objects.create_user(
+            username='testpatient', password='password123', first_name='Jane', role='PATIENT'
+        )
+        self.token = AuthToken.issue(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_known_tokens_authenticate_without_queries(self):
+        auth = CachedTokenAuthentication()
+        with self.assertNumQueries(1):
+            auth.authenticate_credentials(self.token.key)
+        with self.assertNumQueries(0):
+            user, token = auth.authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, user.role, user.is_staff), (self.user.pk, 'PATIENT', False))
+        self.assertEqual(token.key, self.token.key)
+        # Other fields still load on demand
+        self.assertEqual(user.first_name, 'Jane')
+
+        # A process with an empty LRU falls back to the shared cache
+        local_tokens.clear()
+        with self.assertNumQueries(0):
+            auth.authenticate_credentials(self.token.key)
+
+    def test_logout_forgets_the_token(self):
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('api_logout')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_tokens_and_changed_roles_are_forgotten(self):
+        self.assertEqual(self.client.get(reverse('user_profile')).data['role'], 'PATIENT')
+        self.user.role = 'DOCTOR'
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('doctor-list')).status_code, status.HTTP_200_OK)
+
+        self.user.is_active = False
+        self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.user.is_active = True
+        self.user.save(update_fields=['is_active'])
+
+        AuthToken.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_profile_updates_keep_unloaded_fields(self):
+        response = self.client.patch(reverse('user-profile'), {'last_name': 'Roe'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.first_name, self.user.last_name), ('Jane', 'Roe'))
+        self.assertTrue(self.user.check_password('password123'))
+
+
+class ExpiringTokenTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        local_tokens.clear()
+        self.user = CustomUser.objects.create_user(username='testpatient', password='password123', role='PATIENT')
+
+    def login(self):
+        response = self.client.post(reverse('api_token_auth'), {'username': 'testpatient', 'password': 'password123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data['token']
+
+    def get_profile(self, key):
+        return self.client.get(reverse('user_profile'), HTTP_AUTHORIZATION=f'Token {key}')
+
+    def test_expired_tokens_are_refused(self):
+        key = self.login()
+        self.assertEqual(self.get_profile(key).status_code, status.HTTP_200_OK)
+        # Expiry is checked against the cached claims, not just the database
+        AuthToken.objects.filter(key=key).update(expires_at=timezone.now() - timedelta(seconds=1))
+        local_tokens.clear()
+        cache.clear()
+        self.assertEqual(self.get_profile(key).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_use_slides_the_expiry_up_to_the_maximum_age(self):
+        key = self.login()
+        stale = timezone.now() + timedelta(minutes=5)
+        AuthToken.objects.filter(key=key).update(expires_at=stale)
+        cache.clear()
+        local_tokens.clear()
+        self.assertEqual(self.get_profile(key).status_code, status.HTTP_200_OK)
+        self.assertGreater(AuthToken.objects.get(key=key).expires_at, stale + timedelta(hours=1))
+
+        with self.settings(TOKEN_MAX_AGE=600):
+            token = AuthToken.objects.get(key=self.login())
+            self.assertEqual(token.expires_at, token.created + timedelta(seconds=600))
+
+    def test_rotation_replaces_the_token(self):
+        key = self.login()
+        response = self.client.post(reverse('api_token_rotate'), HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data['token'], key)
+        self.assertEqual(self.get_profile(key).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.get_profile(response.data['token']).status_code, status.HTTP_200_OK)
+
+    def test_sweeper_deletes_expired_tokens_in_batches(self):
+        live = AuthToken.issue(self.user)
+        AuthToken.objects.bulk_create([
+            AuthToken(key=AuthToken.generate_key(), user=self.user, expires_at=timezone.now() - timedelta(days=1))
+            for _ in range(5)
+        ])
+        self.assertEqual(sweep_expired_tokens(batch_size=2, max_batches=2), 4)
+        self.assertEqual(sweep_expired_tokens(batch_size=2), 1)
+        self.assertEqual(list(AuthToken.objects.values_list('key', flat=True)), [live.key])
+
+    def test_admin_offers_only_the_tokens_that_authenticate(self):
+        self.assertTrue(admin.site.is_registered(AuthToken))
+        self.assertFalse(admin.site.is_registered(TokenProxy))
+
+
+
+@override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+    'anon': '100/min', 'patient': '3/min', 'doctor': '5/min', 'admin': '5/min', 'login': '2/min', 'login_address': '3/min',
+}})
+class ThrottlingTest(APITestCase):
+    def setUp(self):
+        local_buckets.clear()
+        self.patient = CustomUser.objects.create_user(username='testpatient', password='password123', role='PATIENT')
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', password='password123', role='DOCTOR')
+
+    def get_profile(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.get(reverse('user-profile'))
+
+    def test_each_role_has_its_own_budget(self):
+        for _ in range(3):
+            self.assertEqual(self.get_profile(self.patient).status_code, status.HTTP_200_OK)
+        response = self.get_profile(self.patient)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        # One request back every 20 seconds
+        self.assertEqual(response['Retry-After'], '20')
+        for _ in range(5):
+            self.assertEqual(self.get_profile(self.doctor).status_code, status.HTTP_200_OK)
+
+    def login(self, username, password, address):
+        # As nginx forwards it: whatever the client claimed, then the address it came from
+        return self.client.post(
+            reverse('api_token_auth'), {'username': username, 'password': password},
+            HTTP_X_FORWARDED_FOR=f'10.9.9.9, {address}'
+        )
+
+    def test_login_buckets_per_username_and_per_address(self):
+        # One username guessed from one address
+        for _ in range(2):
+            self.assertEqual(self.login('testpatient', 'wrong', '10.0.0.1').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.login('testpatient', 'password123', '10.0.0.1').status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        # ... doesn't lock the owner out from their own address
+        self.assertEqual(self.login('testpatient', 'password123', '10.0.0.2').status_code, status.HTTP_200_OK)
+        # Many usernames from one address
+        for i in range(3):
+            self.assertEqual(self.login(f'user{i}', 'wrong', '10.0.0.4').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.login('user3', 'wrong', '10.0.0.4').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forged_forwarded_for_entries_share_one_address_bucket(self):
+        for i in range(3):
+            response = self.client.post(
+                reverse('api_token_auth'), {'username': f'user{i}', 'password': 'wrong'},
+                HTTP_X_FORWARDED_FOR=f'192.0.2.{i}, 10.0.0.5'
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.login('user3', 'wrong', '10.0.0.5').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_rates_faster_than_a_millisecond_are_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            RoleRateThrottle().parse_rate('2000/s')
+        self.assertEqual(RoleRateThrottle().parse_rate('1000/s'), (1000, 1))
+
+    def test_bucket_refills_over_time(self):
+        buckets = LocalBuckets()
+        # Two requests of burst, one more every second
+        self.assertEqual([buckets.take('key', 0, 1000, 2000) for _ in range(3)], [0, 0, 1000])
+        self.assertEqual(buckets.take('key', 1000, 1000, 2000), 0)
+        self.assertEqual(buckets.take('key', 1000, 1000, 2000), 1000)
+        self.assertEqual(buckets.take('key', 4000, 1000, 2000), 0)
+        self.assertEqual(buckets.take('key', 4000, 1000, 2000), 0)
+
+
+class CreateTokensCommandTest(TestCase):
+    def setUp(self):
+        self.patients = [
+            CustomUser.objects.create_user(username=f'patient{i}', password='password123', role='PATIENT')
+            for i in range(3)
+        ]
+        self.doctor = CustomUser.objects.create_user(username='testdoctor', password='password123', role='DOCTOR')
+        self.live = AuthToken.issue(self.patients[0])
+        AuthToken.objects.create(
+            key=AuthToken.generate_key(), user=self.patients[1], expires_at=timezone.now() - timedelta(days=1)
+        )
+
+    def run_command(self, **options):
+        out = StringIO()
+        call_command('create_tokens', stdout=out, **options)
+        return out.getvalue()
+
+    def test_only_users_without_a_live_token_get_one(self):
+        self.assertIn('3 users would get a new token', self.run_command(dry_run=True))
+        self.assertEqual(AuthToken.objects.count(), 2)
+
+        output = self.run_command(role='PATIENT', batch_size=1)
+        self.assertIn('2/2 tokens created', output)
+        self.assertFalse(AuthToken.objects.filter(user=self.doctor).exists())
+
+        self.run_command()
+        live = AuthToken.objects.filter(expires_at__gt=timezone.now())
+        self.assertEqual(sorted(live.values_list('user_id', flat=True)), sorted(u.pk for u in [*self.patients, self.doctor]))
+        self.assertTrue(live.filter(key=self.live.key).exists())
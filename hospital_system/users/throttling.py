@@ -0,0 +1,129 @@
+import threading
+import time
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import RedisError
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Token bucket kept as the time its bucket is full again ("theoretical arrival
+# time", GCRA): one number per client, read and written in a single step
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local full_at = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now) + tonumber(ARGV[2])
+local wait = full_at - now - tonumber(ARGV[3])
+if wait > 0 then
+    return wait
+end
+redis.call('SET', KEYS[1], full_at, 'PX', full_at - now)
+return 0
+"""
+
+
+class LocalBuckets:
+    """
+    The same buckets in this process, for the local memory cache: then every
+    worker has budgets of its own.
+    """
+    def __init__(self, size=100000):
+        self.size = size
+        self.full_at = {}
+        self.lock = threading.Lock()
+
+    def take(self, key, now, interval, capacity):
+        with self.lock:
+            full_at = max(self.full_at.get(key, now), now) + interval
+            wait = full_at - now - capacity
+            if wait > 0:
+                return wait
+            self.full_at[key] = full_at
+            if len(self.full_at) > self.size:
+                # Buckets already full again are the same as absent ones
+                self.full_at = {k: v for k, v in self.full_at.items() if v > now}
+            return 0
+
+    def clear(self):
+        with self.lock:
+            self.full_at.clear()
+
+
+local_buckets = LocalBuckets()
+_take_script = None
+
+
+def take(key, interval, capacity):
+    """
+    Take one token from the bucket at key, which holds `capacity` milliseconds
+    worth of tokens and gets one back every `interval` milliseconds. Returns 0 if
+    there was one, else the milliseconds until there is.
+    """
+    global _take_script
+    now = int(time.time() * 1000)
+    if isinstance(cache, RedisCache):
+        try:
+            if _take_script is None:
+                _take_script = cache._cache.get_client(write=True).register_script(TAKE_SCRIPT)
+            return _take_script(keys=[cache.make_and_validate_key(key)], args=[now, interval, capacity])
+        except RedisError:
+            # A lost Redis must not take the API down with it
+            pass
+    return local_buckets.take(key, now, interval, capacity)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket over DEFAULT_THROTTLE_RATES: '120/min' is a bucket of 120
+    requests refilled at 2 per second, so bursts up to the full rate are fine
+    and a client that keeps going is held to the average. Subclasses decide in
+    allow_request which buckets a request takes from, and set wait_ms.
+    """
+    def take_token(self, scope, ident):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return 0
+        num, interval = self.parse_rate(rate)
+        return take(f'throttle:{scope}:{ident}', interval, interval * num)
+
+    def parse_rate(self, rate):
+        """
+        (num, milliseconds between two tokens) of a 'num/period' rate. Anything
+        faster than one per millisecond would round to no limit at all, so it is refused.
+        """
+        num, period = rate.split('/')
+        num, duration = int(num), {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+        if num > duration * 1000:
+            raise ImproperlyConfigured(f"Throttle rate {rate!r} is above one request per millisecond.")
+        return num, duration * 1000 // num
+
+    def wait(self):
+        return self.wait_ms / 1000
+
+
+class RoleRateThrottle(TokenBucketThrottle):
+    """
+    A bucket per user with the budget of their role ('patient', 'doctor',
+    'admin' rates); anonymous requests share one per client address ('anon').
+    """
+    def allow_request(self, request, view):
+        if request.user and request.user.is_authenticated:
+            self.wait_ms = self.take_token(request.user.role.lower(), request.user.pk)
+        else:
+            self.wait_ms = self.take_token('anon', self.get_ident(request))
+        return self.wait_ms == 0
+
+
+class LoginRateThrottle(TokenBucketThrottle):
+    """
+    The stricter login buckets, checked before the password hash is computed:
+    one per client address ('login_address'), against trying many usernames
+    from one, and one per username and address ('login'), against guessing one
+    account. The username bucket is not shared between addresses, so failed
+    attempts from elsewhere can't lock its owner out. The address budget is
+    larger because the Streamlit frontend logs everyone in from the same address.
+    """
+    def allow_request(self, request, view):
+        address = self.get_ident(request)
+        username = str(request.data.get('username', '')).lower()
+        self.wait_ms = self.take_token('login_address', address) or self.take_token('login', f'{username}:{address}')
+        return self.wait_ms == 0
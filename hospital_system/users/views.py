@@ -13,4 +13,5 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get_object(self):
-        return self.request.user
\ No newline at end of file
+        # Token authentication only loads the user's id and role
+        return CustomUser.objects.get(pk=self.request.user.pk)
\ No newline at end of file
@@ -5,6 +5,10 @@
 
 -- Create extensions if needed
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+-- Needed by the appointment overlap exclusion constraint (doctor_id WITH =)
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+-- Trigram indexes behind the patient search
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 -- Grant necessary permissions
 GRANT ALL PRIVILEGES ON DATABASE hospital_db TO hospital_user;